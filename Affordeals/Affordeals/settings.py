@@ -93,6 +93,34 @@ DATABASES = {
     }
 }
 
+# Cache
+# The catalog version, cached pages, image manifests and user snapshots
+# are invalidated by whichever process changes the data, so every process
+# must share the cache; store.checks refuses per-process backends. Set
+# REDIS_URL in production. Without it the cache lives in files that every
+# process on this host shares, like the SQLite database above.
+
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': BASE_DIR / '.cache',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+
+# Cache alias holding the user snapshots of main.authentication.
+AUTH_USER_CACHE = 'default'
+
+TEST_RUNNER = 'Affordeals.test_runner.TestRunner'
+
 
 
 # Password validation
@@ -141,7 +169,7 @@ AUTH_USER_MODEL = 'main.User'
 REST_FRAMEWORK = {
     'COERCE_DECIMAL_STRING': False,
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'main.authentication.CachedJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated'
@@ -178,4 +206,11 @@ EMAIL_HOST = 'smtp.gmail.com'
 EMAIL_PORT = 587
 EMAIL_USE_TLS = True
 EMAIL_HOST_USER = os.environ.get('EMAIL_USER')
-EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_PASS')
\ No newline at end of file
+EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_PASS')
+
+# Payment provider credentials, see store.payments and store.webhooks.
+INTASEND_API_TOKEN = os.environ.get('INTASEND_API_TOKEN')
+INTASEND_PUBLISHABLE_KEY = os.environ.get('INTASEND_PUBLISHABLE_KEY')
+INTASEND_WEBHOOK_CHALLENGE = os.environ.get('INTASEND_WEBHOOK_CHALLENGE')
+STRIPE_SECRET_KEY = os.environ.get('STRIPE_SECRET_KEY')
+STRIPE_WEBHOOK_SECRET = os.environ.get('STRIPE_WEBHOOK_SECRET')
@@ -33,6 +33,7 @@ urlpatterns = [
     path('products/', user_views.product_view, name='product'),
     path('', user_views.home, name='home'),
     path('purchase/', store_views.purchase, name='purchase'),
+    path('purchase/<int:job_id>/status/', store_views.payment_status, name='payment-status'),
 
     path('checkout/<int:product_id>/', store_views.checkout, name='checkout'),
     path('store/', include('store.urls')),
@@ -0,0 +1,115 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .models import User
+
+
+# Seconds a user snapshot is served from the cache. Saves and deletes
+# invalidate it at once; the timeout bounds staleness for changes made
+# with queryset.update(), which sends no signal.
+DEFAULT_TIMEOUT = 60
+
+CACHE_KEY = 'auth:user:{}'
+
+# The user fields kept in a snapshot: the id and the flags the
+# authentication and permission checks read.
+SNAPSHOT_FIELDS = ('id', 'is_active', 'is_staff', 'is_superuser')
+
+# Backends private to one process: a save handled by one worker could not
+# evict the snapshot cached by the others, so they are never used here.
+LOCAL_BACKENDS = (LocMemCache, DummyCache)
+
+
+def user_cache():
+    """
+    Returns:
+    - BaseCache: The AUTH_USER_CACHE alias, or None when it is unset or
+      names a per-process backend, which turns the user cache off.
+    """
+    alias = getattr(settings, 'AUTH_USER_CACHE', None)
+    if alias is None:
+        return None
+    backend = caches[alias]
+    return None if isinstance(backend, LOCAL_BACKENDS) else backend
+
+
+def invalidate_users(user_ids):
+    """
+    Drop cached user snapshots, now and again once the current
+    transaction commits, so a request reading the old row in between
+    cannot cache it for the whole timeout.
+
+    Args:
+    - user_ids (list): The changed users' SIMPLE_JWT USER_ID_FIELD values.
+    """
+    keys = [CACHE_KEY.format(user_id) for user_id in user_ids]
+    if not keys or user_cache() is None:
+        return
+    user_cache().delete_many(keys)
+    transaction.on_commit(lambda: user_cache().delete_many(keys))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that checks the token against a cached snapshot of
+    the user, keyed by user id, instead of querying main.User on every
+    API request. The snapshot holds the SNAPSHOT_FIELDS the permission
+    checks read and the hash of the password that simplejwt compares to
+    the token's revoke claim, never the password hash itself; the other
+    user fields are loaded from the database on first access.
+
+    The snapshot is refreshed after AUTH_USER_CACHE_TIMEOUT seconds and
+    dropped by the User save and delete signals, so deactivating a user
+    or changing their password takes effect on the next request. That
+    only holds when every process shares the cache, so AUTH_USER_CACHE
+    must name a shared backend (Redis, Memcached, database or file); if
+    it is unset or per-process this behaves exactly like
+    JWTAuthentication.
+    """
+    def get_user(self, validated_token):
+        if user_cache() is None:
+            return super().get_user(validated_token)
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        snapshot = self.snapshot(user_id)
+        if snapshot is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not snapshot['is_active']:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != snapshot['revoke']:
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        return User.from_db(snapshot['db'], list(SNAPSHOT_FIELDS), [snapshot[name] for name in SNAPSHOT_FIELDS])
+
+    def snapshot(self, user_id):
+        """
+        Returns:
+        - dict: The cached db, SNAPSHOT_FIELDS and revoke values, loaded
+          and cached on a miss; None if the user does not exist.
+        """
+        key = CACHE_KEY.format(user_id)
+        snapshot = user_cache().get(key)
+        if snapshot is not None:
+            return snapshot
+        user = (User.objects.filter(**{api_settings.USER_ID_FIELD: user_id})
+                .values(*SNAPSHOT_FIELDS, 'password').first())
+        if user is None:
+            return None
+        snapshot = {name: user[name] for name in SNAPSHOT_FIELDS}
+        snapshot.update(db=User.objects.db, revoke=get_md5_hash_password(user['password']))
+        user_cache().set(key, snapshot, getattr(settings, 'AUTH_USER_CACHE_TIMEOUT', DEFAULT_TIMEOUT))
+        return snapshot
@@ -0,0 +1,59 @@
+import hashlib
+import os
+
+from django.core.files.storage import default_storage
+
+from .workers import submit
+
+
+AVATAR_SIZE = (300, 300)
+
+
+def content_hash(file):
+    """
+    Return the SHA-256 hex digest of an uploaded file, read in chunks.
+    """
+    digest = hashlib.sha256()
+    for chunk in file.chunks():
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def shrink_avatar(path, size=AVATAR_SIZE):
+    """
+    Downscale an avatar in place if it is larger than size. Runs inside
+    the image worker processes.
+
+    Args:
+    - path (str): Filesystem path of the avatar.
+    - size (tuple): The maximum (width, height).
+
+    Returns:
+    - bool: True if the file was rewritten.
+    """
+    from PIL import Image
+
+    with Image.open(path) as img:
+        if img.height <= size[1] and img.width <= size[0]:
+            return False
+        img.thumbnail(size)
+        root, ext = os.path.splitext(path)
+        temporary = f'{root}.tmp{ext}'
+        img.save(temporary, format=img.format)
+    os.replace(temporary, path)
+    return True
+
+
+def schedule_avatar(name):
+    """
+    Queue an avatar for resizing on the image worker pool.
+
+    Args:
+    - name (str): The storage name of the avatar.
+    """
+    try:
+        path = default_storage.path(name)
+    except NotImplementedError:
+        return None
+    return submit(shrink_avatar, path)
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.3 on 2026-10-18 16:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0002_alter_profile_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='image_hash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=64),
+        ),
+    ]
@@ -1,22 +1,58 @@
 from django.contrib.auth.models import AbstractUser #, User
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth import get_user_model
-from PIL import Image
+from .avatars import content_hash, schedule_avatar
 
 class User(AbstractUser):
   email = models.EmailField(unique=True)
 
 class Profile(models.Model):
+  """
+  A user's profile picture.
+
+  Avatars are only processed when a new file is uploaded. The upload is
+  content-hashed first: re-uploading the current avatar, or a file
+  another profile already uses, keeps the stored file instead of saving
+  and resizing it again. Resizing runs on the image worker pool after
+  the transaction commits. Saving a profile without a new upload does
+  no image I/O.
+
+  Fields:
+  - user (OneToOneField): The owner of the profile.
+  - image (ImageField): The avatar.
+  - image_hash (CharField): SHA-256 of the uploaded avatar, blank for the default.
+  """
   user = models.OneToOneField(User, on_delete=models.CASCADE)
   image = models.ImageField(default='profile_pics/youtube.jpg', upload_to='profile_pics')
+  image_hash = models.CharField(max_length=64, blank=True, db_index=True, editable=False)
+
   def __str__(self):
     return f'{self.user.username} Profile'
 
+  @classmethod
+  def from_db(cls, db, field_names, values):
+    instance = super().from_db(db, field_names, values)
+    loaded = dict(zip(field_names, values))
+    # The stored avatar, so re-uploading the same file keeps it as is.
+    instance._loaded_image = (loaded.get('image'), loaded.get('image_hash'))
+    return instance
+
   def save(self, *args, **kwargs):
+    uploaded = bool(self.image) and not self.image._committed
+    if uploaded:
+      self.image_hash = content_hash(self.image.file)
+      stored, stored_hash = getattr(self, '_loaded_image', (None, None))
+      if stored_hash and stored_hash == self.image_hash:
+        existing = stored
+      else:
+        existing = (Profile.objects.filter(image_hash=self.image_hash)
+                    .values_list('image', flat=True).first())
+      if existing:
+        self.image = existing
+        uploaded = False
     super().save(*args, **kwargs)
-    img = Image.open(self.image.path)
-    if img.height > 300 or img.width > 300:
-      resized_img = (300, 300)
-      img.thumbnail(resized_img)
-      img.save(self.image.path)
+    self._loaded_image = (self.image.name, self.image_hash)
+    if uploaded:
+      name = self.image.name
+      transaction.on_commit(lambda: schedule_avatar(name))
 
@@ -1,7 +1,9 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.contrib.auth.models import User
 from django.dispatch import receiver
+from rest_framework_simplejwt.settings import api_settings
 from .models import User, Profile
+from .authentication import invalidate_users
 
 
 
@@ -21,17 +23,12 @@ def create_profile(sender, instance, created, **kwargs):
         # Create a profile for the user
         Profile.objects.create(user=instance)
 
+
 @receiver(post_save, sender=User)
-def save_profile(sender, instance, **kwargs):
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
     """
-    Save the profile associated with the user instance.
-
-    Args:
-        sender: The sender of the signal.
-        instance: The instance of the User model.
-        **kwargs: Additional keyword arguments.
+    Drop the cached snapshot used by CachedJWTAuthentication whenever a
+    user is saved (e.g. deactivated or given a new password) or deleted.
     """
-    # Save the profile associated with the user instance
-    # This is necessary to ensure that the profile is saved
-    # whenever the user instance is saved
-    instance.profile.save()
+    invalidate_users([getattr(instance, api_settings.USER_ID_FIELD)])
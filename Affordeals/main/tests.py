@@ -1,3 +1,171 @@
-from django.test import TestCase
+import os
+import tempfile
+from decimal import Decimal
+from io import BytesIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib import messages
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core.cache import cache, caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from store.cache import page_cache_stats
+from store.models import Category, Products
+from .models import Profile, User
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+                          'users': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+                                    'LOCATION': os.path.join(tempfile.gettempdir(), 'affordeals-auth-tests')}},
+                  AUTH_USER_CACHE='users')
+class CachedJWTAuthenticationTests(TestCase):
+    """
+    API requests read the user from the cache until it is saved.
+    """
+    def setUp(self):
+        caches['users'].clear()
+        self.user = User.objects.create_user('cached', 'cached@example.com', 'secret')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'JWT {AccessToken.for_user(self.user)}')
+
+    def user_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/store/orders/')
+        return response.status_code, len([query for query in queries if 'FROM "main_user"' in query['sql']])
+
+    def test_user_is_cached_until_deactivated(self):
+        self.assertEqual(self.user_queries(), (200, 1))
+        self.assertEqual(self.user_queries(), (200, 0))
+
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.user_queries(), (401, 1))
+
+    def test_snapshot_holds_no_password_hash(self):
+        self.user_queries()
+        snapshot = caches['users'].get(f'auth:user:{self.user.id}')
+        self.assertEqual(set(snapshot), {'db', 'id', 'is_active', 'is_staff', 'is_superuser', 'revoke'})
+        self.assertNotIn(self.user.password, snapshot.values())
+        self.assertEqual(snapshot['revoke'], get_md5_hash_password(self.user.password))
+
+        self.user.set_password('changed')
+        self.user.save()
+        self.user_queries()
+        snapshot = caches['users'].get(f'auth:user:{self.user.id}')
+        self.assertEqual(snapshot['revoke'], get_md5_hash_password(self.user.password))
+
+    @override_settings(AUTH_USER_CACHE='default')
+    def test_per_process_cache_is_not_used(self):
+        self.assertEqual(self.user_queries(), (200, 1))
+        self.assertEqual(self.user_queries(), (200, 1))
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                                       'LOCATION': 'catalog-page-tests'}})
+class CatalogPageCacheTests(TestCase):
+    """
+    Anonymous catalog pages are cached whole until the catalog changes.
+    """
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name='Kitchen')
+        self.product = Products.objects.create(name='Blue kettle', category=category, description='',
+                                               unit_price=Decimal('20.00'), quantity_in_stock=1)
+
+    def stats(self):
+        stats = page_cache_stats()
+        return stats['hits'], stats['misses']
+
+    def test_hit_miss_and_invalidation(self):
+        first = self.client.get('/products/')
+        self.assertEqual(self.stats(), (0, 1))
+        self.assertContains(first, 'Blue kettle')
+        self.assertIn('max-age=0', first['Cache-Control'])
+
+        second = self.client.get('/products/')
+        self.assertEqual(self.stats(), (1, 1))
+        self.assertEqual(second.content, first.content)
+        self.assertEqual(second['Content-Type'], first['Content-Type'])
+        self.assertEqual(second['Cache-Control'], first['Cache-Control'])
+
+        self.product.name = 'Red teapot'
+        self.product.save()
+        third = self.client.get('/products/')
+        self.assertEqual(self.stats(), (1, 2))
+        self.assertContains(third, 'Red teapot')
+
+    def test_pending_messages_bypass_the_cache(self):
+        storage = CookieStorage(RequestFactory().get('/'))
+        storage.add(messages.INFO, 'Welcome back')
+        response = HttpResponse()
+        storage.update(response)
+        self.client.cookies.update(response.cookies)
+
+        self.assertContains(self.client.get('/products/'), 'Welcome back')
+        self.assertEqual(self.stats(), (0, 0))
+        self.assertNotContains(self.client.get('/products/'), 'Welcome back')
+        self.assertEqual(self.stats(), (0, 1))
+
+
+class ProfileAvatarTests(TestCase):
+    """
+    Avatars are only hashed and resized when a new file is uploaded, and
+    identical uploads share one stored file.
+    """
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        overrides = override_settings(MEDIA_ROOT=media.name)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.media = media.name
+        self.user = User.objects.create_user('avatar', 'avatar@example.com', 'secret')
+        schedule = mock.patch('main.models.schedule_avatar')
+        self.schedule = schedule.start()
+        self.addCleanup(schedule.stop)
+
+    def upload(self):
+        from PIL import Image
+        image = BytesIO()
+        Image.new('RGB', (40, 40), 'blue').save(image, format='PNG')
+        return SimpleUploadedFile('me.png', image.getvalue(), content_type='image/png')
+
+    def test_login_and_unchanged_save_do_no_image_io(self):
+        with mock.patch('main.models.content_hash') as content_hash, self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post('/login/', {'username': 'avatar', 'password': 'secret'}).status_code, 302)
+            response = self.client.post('/account/', {'username': 'avatar', 'email': 'avatar@example.com'})
+            self.assertRedirects(response, '/account/', fetch_redirect_response=False)
+            Profile.objects.get(user=self.user).save()
+        content_hash.assert_not_called()
+        self.schedule.assert_not_called()
+
+    def test_identical_uploads_are_deduplicated(self):
+        other = User.objects.create_user('twin', 'twin@example.com', 'secret')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.profile.image = self.upload()
+            self.user.profile.save()
+            other.profile.image = self.upload()
+            other.profile.save()
+        self.assertEqual(other.profile.image.name, self.user.profile.image.name)
+        self.assertEqual(other.profile.image_hash, self.user.profile.image_hash)
+        self.assertEqual(os.listdir(os.path.join(self.media, 'profile_pics')), ['me.png'])
+        self.schedule.assert_called_once_with(self.user.profile.image.name)
+
+    def test_reuploading_the_current_avatar_is_a_no_op(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.profile.image = self.upload()
+            self.user.profile.save()
+        profile = Profile.objects.get(user=self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.image = self.upload()
+            profile.save()
+        self.assertEqual(profile.image.name, self.user.profile.image.name)
+        self.assertEqual(os.listdir(os.path.join(self.media, 'profile_pics')), ['me.png'])
+        self.schedule.assert_called_once_with(profile.image.name)
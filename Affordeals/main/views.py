@@ -3,7 +3,8 @@ from django.contrib import messages
 from .forms import CustomUserCreationForm, UserUpdateForm, ProfileUpdateForm
 from django.contrib.auth.decorators import login_required
 from store.models import Products, ShoppingCart, ShoppingCartItem, ShoppingOrder
-from django.core.paginator import Paginator
+from store.pagination import KeysetPaginator, InvalidCursor
+from store.cache import cache_catalog_page
 
 
 from store.serializers import ProductsSerializer
@@ -36,13 +37,34 @@ def about(request):
     
 
 
+def cursor_url(request, cursor=None):
+    """
+    Return the current query string with its cursor replaced, so page
+    links keep the other parameters such as with_count.
+    """
+    query = request.GET.copy()
+    query.pop('cursor', None)
+    if cursor:
+        query['cursor'] = cursor
+    return '?' + query.urlencode()
+
+
+@cache_catalog_page
 def product_view(request):
     products = Products.objects.all()
-    ordered_products = products.order_by('category_id')
-    paginator = Paginator(ordered_products, 8)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    return render(request, 'main/home.html', {'page_obj': page_obj})
+    paginator = KeysetPaginator(products, 8, ordering=('category_id', 'id'))
+    with_count = request.GET.get('with_count', '').lower() in ('1', 'true')
+    try:
+        page_obj = paginator.get_page(request.GET.get('cursor'), with_count)
+    except InvalidCursor:
+        page_obj = paginator.get_page(None, with_count)
+    context = {
+        'page_obj': page_obj,
+        'first_url': cursor_url(request),
+        'previous_url': cursor_url(request, page_obj.previous_cursor),
+        'next_url': cursor_url(request, page_obj.next_cursor),
+    }
+    return render(request, 'main/home.html', context)
 
 
 @login_required
@@ -0,0 +1,36 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+
+
+_executor = None
+
+
+def get_executor():
+    """
+    Return the lazily created process pool used for image work, shared by
+    product images (store.images) and avatars (main.avatars). Workers
+    are spawned rather than forked so they never inherit open database
+    connections or threads from the web process.
+    """
+    global _executor
+    if _executor is None:
+        workers = getattr(settings, 'STORE_IMAGE_WORKERS', 2)
+        _executor = ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+    return _executor
+
+
+def submit(fn, *args):
+    """
+    Submit a job to the image pool, replacing the pool once if a worker
+    died and left it broken.
+    """
+    global _executor
+    try:
+        return get_executor().submit(fn, *args)
+    except BrokenProcessPool:
+        _executor = None
+        return get_executor().submit(fn, *args)
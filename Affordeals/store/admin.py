@@ -1,8 +1,9 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.db.models.aggregates import Count
 from django.utils.html import format_html, urlencode
 from .models import Products, Address, SiteUser, Category, ShoppingOrder, ShoppingOrderItem, ShoppingCart, ShoppingCartItem 
 from django.urls import reverse
+from .orders import transition_orders
 
 
 @admin.register(Products)
@@ -44,15 +45,14 @@ class CategoryAdmin(admin.ModelAdmin):
     - search_fields (list): Fields to include in the search functionality.
 
     Methods:
-    - products_count (function): Returns the number of products in a given category.
-    - get_queryset (function): Customizes the query set to include the
-      product count annotation.
+    - products_count (function): Returns the number of products in a given
+      category, read from the denormalized product_count column.
     """
     autocomplete_fields = ['highlighted_product']
     list_display = ['name', 'products_count']
     search_fields = ['name']
 
-    @admin.display(ordering='products_count')
+    @admin.display(ordering='product_count')
     def products_count(self, category):
         url = (
             reverse('admin:store_products_changelist')
@@ -60,12 +60,7 @@ class CategoryAdmin(admin.ModelAdmin):
             + urlencode({
                 'category__id': str(category.id)
             }))
-        return format_html('<a href="{}">{} Products</a>', url, category.products_count)
-
-    def get_queryset(self, request):
-        return super().get_queryset(request).annotate(
-            products_count=Count('products')
-        )
+        return format_html('<a href="{}">{} Products</a>', url, category.product_count)
 
 
 @admin.register(SiteUser)
@@ -136,7 +131,31 @@ class OrderAdmin(admin.ModelAdmin):
     - id (UUID): A unique identifier for the order.
     - created_at (DateTime): The timestamp when the order was created.
     - siteuser (ForeignKey): Reference to the user who placed the order.
+    - total_amount, item_count: Stored totals, refreshed when items are
+      edited inline.
   """
   autocomplete_fields = ['siteuser']
-  list_display = ['id', 'created_at', 'siteuser']
-  inlines = [OrderItemInline]
\ No newline at end of file
+  list_display = ['id', 'created_at', 'siteuser', 'payment_status', 'item_count', 'total_amount']
+  list_filter = ['payment_status']
+  inlines = [OrderItemInline]
+  actions = ['mark_complete', 'mark_failed']
+
+  def transition(self, request, queryset, payment_status):
+    """
+    Move the selected orders with store.orders.transition_orders and
+    report the orders whose status does not allow it.
+    """
+    moved, rejected = transition_orders(list(queryset.values_list('pk', flat=True)), payment_status)
+    label = dict(ShoppingOrder.PAYMENT_STATUS_CHOICES)[payment_status]
+    self.message_user(request, f'{len(moved)} orders marked {label}.', messages.SUCCESS)
+    if rejected:
+      ids = ', '.join(map(str, list(rejected)[:20])) + (', ...' if len(rejected) > 20 else '')
+      self.message_user(request, f'{len(rejected)} orders cannot be marked {label}: {ids}', messages.WARNING)
+
+  @admin.action(description='Mark selected orders as complete')
+  def mark_complete(self, request, queryset):
+    self.transition(request, queryset, ShoppingOrder.PAYMENT_STATUS_COMPLETE)
+
+  @admin.action(description='Mark selected orders as failed')
+  def mark_failed(self, request, queryset):
+    self.transition(request, queryset, ShoppingOrder.PAYMENT_STATUS_FAILED)
\ No newline at end of file
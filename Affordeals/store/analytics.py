@@ -0,0 +1,124 @@
+from django.db import connections, transaction
+from django.db.models import F, Sum
+from django.db.models.functions import TruncDate
+
+from .models import CategoryDailySales, ProductDailySales, ShoppingOrder, ShoppingOrderItem
+
+
+# (rollup model, its key column, the order item path to the key). Sales
+# are grouped by the category recorded on the item, not the product's
+# current one, so a rebuild reproduces the incremental rows after a move.
+ROLLUPS = (
+    (ProductDailySales, 'product_id', 'products_id'),
+    (CategoryDailySales, 'category_id', 'category_id'),
+)
+
+
+def sold_items(order_ids=None, since=None):
+    """
+    Order items of some orders, or of every completed order, annotated
+    with the day their order was placed.
+
+    Args:
+    - order_ids (list): The orders to read, all completed orders if None.
+    - since (date): Skip orders placed before this day.
+    """
+    items = ShoppingOrderItem.objects.all()
+    if order_ids is None:
+        items = items.filter(order__payment_status=ShoppingOrder.PAYMENT_STATUS_COMPLETE)
+    else:
+        items = items.filter(order_id__in=order_ids)
+    if since is not None:
+        items = items.filter(order__created_at__date__gte=since)
+    return items.annotate(day=TruncDate('order__created_at'))
+
+
+def daily_totals(items, path):
+    """
+    Returns:
+    - QuerySet: (day, key, units, revenue) rows grouped by day and key,
+      skipping items whose key was deleted (a category set to NULL).
+    """
+    return (items.filter(**{f'{path}__isnull': False}).values_list('day', path).order_by()
+            .annotate(units=Sum('quantity'), revenue=Sum('line_total')))
+
+
+def add_to_rollup(model, key, rows, sign=1, chunk_size=300):
+    """
+    Add units and revenue to rollup rows with multi-row upserts:
+    INSERT ... ON CONFLICT (day, key) DO UPDATE SET units = units + ...
+
+    Args:
+    - model (Model): ProductDailySales or CategoryDailySales.
+    - key (str): The model's key column, e.g. 'product_id'.
+    - rows (list): (day, key value, units, revenue) tuples.
+    - sign (int): -1 to take the amounts back out.
+    - chunk_size (int): Rows per statement.
+    """
+    connection = connections[model.objects.db]
+    if connection.vendor not in ('sqlite', 'postgresql'):
+        for day, value, units, revenue in rows:
+            row, _ = model.objects.select_for_update().get_or_create(day=day, **{key: value})
+            model.objects.filter(pk=row.pk).update(units=F('units') + sign * units,
+                                                   revenue=F('revenue') + sign * revenue)
+        return
+    table = connection.ops.quote_name(model._meta.db_table)
+    day_field, revenue_field = model._meta.get_field('day'), model._meta.get_field('revenue')
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            params = []
+            for day, value, units, revenue in chunk:
+                params.extend([day_field.get_db_prep_save(day, connection), value, sign * units,
+                               revenue_field.get_db_prep_save(sign * revenue, connection)])
+            cursor.execute(
+                f'INSERT INTO {table} (day, {key}, units, revenue) '
+                f'VALUES {", ".join(["(%s, %s, %s, %s)"] * len(chunk))} '
+                f'ON CONFLICT (day, {key}) DO UPDATE '
+                f'SET units = {table}.units + excluded.units, revenue = {table}.revenue + excluded.revenue',
+                params)
+
+
+def record_sales(order_ids, sign=1):
+    """
+    Add the items of orders that just completed to the daily rollups,
+    with one aggregate query and one upsert per rollup whatever the
+    number of orders. Call with sign=-1 for orders leaving the complete
+    status.
+
+    Args:
+    - order_ids (list): The orders that moved.
+    - sign (int): 1 when they completed, -1 when they stopped being complete.
+    """
+    if not order_ids:
+        return
+    items = sold_items(order_ids)
+    with transaction.atomic():
+        for model, key, path in ROLLUPS:
+            add_to_rollup(model, key, list(daily_totals(items, path)), sign)
+
+
+def rebuild_rollups(since=None, batch_size=1000):
+    """
+    Recompute the rollups from the completed orders, e.g. after a
+    deployment or a manual data fix.
+
+    Args:
+    - since (date): Only rebuild the days from this one on.
+    - batch_size (int): Rows per INSERT.
+
+    Returns:
+    - dict: Rollup model name -> rows written.
+    """
+    items = sold_items(since=since)
+    written = {}
+    with transaction.atomic():
+        for model, key, path in ROLLUPS:
+            # Rollup rows have no dependents or signals: one fast DELETE.
+            (model.objects.all() if since is None else model.objects.filter(day__gte=since)).delete()
+            rows = model.objects.bulk_create(
+                (model(day=day, units=units, revenue=revenue, **{key: value})
+                 for day, value, units, revenue in daily_totals(items, path).iterator()),
+                batch_size=batch_size)
+            written[model.__name__] = len(rows)
+    return written
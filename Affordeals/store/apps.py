@@ -14,4 +14,5 @@ class StoreConfig(AppConfig):
     name = 'store'
 
     def ready(self):
+        import store.checks
         import store.signals
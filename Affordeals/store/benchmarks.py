@@ -0,0 +1,294 @@
+import os
+import statistics
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.db import connection, connections
+from django.test.utils import setup_test_environment, teardown_test_environment
+from rest_framework.test import APIClient
+
+
+SCENARIOS = {}
+
+
+def scenario(name, help=''):
+    """
+    Register a benchmark scenario for the benchmark management command.
+
+    A scenario is called with (options, report) where report(label, **values)
+    prints one result line.
+    """
+    def register(func):
+        SCENARIOS[name] = (func, help or (func.__doc__ or '').strip().splitlines()[0])
+        return func
+    return register
+
+
+@contextmanager
+def benchmark_database():
+    """
+    Run the body against a freshly migrated throwaway database, in the
+    test environment with DEBUG off (no query logging, no debug toolbar).
+    SQLite uses a temporary file instead of the usual in-memory test
+    database, so concurrent threads get their own connections and real
+    locking.
+    """
+    setup_test_environment(debug=False)
+    test_settings = connection.settings_dict.setdefault('TEST', {})
+    previous_name = test_settings.get('NAME')
+    workdir = None
+    if connection.vendor == 'sqlite':
+        workdir = tempfile.mkdtemp(prefix='affordeals-bench-')
+        test_settings['NAME'] = os.path.join(workdir, 'bench.sqlite3')
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connections.close_all()
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        test_settings['NAME'] = previous_name
+        teardown_test_environment()
+        if workdir:
+            for name in os.listdir(workdir):
+                os.remove(os.path.join(workdir, name))
+            os.rmdir(workdir)
+
+
+def run_concurrently(threads, operations, work):
+    """
+    Run work(thread_index, operation_index) operations spread over threads.
+
+    Args:
+    - threads (int): Number of concurrent threads.
+    - operations (int): Operations per thread.
+    - work (function): The operation to time.
+
+    Returns:
+    - dict: elapsed seconds, throughput, latency percentiles and error count.
+    """
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+    barrier = threading.Barrier(threads)
+
+    def worker(index):
+        local = []
+        try:
+            barrier.wait()
+            for operation in range(operations):
+                started = time.perf_counter()
+                try:
+                    work(index, operation)
+                except Exception as error:
+                    with lock:
+                        errors.append(error)
+                local.append(time.perf_counter() - started)
+        finally:
+            connections.close_all()
+            with lock:
+                latencies.extend(local)
+
+    pool = [threading.Thread(target=worker, args=(index,)) for index in range(threads)]
+    started = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        'elapsed': elapsed,
+        'per_second': len(latencies) / elapsed if elapsed else 0,
+        'p50_ms': statistics.median(latencies) * 1000 if latencies else 0,
+        'p99_ms': latencies[int(len(latencies) * 0.99) - 1] * 1000 if latencies else 0,
+        'errors': len(errors),
+    }
+
+
+def make_catalog(products=10):
+    from .models import Category, Products
+    category = Category.objects.create(name='Benchmark')
+    return Products.objects.bulk_create([
+        Products(name=f'Bench {index}', category=category, description='',
+                 unit_price=Decimal('9.99'), quantity_in_stock=1000)
+        for index in range(products)
+    ])
+
+
+def make_user(username='bench'):
+    from main.models import User
+    return User.objects.create_user(username, f'{username}@example.com', 'bench')
+
+
+def api_client(user):
+    client = APIClient()
+    client.force_authenticate(user)
+    return client
+
+
+@scenario('cart-add', 'Many concurrent writers adding the same products to one cart.')
+def cart_add(options, report):
+    from .models import ShoppingCart, ShoppingCartItem
+
+    products = make_catalog(products=5)
+    user = make_user()
+    threads, operations = options['threads'], options['operations']
+    expected = threads * operations
+
+    def legacy_add(cart_id, product_id):
+        # The previous get() then save()/create() implementation.
+        try:
+            item = ShoppingCartItem.objects.get(cart_id=cart_id, product_id=product_id)
+            item.quantity += 1
+            item.save()
+        except ShoppingCartItem.DoesNotExist:
+            ShoppingCartItem.objects.create(cart_id=cart_id, product_id=product_id, quantity=1)
+
+    def run(label, add):
+        cart = ShoppingCart.objects.create()
+        result = run_concurrently(
+            threads, operations,
+            lambda thread, operation: add(cart.id, products[operation % len(products)].id))
+        stored = sum(ShoppingCartItem.objects.filter(cart=cart).values_list('quantity', flat=True))
+        report(label, lost_updates=expected - stored - result['errors'], **result)
+
+    run('read-modify-write (ORM)', legacy_add)
+    run('upsert (ORM)', lambda cart_id, product_id: ShoppingCartItem.objects.add(cart_id, product_id, 1))
+
+    clients = {}
+
+    def upsert_via_api(cart_id, product_id):
+        client = clients.setdefault(threading.get_ident(), api_client(user))
+        response = client.post(f'/store/carts/{cart_id}/cartitems/',
+                               {'product_id': product_id, 'quantity': 1}, format='json')
+        if response.status_code != 201:
+            raise RuntimeError(response.status_code)
+
+    run('upsert (HTTP POST)', upsert_via_api)
+
+
+@scenario('cart-store', 'Read-heavy cart traffic against the database and cache cart stores.')
+def cart_store(options, report):
+    """
+    Each thread works on its own cart: every operation adds a product and
+    reads the cart back, as a storefront does after each click. The cache
+    store is flushed at the end and the persisted quantities checked.
+    """
+    from .carts import build_cart_store
+    from .models import ShoppingCartItem
+
+    products = make_catalog(products=20)
+    threads, operations = options['threads'], options['operations']
+
+    for backend in ('database', 'cache'):
+        store = build_cart_store(backend)
+        carts = [store.create().id for _ in range(threads)]
+
+        def work(thread, operation):
+            cart_id = carts[thread]
+            store.add(cart_id, products[operation % len(products)].id, 1)
+            store.get(cart_id)
+
+        result = run_concurrently(threads, operations, work)
+        started = time.perf_counter()
+        store.flush_dirty()
+        flush_ms = (time.perf_counter() - started) * 1000
+        stored = sum(ShoppingCartItem.objects.filter(cart_id__in=carts).values_list('quantity', flat=True))
+        report(backend, flush_ms=flush_ms, lost_updates=threads * operations - stored - result['errors'],
+               **result)
+
+
+@scenario('flash-sale', 'Concurrent buyers reserving a product with half as many units as buyers.')
+def flash_sale(options, report):
+    from .models import Products, ShoppingOrder
+    from .stock import OutOfStock, reserve_stock
+
+    product = make_catalog(products=1)[0]
+    user = make_user()
+    threads, operations = options['threads'], options['operations']
+    stock = threads * operations // 2
+    Products.objects.filter(pk=product.pk).update(quantity_in_stock=stock)
+    orders = ShoppingOrder.objects.bulk_create(
+        [ShoppingOrder(siteuser=user) for _ in range(threads * operations)])
+    outcomes = {'sold': 0, 'short': 0}
+    lock = threading.Lock()
+
+    def buy(thread, operation):
+        try:
+            reserve_stock(orders[thread * operations + operation].id, {product.id: 1})
+            outcome = 'sold'
+        except OutOfStock:
+            outcome = 'short'
+        with lock:
+            outcomes[outcome] += 1
+
+    result = run_concurrently(threads, operations, buy)
+    remaining = Products.objects.get(pk=product.pk).quantity_in_stock
+    report('conditional UPDATE', oversold=max(0, outcomes['sold'] - stock), remaining=remaining,
+           **outcomes, **result)
+
+
+@scenario('order-placement', 'Place orders from carts of 1 to 1,000 lines, per pipeline stage.')
+def order_placement(options, report):
+    """
+    Converts one cart per size with store.orders.OrderPlacement and
+    reports the query count and the time spent in each stage.
+    """
+    from django.test.utils import CaptureQueriesContext
+    from .models import ShoppingCart, ShoppingCartItem
+    from .orders import OrderPlacement
+
+    products = make_catalog(products=1000)
+    user = make_user()
+    for size in (1, 10, 100, 1000):
+        cart = ShoppingCart.objects.create()
+        ShoppingCartItem.objects.bulk_create(
+            [ShoppingCartItem(cart=cart, product=product, quantity=1) for product in products[:size]])
+        placement = OrderPlacement(user.id, cart.id)
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            placement.run()
+            elapsed_ms = (time.perf_counter() - started) * 1000
+        report(f'{size} lines', queries=len(queries), total_ms=elapsed_ms,
+               **{f'{stage}_ms': ms for stage, ms in placement.timings.items()})
+
+
+@scenario('jwt-auth', 'Authenticate API requests with and without the cached JWT user lookup.')
+def jwt_auth(options, report):
+    """
+    Authenticates the same bearer token repeatedly with simplejwt's
+    JWTAuthentication and with main.authentication.CachedJWTAuthentication,
+    reporting the queries per request and the latency of each, with the
+    user snapshots kept in the AUTH_USER_CACHE alias from settings.
+    """
+    from django.test import RequestFactory
+    from django.test.utils import CaptureQueriesContext
+    from rest_framework.request import Request
+    from rest_framework_simplejwt.authentication import JWTAuthentication
+    from rest_framework_simplejwt.tokens import AccessToken
+    from main.authentication import CACHE_KEY, CachedJWTAuthentication, user_cache
+
+    if user_cache() is None:
+        raise RuntimeError('AUTH_USER_CACHE must name a shared cache alias.')
+    user = make_user()
+    header = f'JWT {AccessToken.for_user(user)}'
+    threads, operations = options['threads'], options['operations']
+    factory = RequestFactory()
+    user_cache().delete(CACHE_KEY.format(user.pk))
+
+    for label, authentication in (('JWTAuthentication', JWTAuthentication()),
+                                  ('CachedJWTAuthentication', CachedJWTAuthentication())):
+        def authenticate(thread=0, operation=0):
+            request = Request(factory.get('/store/orders/', HTTP_AUTHORIZATION=header))
+            if authentication.authenticate(request)[0].pk != user.pk:
+                raise RuntimeError('wrong user')
+
+        authenticate()
+        with CaptureQueriesContext(connection) as queries:
+            for _ in range(100):
+                authenticate()
+        result = run_concurrently(threads, operations, authenticate)
+        report(label, queries_per_request=len(queries) / 100, **result)
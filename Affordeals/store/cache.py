@@ -0,0 +1,147 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.utils.cache import has_vary_header, patch_response_headers
+
+
+CATALOG_VERSION_KEY = 'catalog:version'
+CATALOG_MODIFIED_KEY = 'catalog:modified'
+CATALOG_STATS_KEY = 'catalog:page_cache:{}'
+DEFAULT_PAGE_TIMEOUT = 600
+DEFAULT_PAGE_MAX_AGE = 0
+
+
+def get_catalog_version():
+    """
+    Return the current catalog version.
+
+    Every cached catalog artefact embeds this number in its key, so
+    bumping it invalidates all of them at once without deleting anything.
+    It lives in the shared default cache, so a bump from any process is
+    seen by all of them.
+
+    Returns:
+    - int: The catalog version.
+    """
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        # Seed from the clock so an evicted counter never falls back to
+        # a version that still has live entries.
+        cache.add(CATALOG_VERSION_KEY, int(time.time() * 1000), None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    """
+    Invalidate every cached catalog page and facet count in O(1).
+    """
+    try:
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        get_catalog_version()
+    cache.set(CATALOG_MODIFIED_KEY, time.time(), None)
+
+
+def get_catalog_modified():
+    """
+    Return when the catalog last changed, as a POSIX timestamp.
+
+    Unlike max(updated_at) this also moves when a product or category
+    is deleted. If the cache lost the value, it is reseeded with the
+    current time, which can only cause extra (never missed) refreshes.
+
+    Returns:
+    - float: The timestamp of the last catalog write.
+    """
+    modified = cache.get(CATALOG_MODIFIED_KEY)
+    if modified is None:
+        cache.add(CATALOG_MODIFIED_KEY, time.time(), None)
+        modified = cache.get(CATALOG_MODIFIED_KEY)
+    return modified
+
+
+def record(stat):
+    key = CATALOG_STATS_KEY.format(stat)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 0, None)
+        cache.incr(key)
+
+
+def page_cache_stats():
+    """
+    Return the catalog page cache hit and miss counters.
+
+    Returns:
+    - dict: {'hits': int, 'misses': int, 'version': int}
+    """
+    keys = [CATALOG_STATS_KEY.format('hits'), CATALOG_STATS_KEY.format('misses')]
+    values = cache.get_many(keys)
+    return {
+        'hits': values.get(keys[0], 0),
+        'misses': values.get(keys[1], 0),
+        'version': get_catalog_version(),
+    }
+
+
+def catalog_cache_key(prefix, *parts):
+    """
+    Build a cache key scoped to the current catalog version.
+
+    Args:
+    - prefix (str): The kind of cached artefact.
+    - *parts: Values identifying the artefact, e.g. cursor and filters.
+
+    Returns:
+    - str: The versioned cache key.
+    """
+    digest = hashlib.md5(repr(parts).encode()).hexdigest()
+    return f'catalog:{prefix}:{get_catalog_version()}:{digest}'
+
+
+def cacheable(request, response):
+    """
+    Whether a catalog response may be served to other visitors: a
+    complete 200 that sets no cookie and uses no per-visitor state such
+    as the CSRF token.
+    """
+    return (response.status_code == 200 and not response.streaming and not response.cookies
+            and not request.META.get('CSRF_COOKIE_NEEDS_UPDATE') and not has_vary_header(response, 'Cookie'))
+
+
+def cache_catalog_page(view):
+    """
+    Cache the whole rendered response of a catalog view (status, body
+    and headers) for anonymous GET requests, keyed by the query string
+    (cursor and filters) and the catalog version, like Django's
+    UpdateCacheMiddleware. Requests with pending flash messages bypass
+    the cache, since the page would show them.
+
+    Browsers are told to revalidate after STORE_CATALOG_PAGE_MAX_AGE
+    seconds, 0 by default: a catalog write only drops the server copy.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if request.method != 'GET' or request.user.is_authenticated or len(get_messages(request)):
+            return view(request, *args, **kwargs)
+
+        key = catalog_cache_key(
+            'page', request.path, sorted(request.GET.lists()))
+        cached = cache.get(key)
+        if cached is not None:
+            record('hits')
+            return cached
+
+        record('misses')
+        response = view(request, *args, **kwargs)
+        if cacheable(request, response):
+            patch_response_headers(response, getattr(settings, 'STORE_CATALOG_PAGE_MAX_AGE', DEFAULT_PAGE_MAX_AGE))
+            cache.set(key, response, getattr(settings, 'STORE_CATALOG_PAGE_TIMEOUT', DEFAULT_PAGE_TIMEOUT))
+        return response
+    return wrapper
@@ -0,0 +1,404 @@
+import atexit
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Products, ShoppingCart, ShoppingCartItem
+
+
+logger = logging.getLogger(__name__)
+
+# 'database' keeps every cart in the ShoppingCart/ShoppingCartItem tables,
+# 'cache' keeps live carts in the cache and writes them behind.
+DEFAULT_BACKEND = 'database'
+DEFAULT_CACHE_ALIAS = 'default'
+DEFAULT_FLUSH_INTERVAL = 5
+DEFAULT_CART_TIMEOUT = 7 * 24 * 3600
+
+CART_KEY = 'cart:{}'
+LOCK_KEY = 'cart:{}:lock'
+LOCK_TIMEOUT = 5
+
+_store = None
+_store_lock = threading.Lock()
+
+
+class CartSnapshot:
+    """
+    A cart read from a cart store, shaped for ShoppingCartSerializer.
+
+    Attributes:
+    - id (UUID): The cart id.
+    - created_at (DateTime): When the cart was created.
+    - cartitems (list): Unsaved ShoppingCartItem instances with product
+      and line_total set. Items not flushed yet have no id.
+    - total_price (Decimal): The sum of the line totals.
+    """
+    def __init__(self, id, created_at, cartitems):
+        self.id = id
+        self.created_at = created_at
+        self.cartitems = cartitems
+        self.total_price = sum((item.line_total for item in cartitems), Decimal('0'))
+
+
+class DatabaseCartStore:
+    """
+    Cart store reading and writing the ShoppingCart/ShoppingCartItem
+    tables directly; every call is synchronous.
+    """
+    name = 'database'
+
+    def create(self):
+        return ShoppingCart.objects.create()
+
+    def get(self, cart_id):
+        return ShoppingCart.objects.with_totals().filter(pk=cart_id).first()
+
+    def exists(self, cart_id):
+        return ShoppingCart.objects.filter(pk=cart_id).exists()
+
+    def add(self, cart_id, product_id, quantity):
+        return ShoppingCartItem.objects.add(cart_id, product_id, quantity)
+
+    def apply(self, cart_id, absolute, increments, removed):
+        """
+        Apply folded batch operations, see BatchCartSerializer.fold(),
+        with at most one DELETE and two upserts in one transaction.
+        """
+        with transaction.atomic():
+            if removed:
+                ShoppingCartItem.objects.filter(cart_id=cart_id, product_id__in=removed).delete()
+            if absolute:
+                ShoppingCartItem.objects.bulk_create(
+                    [ShoppingCartItem(cart_id=cart_id, product_id=product_id, quantity=quantity)
+                     for product_id, quantity in absolute.items()],
+                    update_conflicts=True, unique_fields=['cart', 'product'], update_fields=['quantity'])
+            if increments:
+                ShoppingCartItem.objects.add_many(cart_id, increments)
+        return self.get(cart_id)
+
+    def delete(self, cart_id):
+        ShoppingCart.objects.filter(pk=cart_id).delete()
+
+    def flush(self, cart_id):
+        pass
+
+    def evict(self, cart_id):
+        pass
+
+    def evict_many(self, cart_ids):
+        pass
+
+    def flush_dirty(self):
+        return 0
+
+
+class CacheCartStore(DatabaseCartStore):
+    """
+    Cart store keeping live carts in a Django cache, keyed by cart UUID,
+    and persisting them to the database write-behind.
+
+    A cached cart is {'created_at', 'items': {product_id: [quantity, item id]},
+    'dirty'}. Mutations only touch the cache and mark the cart dirty; a
+    background thread flushes dirty carts every flush_interval seconds,
+    and flush() persists one cart synchronously, which NewOrderSerializer
+    does before converting it. Carts missing from the cache are loaded
+    from the database on first use.
+
+    Changes made since the last flush are lost if the cache drops the
+    entry first, so use a cache alias that does not cull aggressively
+    (STORE_CART_CACHE) and keep the flush interval well below the cart
+    timeout. Dirty carts are tracked per process, which matches the
+    per-process locmem cache.
+
+    Attributes:
+    - cache (BaseCache): The cache holding live carts.
+    - flush_interval (float): Seconds between background flushes; 0
+      disables the thread so carts are only flushed on demand.
+    - timeout (int): Cache lifetime of an idle cart.
+    """
+    name = 'cache'
+
+    def __init__(self, alias=DEFAULT_CACHE_ALIAS, flush_interval=DEFAULT_FLUSH_INTERVAL,
+                 timeout=DEFAULT_CART_TIMEOUT):
+        self.cache = caches[alias]
+        self.flush_interval = flush_interval
+        self.timeout = timeout
+        self.dirty = set()
+        self.dirty_lock = threading.Lock()
+        self.flusher = None
+
+    @contextmanager
+    def lock(self, cart_id):
+        """
+        Serialize read-modify-write cycles and flushes of one cart across
+        threads and processes sharing the cache.
+        """
+        key = LOCK_KEY.format(cart_id)
+        deadline = time.monotonic() + LOCK_TIMEOUT
+        while not self.cache.add(key, 1, LOCK_TIMEOUT):
+            if time.monotonic() > deadline:
+                raise TimeoutError(f'Cart {cart_id} is locked')
+            time.sleep(0.001)
+        try:
+            yield
+        finally:
+            self.cache.delete(key)
+
+    def read(self, cart_id):
+        """
+        Return the cached state of a cart, loading it from the database
+        on a miss, or None if the cart does not exist.
+        """
+        key = CART_KEY.format(cart_id)
+        state = self.cache.get(key)
+        if state is not None:
+            return state
+        created_at = ShoppingCart.objects.filter(pk=cart_id).values_list('created_at', flat=True).first()
+        if created_at is None:
+            return None
+        items = ShoppingCartItem.objects.filter(cart_id=cart_id).values_list('product_id', 'quantity', 'id')
+        state = {
+            'created_at': created_at,
+            'items': {product_id: [quantity, item_id] for product_id, quantity, item_id in items},
+            'dirty': False,
+        }
+        self.cache.add(key, state, self.timeout)
+        return self.cache.get(key, state)
+
+    def write(self, cart_id, state):
+        state['dirty'] = True
+        self.cache.set(CART_KEY.format(cart_id), state, self.timeout)
+        self.mark_dirty(cart_id)
+
+    def snapshot(self, cart_id, state):
+        products = Products.objects.only('id', 'name', 'unit_price').in_bulk(list(state['items']))
+        cartitems = []
+        for product_id, (quantity, item_id) in state['items'].items():
+            product = products.get(product_id)
+            if product is None:
+                continue
+            item = ShoppingCartItem(id=item_id, cart_id=cart_id, product=product, quantity=quantity)
+            item.line_total = product.unit_price * quantity
+            cartitems.append(item)
+        return CartSnapshot(cart_id, state['created_at'], cartitems)
+
+    def create(self):
+        cart = ShoppingCart(created_at=timezone.now())
+        state = {'created_at': cart.created_at, 'items': {}, 'dirty': True}
+        self.cache.set(CART_KEY.format(cart.id), state, self.timeout)
+        self.mark_dirty(cart.id)
+        return CartSnapshot(cart.id, cart.created_at, [])
+
+    def get(self, cart_id):
+        state = self.read(cart_id)
+        return None if state is None else self.snapshot(cart_id, state)
+
+    def exists(self, cart_id):
+        return self.read(cart_id) is not None
+
+    def add(self, cart_id, product_id, quantity):
+        if not Products.objects.filter(pk=product_id).exists():
+            return None
+        with self.lock(cart_id):
+            state = self.read(cart_id)
+            if state is None:
+                return None
+            entry = state['items'].setdefault(product_id, [0, None])
+            entry[0] += quantity
+            self.write(cart_id, state)
+        return ShoppingCartItem(id=entry[1], cart_id=cart_id, product_id=product_id, quantity=entry[0])
+
+    def apply(self, cart_id, absolute, increments, removed):
+        with self.lock(cart_id):
+            state = self.read(cart_id)
+            if state is None:
+                return None
+            items = state['items']
+            for product_id in removed:
+                items.pop(product_id, None)
+            for product_id, quantity in absolute.items():
+                items.setdefault(product_id, [0, None])[0] = quantity
+            for product_id, quantity in increments.items():
+                items.setdefault(product_id, [0, None])[0] += quantity
+            self.write(cart_id, state)
+        return self.snapshot(cart_id, state)
+
+    def delete(self, cart_id):
+        with self.lock(cart_id):
+            self.evict(cart_id)
+            super().delete(cart_id)
+
+    def evict(self, cart_id):
+        """
+        Drop a cart from the cache without flushing it, after it was
+        changed or deleted in the database directly.
+        """
+        with self.dirty_lock:
+            self.dirty.discard(cart_id)
+        self.cache.delete(CART_KEY.format(cart_id))
+
+    def evict_many(self, cart_ids):
+        with self.dirty_lock:
+            self.dirty.difference_update(cart_ids)
+        self.cache.delete_many([CART_KEY.format(cart_id) for cart_id in cart_ids])
+
+    def mark_dirty(self, cart_id):
+        with self.dirty_lock:
+            self.dirty.add(cart_id)
+            if self.flush_interval and (self.flusher is None or not self.flusher.is_alive()):
+                self.flusher = threading.Thread(target=self.run_flusher, name='cart-flusher', daemon=True)
+                self.flusher.start()
+
+    def run_flusher(self):
+        from django.db import connections
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush_dirty()
+            except Exception:
+                logger.exception('Cart write-behind flush failed')
+            finally:
+                connections.close_all()
+
+    def flush_dirty(self):
+        """
+        Persist every cart this process marked dirty.
+
+        Returns:
+        - int: The number of carts flushed.
+        """
+        with self.dirty_lock:
+            pending, self.dirty = self.dirty, set()
+        for position, cart_id in enumerate(pending):
+            try:
+                self.flush(cart_id)
+            except Exception:
+                with self.dirty_lock:
+                    self.dirty.update(list(pending)[position:])
+                raise
+        return len(pending)
+
+    def flush(self, cart_id):
+        """
+        Make the database match the cached cart: create the cart row,
+        delete removed items and upsert the rest in one transaction. Items
+        whose product has been deleted since are dropped. The cart stays
+        locked meanwhile, so a flush never races a conversion or delete.
+        """
+        with self.lock(cart_id):
+            key = CART_KEY.format(cart_id)
+            state = self.cache.get(key)
+            if state is None or not state['dirty']:
+                return
+            items = state['items']
+            with transaction.atomic():
+                ShoppingCart.objects.bulk_create(
+                    [ShoppingCart(id=cart_id, created_at=state['created_at'])], ignore_conflicts=True)
+                ShoppingCartItem.objects.filter(cart_id=cart_id).exclude(product_id__in=list(items)).delete()
+                existing = set(Products.objects.filter(pk__in=list(items)).values_list('pk', flat=True))
+                saved = ShoppingCartItem.objects.bulk_create(
+                    [ShoppingCartItem(cart_id=cart_id, product_id=product_id, quantity=quantity)
+                     for product_id, (quantity, _) in items.items() if product_id in existing],
+                    update_conflicts=True, unique_fields=['cart', 'product'], update_fields=['quantity'])
+            state['items'] = {item.product_id: [item.quantity, item.id] for item in saved}
+            state['dirty'] = False
+            self.cache.set(key, state, self.timeout)
+
+
+def reap_abandoned_carts(older_than, chunk_size=1000, dry_run=False):
+    """
+    Delete carts created before a cutoff, oldest first, in chunks.
+
+    Each chunk selects up to chunk_size cart ids through the created_at
+    index, then deletes those carts and their items in one short
+    transaction, see delete_carts(). Reaped carts are also evicted from
+    the cart store.
+
+    Args:
+    - older_than (datetime): Carts created before this are deleted.
+    - chunk_size (int): Carts deleted per transaction.
+    - dry_run (bool): Only count the carts that would be deleted.
+
+    Returns:
+    - tuple: (carts deleted, items deleted); with dry_run, (carts found, 0).
+    """
+    expired = ShoppingCart.objects.filter(created_at__lt=older_than)
+    if dry_run:
+        return expired.count(), 0
+    store = get_cart_store()
+    carts = items = 0
+    while True:
+        with transaction.atomic():
+            ids = list(expired.order_by('created_at').values_list('id', flat=True)[:chunk_size])
+            if not ids:
+                break
+            deleted_carts, deleted_items = delete_carts(ids)
+            carts += deleted_carts
+            items += deleted_items
+        store.evict_many(ids)
+    return carts, items
+
+
+def delete_carts(cart_ids):
+    """
+    Delete carts and their items by primary key. Cart items have no
+    signals or dependent rows, so the deletion Collector removes them
+    with one DELETE ... WHERE cart_id IN (...) without loading them;
+    only the carts themselves are read. Pass bounded lists of ids.
+
+    Returns:
+    - tuple: (carts deleted, items deleted)
+    """
+    _, deleted = ShoppingCart.objects.filter(id__in=cart_ids).delete()
+    return deleted.get(ShoppingCart._meta.label, 0), deleted.get(ShoppingCartItem._meta.label, 0)
+
+
+def get_cart_store():
+    """
+    Return the process-wide cart store selected by STORE_CART_BACKEND.
+
+    Returns:
+    - DatabaseCartStore: The configured store.
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = build_cart_store(getattr(settings, 'STORE_CART_BACKEND', DEFAULT_BACKEND))
+    return _store
+
+
+def build_cart_store(backend):
+    if backend == 'database':
+        return DatabaseCartStore()
+    if backend == 'cache':
+        return CacheCartStore(
+            alias=getattr(settings, 'STORE_CART_CACHE', DEFAULT_CACHE_ALIAS),
+            flush_interval=getattr(settings, 'STORE_CART_FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL),
+            timeout=getattr(settings, 'STORE_CART_TIMEOUT', DEFAULT_CART_TIMEOUT))
+    raise ValueError(f'Unknown STORE_CART_BACKEND {backend!r}')
+
+
+def reset_cart_store():
+    """
+    Forget the configured store, e.g. after changing settings in tests.
+    """
+    global _store
+    _store = None
+
+
+@atexit.register
+def flush_on_exit():
+    if _store is not None:
+        try:
+            _store.flush_dirty()
+        except Exception:
+            logger.exception('Cart flush at exit failed')
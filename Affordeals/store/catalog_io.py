@@ -0,0 +1,226 @@
+import csv
+import json
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from .cache import bump_catalog_version
+from .counters import reconcile_product_counts
+from .models import Category, Products
+from . import search
+
+
+FIELDS = ['id', 'name', 'category', 'description', 'unit_price', 'quantity_in_stock']
+
+UPDATE_FIELDS = ['name', 'category', 'description', 'unit_price', 'quantity_in_stock', 'updated_at']
+
+FORMATS = ('csv', 'jsonl')
+
+# Rejected-row messages kept for the report; the rest are only counted.
+MAX_ERRORS = 50
+
+
+class RowError(Exception):
+    """
+    Raised for an input row that cannot be imported.
+    """
+
+
+def read_rows(stream, fmt):
+    """
+    Lazily yield (row dict, error message) pairs from a CSV or JSON Lines
+    stream; exactly one of the two is None.
+
+    Args:
+    - stream (file): A text stream.
+    - fmt (str): 'csv' or 'jsonl'.
+    """
+    if fmt == 'csv':
+        for row in csv.DictReader(stream):
+            yield row, None
+        return
+    for number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line), None
+        except ValueError as error:
+            yield None, f'line {number}: {error}'
+
+
+def export_rows(chunk_size):
+    """
+    Stream every product as a flat tuple in FIELDS order, reading the
+    table in server-side chunks without building model instances.
+
+    Args:
+    - chunk_size (int): Rows fetched per database round trip.
+    """
+    return (Products.objects.order_by('id')
+            .values_list('id', 'name', 'category__name', 'description',
+                         'unit_price', 'quantity_in_stock')
+            .iterator(chunk_size=chunk_size))
+
+
+def write_rows(stream, rows, fmt):
+    """
+    Write product tuples to a stream in CSV or JSON Lines format.
+
+    Args:
+    - stream (file): A text stream.
+    - rows (iterable): Tuples in FIELDS order.
+    - fmt (str): 'csv' or 'jsonl'.
+
+    Returns:
+    - int: The number of rows written.
+    """
+    count = 0
+    if fmt == 'csv':
+        writer = csv.writer(stream)
+        writer.writerow(FIELDS)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+        return count
+    for row in rows:
+        stream.write(json.dumps(dict(zip(FIELDS, row)), default=str))
+        stream.write('\n')
+        count += 1
+    return count
+
+
+class ProductImporter:
+    """
+    Upserts products from dict rows in fixed-size batches.
+
+    Each batch costs one lookup query for existing products, one
+    bulk_create for new rows and one INSERT ... ON CONFLICT (id) DO UPDATE
+    for existing rows, inside its own transaction. The upsert avoids the
+    per-row CASE expressions bulk_update would generate. Categories are
+    resolved by name through a map loaded once.
+
+    Attributes:
+    - key (str): 'id' or 'name', the column identifying existing products.
+    - batch_size (int): Rows per batch and per transaction.
+    - create_categories (bool): Create unknown categories instead of
+      rejecting the row.
+    - created, updated, rejected (int): Running totals.
+    - errors (list): Messages for the first max_errors rejected rows, so
+      a feed of millions of bad rows does not grow memory without bound.
+
+    Methods:
+    - run (function): Imports an iterable of rows.
+    - finish (function): Refreshes derived data bypassed by bulk writes.
+    """
+    def __init__(self, key='id', batch_size=1000, create_categories=False, max_errors=MAX_ERRORS):
+        self.key = key
+        self.batch_size = batch_size
+        self.create_categories = create_categories
+        self.max_errors = max_errors
+        self.categories = dict(Category.objects.values_list('name', 'id'))
+        self.created = 0
+        self.updated = 0
+        self.rejected = 0
+        self.errors = []
+
+    def reject(self, message):
+        self.rejected += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append(message)
+
+    def resolve_category(self, name):
+        if name in self.categories:
+            return self.categories[name]
+        if not self.create_categories:
+            raise RowError(f'unknown category {name!r}')
+        self.categories[name] = Category.objects.create(name=name).id
+        return self.categories[name]
+
+    def build(self, row):
+        try:
+            name = (row.get('name') or '').strip()
+            if not name:
+                raise RowError('name is required')
+            product = Products(
+                name=name[:100],
+                category_id=self.resolve_category((row.get('category') or '').strip()),
+                description=row.get('description') or '',
+                unit_price=self.parse(row, 'unit_price'),
+                quantity_in_stock=self.parse(row, 'quantity_in_stock', 0),
+            )
+            if self.key == 'id' and row.get('id') not in (None, ''):
+                product.id = self.parse(row, 'id')
+        except AttributeError:
+            raise RowError('expected an object per row')
+        return product
+
+    @staticmethod
+    def parse(row, field, default=None):
+        """
+        Convert and validate a value with the model field, so the row is
+        rejected here rather than failing the batch in the database: e.g.
+        a unit_price of NaN or with more digits than the column holds.
+        """
+        value = row.get(field)
+        if value in (None, ''):
+            if default is None:
+                raise RowError(f'{field} is required')
+            return default
+        try:
+            return Products._meta.get_field(field).clean(str(value).strip(), None)
+        except ValidationError as error:
+            raise RowError(f'invalid {field} {value!r}: {" ".join(error.messages)}')
+
+    def run(self, rows):
+        batch = []
+        for position, (row, error) in enumerate(rows, start=1):
+            if error:
+                self.reject(error)
+                continue
+            try:
+                batch.append(self.build(row))
+            except RowError as error:
+                self.reject(f'row {position}: {error}')
+                continue
+            if len(batch) >= self.batch_size:
+                self.write(batch)
+                batch = []
+        if batch:
+            self.write(batch)
+
+    def write(self, batch):
+        if self.key == 'id':
+            # Later rows win when the same id appears twice in a batch.
+            batch = list({product.id if product.id is not None else ('row', position): product
+                          for position, product in enumerate(batch, start=1)}.values())
+            keys = [product.id for product in batch if product.id is not None]
+            existing = set(Products.objects.filter(id__in=keys).values_list('id', flat=True))
+        else:
+            batch = list({product.name: product for product in batch}.values())
+            names = [product.name for product in batch]
+            ids = dict(Products.objects.filter(name__in=names).values_list('name', 'id'))
+            for product in batch:
+                product.id = ids.get(product.name)
+            existing = set(ids.values())
+
+        # Later rows win when the same product appears twice in a batch.
+        updates = {product.id: product for product in batch if product.id in existing}
+        creates = [product for product in batch if product.id not in existing]
+        with transaction.atomic():
+            if creates:
+                Products.objects.bulk_create(creates, batch_size=self.batch_size)
+            if updates:
+                Products.objects.bulk_create(
+                    updates.values(), batch_size=self.batch_size, update_conflicts=True,
+                    unique_fields=['id'], update_fields=UPDATE_FIELDS)
+        self.created += len(creates)
+        self.updated += len(updates)
+
+    def finish(self):
+        """
+        bulk_create/bulk_update skip model signals, so refresh the search
+        index, category counters and catalog version once at the end.
+        """
+        search.rebuild_index()
+        reconcile_product_counts()
+        bump_catalog_version()
@@ -0,0 +1,26 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.checks import Error, Tags, register
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    Refuse a per-process default cache. The catalog version, cached
+    pages and image manifests are bumped or dropped by the process that
+    changed the data (a web worker, a management command, the payment
+    worker), and every other process must see that at once or it keeps
+    answering with stale pages and 304s.
+    """
+    backend = caches['default']
+    if not isinstance(backend, (LocMemCache, DummyCache)):
+        return []
+    return [Error(
+        'The default cache is private to each process.',
+        hint='Point CACHES["default"] at a shared backend such as Redis, '
+             'Memcached, the database or the file system.',
+        obj=settings.CACHES['default']['BACKEND'],
+        id='store.E001',
+    )]
@@ -0,0 +1,78 @@
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from .cache import get_catalog_modified, get_catalog_version
+
+
+class ConditionalGetMixin:
+    """
+    Viewset mixin answering conditional GETs (If-None-Match and
+    If-Modified-Since) with 304 Not Modified before the queryset is
+    fetched or serialized.
+
+    Validators come from get_validators(), which by default runs one
+    aggregate query, max(updated_at) and count(*), over the filtered
+    queryset. The count makes the ETag change when rows are deleted.
+
+    Attributes:
+    - last_modified_field (str): The model field tracking modification time.
+
+    Methods:
+    - get_validators (function): Returns (version, last modified timestamp).
+    """
+    last_modified_field = 'updated_at'
+
+    def get_validators(self):
+        queryset = self.filter_queryset(self.get_queryset())
+        if self.action == 'retrieve':
+            lookup = self.lookup_url_kwarg or self.lookup_field
+            queryset = queryset.filter(**{self.lookup_field: self.kwargs[lookup]})
+        state = queryset.order_by().aggregate(
+            modified=Max(self.last_modified_field), count=Count('pk'))
+        modified = state['modified'].timestamp() if state['modified'] else None
+        return (state['modified'], state['count']), modified
+
+    def get_etag(self, request, version):
+        renderer = getattr(request, 'accepted_media_type', '')
+        seed = repr((version, request.get_full_path(), renderer))
+        return '"{}"'.format(hashlib.md5(seed.encode()).hexdigest())
+
+    def conditional_get(self, request, handler, *args, **kwargs):
+        version, modified = self.get_validators()
+        etag = self.get_etag(request, version)
+        modified = int(modified) if modified is not None else None
+        not_modified = get_conditional_response(request, etag=etag, last_modified=modified)
+        if not_modified is not None:
+            return not_modified
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            response['ETag'] = etag
+            if modified is not None:
+                response['Last-Modified'] = http_date(modified)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_get(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_get(request, super().retrieve, *args, **kwargs)
+
+
+class CatalogConditionalGetMixin(ConditionalGetMixin):
+    """
+    ConditionalGetMixin for product and category endpoints. The catalog
+    version and modification time live in the default cache, which every
+    process shares (see store.checks), so validating a repeat request
+    needs no database query at all, and a bump made by a management
+    command or a worker reaches every web worker.
+
+    The ETag is only as strong as that version: every write changing a
+    serialized product or category field must bump it. Model saves and
+    deletes do so through store.signals, and bulk stock UPDATEs through
+    store.stock.
+    """
+    def get_validators(self):
+        return get_catalog_version(), get_catalog_modified()
@@ -0,0 +1,52 @@
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Category, Products
+
+
+def adjust_product_count(category_id, delta):
+    """
+    Atomically shift a category's product_count with an F() update,
+    never letting it go below zero.
+
+    Args:
+    - category_id (int): The category to update.
+    - delta (int): The amount to add, negative to subtract.
+    """
+    if not category_id or not delta:
+        return
+    queryset = Category.objects.filter(pk=category_id)
+    if delta < 0:
+        queryset = queryset.filter(product_count__gte=-delta)
+    queryset.update(product_count=F('product_count') + delta)
+
+
+def actual_product_count():
+    """
+    Correlated subquery counting the products of the outer category.
+    """
+    counts = (Products.objects.filter(category=OuterRef('pk'))
+              .order_by().values('category').annotate(n=Count('id')).values('n'))
+    return Coalesce(Subquery(counts, output_field=IntegerField()), 0)
+
+
+def reconcile_product_counts(dry_run=False):
+    """
+    Find categories whose product_count drifted from the real number of
+    products and fix all of them with a single UPDATE.
+
+    Args:
+    - dry_run (bool): Only report the drift.
+
+    Returns:
+    - list: (category id, stored count, actual count) for drifted rows.
+    """
+    drifted = list(
+        Category.objects.annotate(actual=actual_product_count())
+        .filter(~Q(product_count=F('actual')))
+        .values_list('id', 'product_count', 'actual')
+    )
+    if drifted and not dry_run:
+        Category.objects.filter(pk__in=[row[0] for row in drifted]).update(
+            product_count=actual_product_count())
+    return drifted
@@ -0,0 +1,254 @@
+import hashlib
+from datetime import datetime, time
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django.db.models import BooleanField, Case, CharField, Count, ExpressionWrapper, Q, Value, When
+from rest_framework.exceptions import ValidationError
+
+from .cache import catalog_cache_key
+from .models import ShoppingOrder
+
+
+# Lower bounds of the price facet buckets; the last bucket is open ended.
+DEFAULT_PRICE_BUCKETS = (0, 25, 50, 100, 250, 500, 1000)
+
+DEFAULT_FACET_CACHE_TIMEOUT = 300
+
+PRODUCT_ORDERINGS = {
+    'category': ('category_id', 'id'),
+    'price': ('unit_price', 'id'),
+    '-price': ('-unit_price', '-id'),
+}
+
+
+def price_buckets():
+    return tuple(getattr(settings, 'STORE_PRICE_BUCKETS', DEFAULT_PRICE_BUCKETS))
+
+
+def bucket_label(lower, upper=None):
+    return f'{lower}+' if upper is None else f'{lower}-{upper}'
+
+
+class ProductFilter:
+    """
+    Parses and applies the catalog filter query parameters.
+
+    Query parameters:
+    - category: One or more category ids, comma separated.
+    - min_price / max_price: Inclusive unit_price bounds.
+    - in_stock: 'true' to keep only products with quantity_in_stock > 0.
+    - ordering: One of PRODUCT_ORDERINGS, 'category' by default.
+
+    Attributes:
+    - categories (list): Selected category ids.
+    - min_price (Decimal): Lower price bound, or None.
+    - max_price (Decimal): Upper price bound, or None.
+    - in_stock (bool): Whether to drop sold out products.
+    - ordering (str): The selected ordering key.
+
+    Methods:
+    - filter_queryset (function): Applies the filters to a queryset.
+    - ordering_fields (function): Returns the keyset ordering fields.
+    - cache_key (function): Returns a stable key for the filter values.
+    """
+    def __init__(self, params):
+        self.categories = self.parse_categories(params.get('category'))
+        self.min_price = self.parse_price(params, 'min_price')
+        self.max_price = self.parse_price(params, 'max_price')
+        self.in_stock = params.get('in_stock', '').lower() in ('1', 'true')
+        self.ordering = params.get('ordering') or 'category'
+        if self.ordering not in PRODUCT_ORDERINGS:
+            raise ValidationError({'ordering': f'Choose one of {", ".join(PRODUCT_ORDERINGS)}.'})
+        if self.min_price is not None and self.max_price is not None \
+                and self.min_price > self.max_price:
+            raise ValidationError({'min_price': 'min_price cannot exceed max_price.'})
+
+    @staticmethod
+    def parse_categories(value):
+        if not value:
+            return []
+        try:
+            return sorted({int(item) for item in value.split(',') if item.strip()})
+        except ValueError:
+            raise ValidationError({'category': 'Expected comma separated category ids.'})
+
+    @staticmethod
+    def parse_price(params, name):
+        value = params.get(name)
+        if value in (None, ''):
+            return None
+        try:
+            price = Decimal(value)
+        except InvalidOperation:
+            raise ValidationError({name: 'Expected a decimal number.'})
+        if not price.is_finite() or price < 0:
+            raise ValidationError({name: 'Expected a non-negative decimal number.'})
+        return price
+
+    def price_q(self):
+        """
+        Returns:
+        - Q: The min_price / max_price bounds, empty when unset.
+        """
+        bounds = Q()
+        if self.min_price is not None:
+            bounds &= Q(unit_price__gte=self.min_price)
+        if self.max_price is not None:
+            bounds &= Q(unit_price__lte=self.max_price)
+        return bounds
+
+    def filter_queryset(self, queryset, exclude=()):
+        """
+        Apply the filters, except those named in exclude: 'category'
+        and/or 'price', so a facet can be counted without its own filter.
+        """
+        if self.categories and 'category' not in exclude:
+            queryset = queryset.filter(category_id__in=self.categories)
+        if 'price' not in exclude:
+            queryset = queryset.filter(self.price_q())
+        if self.in_stock:
+            queryset = queryset.filter(quantity_in_stock__gt=0)
+        return queryset
+
+    def ordering_fields(self):
+        return PRODUCT_ORDERINGS[self.ordering]
+
+    def cache_key(self):
+        raw = repr((self.categories, self.min_price, self.max_price, self.in_stock))
+        return hashlib.md5(raw.encode()).hexdigest()
+
+
+def price_bucket_expression():
+    """
+    Build a CASE expression labelling each row with its price bucket.
+    """
+    bounds = price_buckets()
+    whens = []
+    for lower, upper in zip(bounds, bounds[1:]):
+        whens.append(When(unit_price__lt=upper, then=Value(bucket_label(lower, upper))))
+    return Case(*whens, default=Value(bucket_label(bounds[-1])), output_field=CharField())
+
+
+def compute_facets(queryset, product_filter):
+    """
+    Compute per-category and per-price-bucket counts with a single
+    GROUP BY (category, bucket) query. Each facet is counted with every
+    filter but its own, so selecting a category still shows the counts
+    of the other categories: the query skips the category and price
+    filters, and labels each row with whether it is inside the price
+    bounds, which the category counts then keep.
+
+    Args:
+    - queryset (QuerySet): The unfiltered Products queryset.
+    - product_filter (ProductFilter): The current filters.
+
+    Returns:
+    - dict: {'categories': [{'id', 'count'}], 'price': [{'bucket', 'count'}]}
+    """
+    price_bounds = product_filter.price_q()
+    in_price = Case(When(price_bounds, then=Value(True)), default=Value(False)) if price_bounds else Value(True)
+    rows = (product_filter.filter_queryset(queryset, exclude=('category', 'price')).order_by()
+            .annotate(bucket=price_bucket_expression(), in_price=ExpressionWrapper(in_price, BooleanField()))
+            .values_list('category_id', 'bucket', 'in_price')
+            .annotate(count=Count('id')))
+
+    selected = set(product_filter.categories)
+    categories = {}
+    buckets = {}
+    for category_id, bucket, in_price, count in rows:
+        if in_price:
+            categories[category_id] = categories.get(category_id, 0) + count
+        if not selected or category_id in selected:
+            buckets[bucket] = buckets.get(bucket, 0) + count
+
+    bounds = price_buckets()
+    labels = [bucket_label(lower, upper) for lower, upper in zip(bounds, bounds[1:])]
+    labels.append(bucket_label(bounds[-1]))
+    return {
+        'categories': [{'id': pk, 'count': categories[pk]} for pk in sorted(categories)],
+        'price': [{'bucket': label, 'count': buckets.get(label, 0)} for label in labels],
+    }
+
+
+def cached_facets(queryset, product_filter):
+    """
+    Return compute_facets() for a filter, cached per filter values and
+    catalog version so product writes invalidate it.
+
+    Args:
+    - queryset (QuerySet): The unfiltered Products queryset.
+    - product_filter (ProductFilter): The current filters.
+
+    Returns:
+    - dict: The facet counts.
+    """
+    timeout = getattr(settings, 'STORE_FACET_CACHE_TIMEOUT', DEFAULT_FACET_CACHE_TIMEOUT)
+    key = catalog_cache_key('facets', product_filter.cache_key())
+    return cache.get_or_set(key, lambda: compute_facets(queryset, product_filter), timeout)
+
+
+class OrderFilter:
+    """
+    Parses and applies the order history filter query parameters.
+
+    Query parameters:
+    - payment_status: One or more of P, C and F, comma separated.
+    - created_after: ISO 8601 date or datetime; keeps orders created at
+      or after it.
+    - created_before: ISO 8601 date or datetime; keeps orders created
+      strictly before it, so a date excludes that whole day.
+
+    Dates without a time mean midnight and naive values are read in the
+    current time zone.
+
+    Attributes:
+    - statuses (list): Selected payment statuses.
+    - created_after (datetime): Inclusive lower bound, or None.
+    - created_before (datetime): Exclusive upper bound, or None.
+
+    Methods:
+    - filter_queryset (function): Applies the filters to a queryset.
+    """
+    def __init__(self, params):
+        valid = {status for status, _ in ShoppingOrder.PAYMENT_STATUS_CHOICES}
+        value = params.get('payment_status') or ''
+        self.statuses = sorted({status.strip().upper() for status in value.split(',') if status.strip()})
+        if set(self.statuses) - valid:
+            raise ValidationError({'payment_status': f'Choose from {", ".join(sorted(valid))}.'})
+        self.created_after = self.parse_moment(params, 'created_after')
+        self.created_before = self.parse_moment(params, 'created_before')
+
+    @staticmethod
+    def parse_moment(params, name):
+        value = params.get(name)
+        if not value:
+            return None
+        try:
+            moment = parse_datetime(value)
+            if moment is None:
+                day = parse_date(value)
+                moment = datetime.combine(day, time.min) if day else None
+        except ValueError:
+            moment = None
+        if moment is None:
+            raise ValidationError({name: 'Expected an ISO 8601 date or datetime.'})
+        if timezone.is_naive(moment):
+            moment = timezone.make_aware(moment)
+        return moment
+
+    def filter_queryset(self, queryset, prefix=''):
+        """
+        Apply the filters; prefix points at the order from a related
+        model, e.g. 'order__' for order items.
+        """
+        if self.statuses:
+            queryset = queryset.filter(**{f'{prefix}payment_status__in': self.statuses})
+        if self.created_after is not None:
+            queryset = queryset.filter(**{f'{prefix}created_at__gte': self.created_after})
+        if self.created_before is not None:
+            queryset = queryset.filter(**{f'{prefix}created_at__lt': self.created_before})
+        return queryset
@@ -0,0 +1,219 @@
+import hashlib
+import json
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse
+from django.utils import timezone
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import IdempotencyKey
+
+
+HEADER = 'HTTP_IDEMPOTENCY_KEY'
+# HTML links and forms cannot set headers, so they pass the key as a parameter.
+PARAM = 'idempotency_key'
+MAX_KEY_LENGTH = 255
+REPLAY_HEADER = 'Idempotent-Replayed'
+STORED_HEADERS = ('Content-Type', 'Location')
+CACHE_KEY = 'idempotency:{}'
+
+DEFAULT_TTL = 24 * 3600
+# A request still marked in progress after this many seconds is assumed
+# to have died and may be run again.
+DEFAULT_LOCK_TIMEOUT = 60
+
+RUN, REPLAY, IN_PROGRESS, MISMATCH = 'run', 'replay', 'in progress', 'mismatch'
+
+ERRORS = {
+    IN_PROGRESS: (409, 'A request with this Idempotency-Key is still being processed.'),
+    MISMATCH: (422, 'This Idempotency-Key was already used for a different request.'),
+}
+
+
+def key_ttl():
+    return getattr(settings, 'STORE_IDEMPOTENCY_TTL', DEFAULT_TTL)
+
+
+def request_key(request):
+    return request.META.get(HEADER) or request.GET.get(PARAM) or None
+
+
+def fingerprint(*parts):
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def cache_key(user_id, scope, key):
+    return CACHE_KEY.format(fingerprint(user_id, scope, key))
+
+
+def record_of(row):
+    return {
+        'fingerprint': row.fingerprint,
+        'status_code': row.status_code,
+        'body': row.response_body,
+        'headers': row.response_headers,
+    }
+
+
+def claim(user_id, scope, key, digest):
+    """
+    Look the key up, in the cache first, and claim it if it is new.
+
+    Returns:
+    - tuple: (RUN, IdempotencyKey row to complete), (REPLAY, stored
+      record), or (IN_PROGRESS or MISMATCH, None).
+    """
+    record = cache.get(cache_key(user_id, scope, key))
+    if record is not None:
+        return (REPLAY, record) if record['fingerprint'] == digest else (MISMATCH, None)
+
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            return RUN, IdempotencyKey.objects.create(
+                user_id=user_id, scope=scope, key=key, fingerprint=digest,
+                expires_at=now + timedelta(seconds=key_ttl()))
+    except IntegrityError:
+        row = IdempotencyKey.objects.filter(user_id=user_id, scope=scope, key=key).first()
+    if row is None:
+        # Purged between the insert and the lookup.
+        return claim(user_id, scope, key, digest)
+    if row.fingerprint != digest:
+        return MISMATCH, None
+    if row.status_code is not None:
+        cache.set(cache_key(user_id, scope, key), record_of(row), key_ttl())
+        return REPLAY, record_of(row)
+    lock_timeout = getattr(settings, 'STORE_IDEMPOTENCY_LOCK_TIMEOUT', DEFAULT_LOCK_TIMEOUT)
+    if row.created_at < now - timedelta(seconds=lock_timeout):
+        taken = IdempotencyKey.objects.filter(
+            pk=row.pk, status_code__isnull=True, created_at=row.created_at).update(created_at=now)
+        if taken:
+            return RUN, row
+    return IN_PROGRESS, None
+
+
+def complete(row, status_code, body, headers):
+    """
+    Store the response of a claimed key, in the table and the cache.
+    Server errors are not stored, so the client can retry them.
+    """
+    if status_code >= 500:
+        abort(row)
+        return
+    row.status_code = status_code
+    row.response_body = body
+    row.response_headers = headers
+    row.save(update_fields=['status_code', 'response_body', 'response_headers'])
+    cache.set(cache_key(row.user_id, row.scope, row.key), record_of(row), key_ttl())
+
+
+def abort(row):
+    IdempotencyKey.objects.filter(pk=row.pk).delete()
+
+
+def idempotent_action(scope):
+    """
+    Make a DRF view method idempotent for requests carrying an
+    Idempotency-Key header: the first response is stored and returned
+    as is to every retry with the same key and body, without calling the
+    method again. Requests without a key are not affected.
+
+    Args:
+    - scope (str): Names the endpoint; keys are unique per user and scope.
+    """
+    def decorate(method):
+        @wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            key = request_key(request)
+            if key is None or not request.user.is_authenticated:
+                return method(self, request, *args, **kwargs)
+            if len(key) > MAX_KEY_LENGTH:
+                return Response({'detail': f'Idempotency-Key is limited to {MAX_KEY_LENGTH} characters.'},
+                                status=400)
+            outcome, value = claim(request.user.id, scope, key,
+                                   fingerprint(request.method, request.path, request.data))
+            if outcome == REPLAY:
+                return Response(json.loads(value['body']), status=value['status_code'],
+                                headers={REPLAY_HEADER: 'true'})
+            if outcome != RUN:
+                status, detail = ERRORS[outcome]
+                return Response({'detail': detail}, status=status)
+            try:
+                response = method(self, request, *args, **kwargs)
+            except Exception:
+                abort(value)
+                raise
+            complete(value, response.status_code, json.dumps(response.data, cls=JSONEncoder),
+                     {'Content-Type': 'application/json'})
+            return response
+        return wrapper
+    return decorate
+
+
+def idempotent_view(scope):
+    """
+    idempotent_action() for plain Django views, keyed by the
+    Idempotency-Key header or the idempotency_key query parameter. The
+    rendered response content and its Location header are stored.
+
+    Args:
+    - scope (str): Names the endpoint; keys are unique per user and scope.
+    """
+    def decorate(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            key = request_key(request)
+            if key is None or not request.user.is_authenticated:
+                return view(request, *args, **kwargs)
+            if len(key) > MAX_KEY_LENGTH:
+                return HttpResponse(f'Idempotency-Key is limited to {MAX_KEY_LENGTH} characters.', status=400)
+            query = sorted((name, value) for name, value in request.GET.lists() if name != PARAM)
+            outcome, value = claim(request.user.id, scope, key,
+                                   fingerprint(request.method, request.path, query, request.body.decode('latin-1')))
+            if outcome == REPLAY:
+                response = HttpResponse(value['body'], status=value['status_code'], headers=value['headers'])
+                response[REPLAY_HEADER] = 'true'
+                return response
+            if outcome != RUN:
+                status, detail = ERRORS[outcome]
+                return HttpResponse(detail, status=status)
+            try:
+                response = view(request, *args, **kwargs)
+                if hasattr(response, 'render') and not getattr(response, 'is_rendered', True):
+                    response.render()
+            except Exception:
+                abort(value)
+                raise
+            if response.streaming:
+                abort(value)
+                return response
+            complete(value, response.status_code,
+                     response.content.decode(response.charset or 'utf-8', 'replace'),
+                     {name: response[name] for name in STORED_HEADERS if name in response})
+            return response
+        return wrapper
+    return decorate
+
+
+def purge_expired_keys(now=None, chunk_size=1000):
+    """
+    Delete expired keys in chunks of ids. Nothing references a key and
+    no signals are connected, so each chunk is one fast DELETE that does
+    not load the rows. Their cache entries expire on their own.
+
+    Returns:
+    - int: The number of keys deleted.
+    """
+    now = now or timezone.now()
+    deleted = 0
+    while True:
+        ids = list(IdempotencyKey.objects.filter(expires_at__lt=now)
+                   .order_by('expires_at').values_list('id', flat=True)[:chunk_size])
+        if not ids:
+            return deleted
+        deleted += IdempotencyKey.objects.filter(id__in=ids).delete()[0]
@@ -0,0 +1,201 @@
+import functools
+import hashlib
+import logging
+import os
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+
+from main.workers import submit
+from .cache import bump_catalog_version
+
+
+logger = logging.getLogger(__name__)
+
+# name -> (width, height) of the fixed-size derivatives
+DEFAULT_SIZES = {
+    'thumb': (300, 300),
+    'card': (600, 600),
+}
+
+# Preferred formats first; formats Pillow cannot encode are skipped.
+DEFAULT_FORMATS = ('avif', 'webp', 'jpeg')
+
+FORMAT_QUALITY = {'avif': 60, 'webp': 80, 'jpeg': 85}
+
+MIME_TYPES = {'avif': 'image/avif', 'webp': 'image/webp', 'jpeg': 'image/jpeg'}
+
+MANIFEST_KEY = 'images:manifest:{}'
+# Seconds a manifest is trusted; generating derivatives refreshes it at once.
+DEFAULT_MANIFEST_TIMEOUT = 24 * 3600
+
+def derivative_sizes():
+    return dict(getattr(settings, 'STORE_IMAGE_SIZES', DEFAULT_SIZES))
+
+
+def derivative_formats():
+    """
+    Return the configured derivative formats this Pillow build can write.
+    """
+    return supported_formats(tuple(getattr(settings, 'STORE_IMAGE_FORMATS', DEFAULT_FORMATS)))
+
+
+@functools.lru_cache
+def supported_formats(formats):
+    from PIL import features
+    return tuple(fmt for fmt in formats if fmt == 'jpeg' or features.check(fmt))
+
+
+def derivative_name(name, size, fmt):
+    """
+    Return the storage name of a derivative, stored next to the original:
+    media/canon.jpeg -> media/canon.thumb.webp
+
+    Args:
+    - name (str): The storage name of the original image.
+    - size (str): The derivative size name.
+    - fmt (str): The derivative format.
+
+    Returns:
+    - str: The derivative storage name.
+    """
+    root, _ = os.path.splitext(name)
+    ext = 'jpg' if fmt == 'jpeg' else fmt
+    return f'{root}.{size}.{ext}'
+
+
+def build_derivatives(path, sizes, formats, force=False):
+    """
+    Generate every derivative of one original image. Runs inside the
+    worker processes, so it only deals with plain paths and Pillow.
+
+    The original is decoded once per call; outputs newer than the
+    original are left alone unless force is set, and each file is written
+    to a temporary name first so readers never see a partial image.
+
+    Args:
+    - path (str): Filesystem path of the original image.
+    - sizes (dict): name -> (width, height).
+    - formats (tuple): Formats to write.
+    - force (bool): Rebuild derivatives that are already up to date.
+
+    Returns:
+    - int: The number of derivatives written.
+    """
+    from PIL import Image, ImageOps
+
+    source_mtime = os.path.getmtime(path)
+    pending = []
+    for size, box in sizes.items():
+        for fmt in formats:
+            target = derivative_name(path, size, fmt)
+            if force or not os.path.exists(target) or os.path.getmtime(target) < source_mtime:
+                pending.append((size, box, fmt, target))
+    if not pending:
+        return 0
+
+    with Image.open(path) as original:
+        original = ImageOps.exif_transpose(original)
+        if original.mode not in ('RGB', 'RGBA'):
+            original = original.convert('RGBA' if 'transparency' in original.info else 'RGB')
+        resized = {}
+        for size, box, fmt, target in pending:
+            if size not in resized:
+                resized[size] = ImageOps.fit(original, box, Image.Resampling.LANCZOS)
+            image = resized[size]
+            if fmt == 'jpeg' and image.mode != 'RGB':
+                image = image.convert('RGB')
+            temporary = f'{target}.tmp'
+            image.save(temporary, format=fmt.upper(), quality=FORMAT_QUALITY.get(fmt, 80))
+            os.replace(temporary, target)
+    return len(pending)
+
+
+def local_path(name):
+    try:
+        return default_storage.path(name)
+    except NotImplementedError:
+        return None
+
+
+def finish_job(name, future):
+    if future.exception() is not None:
+        logger.error('Image derivative generation failed', exc_info=future.exception())
+    elif future.result():
+        # New variants change rendered pages and API payloads.
+        forget_manifest(name)
+        bump_catalog_version()
+
+
+def schedule_derivatives(name, force=False):
+    """
+    Queue derivative generation for an image on the worker pool and
+    return immediately.
+
+    Args:
+    - name (str): The storage name of the original image.
+    - force (bool): Rebuild derivatives that are already up to date.
+
+    Returns:
+    - Future: The pending job, or None if the storage is not local.
+    """
+    path = local_path(name)
+    if not path:
+        return None
+    future = submit(build_derivatives, path, derivative_sizes(), derivative_formats(), force)
+    future.add_done_callback(functools.partial(finish_job, name))
+    return future
+
+
+def manifest_key(name):
+    return MANIFEST_KEY.format(hashlib.md5(name.encode()).hexdigest())
+
+
+def forget_manifest(name):
+    cache.delete(manifest_key(name))
+
+
+def derivative_manifest(name):
+    """
+    Return the URLs of every generated derivative of an image. The
+    storage is only probed on a cache miss, so rendering a page does not
+    stat each size and format of each image. The manifest lives in the
+    shared default cache and is dropped by whichever process saw the
+    derivatives written (the one that scheduled the job, or the
+    generate_image_derivatives command), so every process picks up the
+    new variants at once.
+
+    Args:
+    - name (str): The storage name of the original image.
+
+    Returns:
+    - dict: size -> {format: URL}, in order of preference.
+    """
+    key = manifest_key(name)
+    manifest = cache.get(key)
+    if manifest is None:
+        manifest = {}
+        for size in derivative_sizes():
+            manifest[size] = {}
+            for fmt in derivative_formats():
+                variant = derivative_name(name, size, fmt)
+                if default_storage.exists(variant):
+                    manifest[size][fmt] = default_storage.url(variant)
+        cache.set(key, manifest, getattr(settings, 'STORE_IMAGE_MANIFEST_TIMEOUT', DEFAULT_MANIFEST_TIMEOUT))
+    return manifest
+
+
+def derivative_urls(name, size):
+    """
+    Return the URLs of the derivatives that exist for an image and size,
+    in order of preference.
+
+    Args:
+    - name (str): The storage name of the original image.
+    - size (str): The derivative size name.
+
+    Returns:
+    - dict: format -> URL, only for derivatives already generated.
+    """
+    return dict(derivative_manifest(name).get(size, {}))
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from store.benchmarks import SCENARIOS, benchmark_database
+
+
+class Command(BaseCommand):
+    """
+    Run a performance scenario from store.benchmarks against a throwaway,
+    freshly migrated database. The configured database is never touched.
+
+    Usage:
+    - python manage.py benchmark --list
+    - python manage.py benchmark cart-add --threads 16 --operations 50
+    """
+    help = 'Run a store benchmark scenario on a throwaway database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenario', nargs='?', help='The scenario to run.')
+        parser.add_argument('--list', action='store_true', help='List the available scenarios.')
+        parser.add_argument('--threads', type=int, default=8, help='Concurrent threads.')
+        parser.add_argument('--operations', type=int, default=50,
+                            help='Operations per thread, or per size for sized scenarios.')
+
+    def handle(self, *args, **options):
+        if options['list'] or not options['scenario']:
+            for name, (_, description) in sorted(SCENARIOS.items()):
+                self.stdout.write(f'{name:<20} {description}')
+            return
+        if options['scenario'] not in SCENARIOS:
+            raise CommandError(f"Unknown scenario {options['scenario']!r}, see --list.")
+        func, description = SCENARIOS[options['scenario']]
+        self.stdout.write(self.style.MIGRATE_HEADING(f"{options['scenario']}: {description}"))
+
+        def report(label, **values):
+            parts = []
+            for key, value in values.items():
+                parts.append(f'{key}={value:.2f}' if isinstance(value, float) else f'{key}={value}')
+            self.stdout.write(f'  {label:<28} ' + ' '.join(parts))
+
+        with benchmark_database():
+            func(options, report)
@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from store.webhooks import apply_events
+
+
+class Command(BaseCommand):
+    """
+    Apply payment webhook events from the PaymentEvent inbox to orders in
+    batches, see store.webhooks. Runs until interrupted, or drains the
+    inbox and exits with --once.
+
+    Usage:
+    - python manage.py consume_payment_events [--batch-size N] [--poll-interval S] [--once]
+    """
+    help = 'Apply received payment events to orders in batches.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Events applied per transaction.')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to sleep when the inbox is empty.')
+        parser.add_argument('--once', action='store_true',
+                            help='Drain the inbox and exit.')
+
+    def handle(self, *args, **options):
+        processed = 0
+        try:
+            while True:
+                close_old_connections()
+                applied = apply_events(options['batch_size'])
+                processed += applied
+                if options['once'] and not applied:
+                    break
+                if not applied:
+                    time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f'Processed {processed} payment events.'))
@@ -0,0 +1,50 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from main.workers import submit
+from store.cache import bump_catalog_version
+from store.images import build_derivatives, derivative_formats, derivative_sizes, forget_manifest, local_path
+from store.models import Products
+
+
+class Command(BaseCommand):
+    """
+    Backfill thumbnails and WebP/AVIF variants for existing product images
+    using the image worker process pool.
+
+    Usage:
+    - python manage.py generate_image_derivatives [--force]
+    """
+    help = 'Generate missing image derivatives for every product image.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help='Rebuild derivatives that are already up to date.')
+
+    def handle(self, *args, **options):
+        names = (Products.objects.exclude(image='').exclude(image__isnull=True)
+                 .values_list('image', flat=True).distinct().iterator(chunk_size=500))
+        images = [(name, path) for name, path in ((name, local_path(name)) for name in names) if path]
+        sizes, formats = derivative_sizes(), derivative_formats()
+
+        started = time.perf_counter()
+        written = failed = 0
+        futures = [submit(build_derivatives, path, sizes, formats, options['force'])
+                   for _, path in images]
+        for (name, path), future in zip(images, futures):
+            try:
+                count = future.result()
+            except Exception as error:
+                failed += 1
+                self.stderr.write(f'{path}: {error}')
+                continue
+            if count:
+                written += count
+                forget_manifest(name)
+        if written:
+            bump_catalog_version()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Processed {len(images)} images, wrote {written} derivatives, '
+            f'{failed} failed in {elapsed:.2f}s.'))
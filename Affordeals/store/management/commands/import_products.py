@@ -0,0 +1,60 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from store.catalog_io import FORMATS, ProductImporter, read_rows
+
+
+class Command(BaseCommand):
+    """
+    Stream a CSV or JSON Lines product feed into the catalog in constant
+    memory, upserting in batches.
+
+    Columns: id (optional), name, category, description, unit_price,
+    quantity_in_stock. Categories are matched by name.
+
+    Usage:
+    - python manage.py import_products products.csv
+    - python manage.py import_products - --format jsonl --key name < feed.jsonl
+    """
+    help = 'Bulk upsert products from a CSV or JSON Lines file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Input file, or '-' for stdin.")
+        parser.add_argument('--format', choices=FORMATS,
+                            help='Input format, guessed from the file extension by default.')
+        parser.add_argument('--key', choices=['id', 'name'], default='id',
+                            help='Column identifying existing products.')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Rows per bulk write and transaction.')
+        parser.add_argument('--create-categories', action='store_true',
+                            help='Create unknown categories instead of rejecting the row.')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive.')
+
+        importer = ProductImporter(key=options['key'], batch_size=options['batch_size'],
+                                   create_categories=options['create_categories'])
+        started = time.perf_counter()
+        stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        try:
+            importer.run(read_rows(stream, fmt))
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+        importer.finish()
+        elapsed = time.perf_counter() - started
+
+        for error in importer.errors:
+            self.stderr.write(error)
+        if importer.rejected > len(importer.errors):
+            self.stderr.write(f'... and {importer.rejected - len(importer.errors)} more rejected rows.')
+        total = importer.created + importer.updated
+        rate = total / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {total} products ({importer.created} created, {importer.updated} updated, '
+            f'{importer.rejected} rejected) in {elapsed:.2f}s, {rate:.0f} rows/s.'))
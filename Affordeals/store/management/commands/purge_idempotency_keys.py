@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from store.idempotency import purge_expired_keys
+
+
+class Command(BaseCommand):
+    """
+    Delete idempotency keys past their STORE_IDEMPOTENCY_TTL. Meant to
+    run hourly or daily from cron or a periodic task runner.
+
+    Usage:
+    - python manage.py purge_idempotency_keys [--chunk-size N]
+    """
+    help = 'Delete expired idempotency keys.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Keys deleted per statement.')
+
+    def handle(self, *args, **options):
+        deleted = purge_expired_keys(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} expired idempotency keys.'))
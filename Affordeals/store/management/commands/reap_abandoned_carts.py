@@ -0,0 +1,42 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from store.carts import reap_abandoned_carts
+
+
+DEFAULT_CART_TTL_DAYS = 30
+
+
+class Command(BaseCommand):
+    """
+    Delete shopping carts that were never turned into an order. Safe to
+    run from cron or any periodic task runner: each chunk is its own
+    short transaction, so an interrupted run simply resumes next time.
+
+    Usage:
+    - python manage.py reap_abandoned_carts [--ttl-days N] [--chunk-size N] [--dry-run]
+    """
+    help = 'Delete carts older than a TTL, with their items, in bounded chunks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ttl-days', type=float,
+                            default=getattr(settings, 'STORE_CART_TTL_DAYS', DEFAULT_CART_TTL_DAYS),
+                            help='Delete carts created more than this many days ago '
+                                 '(default: STORE_CART_TTL_DAYS or 30).')
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Carts deleted per transaction.')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Count the expired carts without deleting them.')
+
+    def handle(self, *args, **options):
+        if options['ttl_days'] <= 0 or options['chunk_size'] <= 0:
+            raise CommandError('--ttl-days and --chunk-size must be positive.')
+        cutoff = timezone.now() - timedelta(days=options['ttl_days'])
+        carts, items = reap_abandoned_carts(cutoff, options['chunk_size'], options['dry_run'])
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'Found {carts} carts created before {cutoff:%Y-%m-%d %H:%M}.'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Deleted {carts} carts and {items} cart items.'))
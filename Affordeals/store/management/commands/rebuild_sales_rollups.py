@@ -0,0 +1,27 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand
+
+from store.analytics import rebuild_rollups
+
+
+class Command(BaseCommand):
+    """
+    Recompute the daily sales rollups from completed orders, for the
+    history before the rollups existed or after fixing data by hand.
+
+    Usage:
+    - python manage.py rebuild_sales_rollups [--since YYYY-MM-DD] [--batch-size N]
+    """
+    help = 'Rebuild the daily product and category sales rollups.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', type=date.fromisoformat,
+                            help='Only rebuild the days from this one on.')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Rows per INSERT.')
+
+    def handle(self, *args, **options):
+        written = rebuild_rollups(since=options['since'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            ', '.join(f'{name}: {rows} rows' for name, rows in written.items())))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from store.counters import reconcile_product_counts
+
+
+class Command(BaseCommand):
+    """
+    Repair drift in the denormalized Category.product_count column,
+    e.g. after bulk_create/bulk_update imports that bypass signals.
+
+    Usage:
+    - python manage.py reconcile_category_counts [--dry-run]
+    """
+    help = 'Recompute Category.product_count for categories that drifted.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report drifted categories without fixing them.')
+
+    def handle(self, *args, **options):
+        drifted = reconcile_product_counts(dry_run=options['dry_run'])
+        for category_id, stored, actual in drifted:
+            self.stdout.write(f'Category {category_id}: stored {stored}, actual {actual}')
+        verb = 'Found' if options['dry_run'] else 'Fixed'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {len(drifted)} drifted categories.'))
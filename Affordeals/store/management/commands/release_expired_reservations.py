@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from store.stock import release_expired_reservations
+
+
+class Command(BaseCommand):
+    """
+    Fail unpaid orders whose stock reservation expired and put the units
+    back on sale. Meant to run every minute or so from cron or a
+    periodic task runner.
+
+    Usage:
+    - python manage.py release_expired_reservations [--chunk-size N]
+    """
+    help = 'Release stock held by pending orders whose reservation expired.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='Orders handled per transaction.')
+
+    def handle(self, *args, **options):
+        failed, released = release_expired_reservations(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Failed {failed} expired orders and released {released} units.'))
@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from store.payments import run_pending
+
+
+class Command(BaseCommand):
+    """
+    Run queued payment jobs, see store.payments. Start one or more next
+    to the web server, e.g. under systemd or supervisor; several workers
+    never run the same job.
+
+    Usage:
+    - python manage.py run_payment_worker [--batch-size N] [--poll-interval S] [--once]
+    """
+    help = 'Run queued payment jobs until interrupted.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10,
+                            help='Jobs claimed per poll.')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to sleep when no job is due.')
+        parser.add_argument('--once', action='store_true',
+                            help='Run the due jobs and exit.')
+
+    def handle(self, *args, **options):
+        processed = 0
+        try:
+            while True:
+                close_old_connections()
+                ran = run_pending(options['batch_size'])
+                processed += ran
+                if options['once'] and not ran:
+                    break
+                if not ran:
+                    time.sleep(options['poll_interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f'Ran {processed} payment jobs.'))
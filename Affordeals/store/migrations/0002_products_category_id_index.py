@@ -0,0 +1,17 @@
+# Generated by Django 5.2.3 on 2026-10-18 16:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='products',
+            index=models.Index(fields=['category', 'id'], name='store_products_cat_id_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS store_products_fts "
+            "USING fts5(name, description, category, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+        cursor.execute(
+            'INSERT INTO store_products_fts (rowid, name, description, category) '
+            'SELECT p.id, p.name, p.description, c.name '
+            'FROM store_products p JOIN store_category c ON c.id = p.category_id'
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('DROP TABLE IF EXISTS store_products_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0002_products_category_id_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
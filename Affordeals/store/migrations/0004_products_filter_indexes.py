@@ -0,0 +1,25 @@
+# Generated by Django 5.2.3 on 2026-10-18 16:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0003_products_search_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='products',
+            index=models.Index(fields=['category', 'unit_price'], name='store_products_cat_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='products',
+            index=models.Index(fields=['unit_price', 'id'], name='store_products_price_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='products',
+            index=models.Index(condition=models.Q(('quantity_in_stock__gt', 0)), fields=['category', 'unit_price'], name='store_products_instock_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.3 on 2026-10-18 16:06
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_product_count(apps, schema_editor):
+    Category = apps.get_model('store', 'Category')
+    Products = apps.get_model('store', 'Products')
+    counts = (Products.objects.filter(category=OuterRef('pk'))
+              .order_by().values('category').annotate(n=Count('id')).values('n'))
+    Category.objects.update(
+        product_count=Coalesce(Subquery(counts, output_field=IntegerField()), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0004_products_filter_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='product_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_product_count, migrations.RunPython.noop),
+    ]
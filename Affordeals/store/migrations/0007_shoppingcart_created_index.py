@@ -0,0 +1,17 @@
+# Generated by Django 5.2.3 on 2026-10-18 16:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0006_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='shoppingcart',
+            index=models.Index(fields=['created_at'], name='store_cart_created_idx'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.3 on 2026-10-18 16:25
+
+from django.db import migrations, models
+from django.db.models import DecimalField, F, OuterRef, PositiveIntegerField, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_order_totals(apps, schema_editor):
+    ShoppingOrder = apps.get_model('store', 'ShoppingOrder')
+    ShoppingOrderItem = apps.get_model('store', 'ShoppingOrderItem')
+    money = DecimalField(max_digits=12, decimal_places=2)
+    ShoppingOrderItem.objects.update(
+        line_total=Coalesce(F('unit_price') * F('quantity'), Value(0), output_field=money))
+    items = ShoppingOrderItem.objects.filter(order=OuterRef('pk')).order_by().values('order')
+    ShoppingOrder.objects.update(
+        total_amount=Coalesce(
+            Subquery(items.annotate(total=Sum('line_total')).values('total'), output_field=money),
+            Value(0, output_field=money)),
+        item_count=Coalesce(
+            Subquery(items.annotate(units=Sum('quantity')).values('units'),
+                     output_field=PositiveIntegerField()),
+            Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0008_stockreservation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shoppingorder',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='shoppingorder',
+            name='total_amount',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='shoppingorderitem',
+            name='line_total',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12),
+        ),
+        migrations.RunPython(backfill_order_totals, migrations.RunPython.noop),
+    ]
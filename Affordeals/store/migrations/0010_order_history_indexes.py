@@ -0,0 +1,23 @@
+# Generated by Django 5.2.3 on 2026-10-18 16:26
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0009_order_totals'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='shoppingorder',
+            index=models.Index(fields=['siteuser', 'created_at'], name='store_order_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='shoppingorder',
+            index=models.Index(fields=['payment_status', 'created_at'], name='store_order_status_created_idx'),
+        ),
+    ]
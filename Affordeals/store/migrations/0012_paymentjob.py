@@ -0,0 +1,37 @@
+# Generated by Django 5.2.3 on 2026-10-18 16:33
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0011_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('provider', models.CharField(max_length=50)),
+                ('status', models.CharField(choices=[('Q', 'Queued'), ('R', 'Running'), ('S', 'Succeeded'), ('F', 'Failed')], default='Q', max_length=1)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('run_after', models.DateTimeField(default=django.utils.timezone.now)),
+                ('locked_until', models.DateTimeField(blank=True, null=True)),
+                ('worker', models.CharField(blank=True, max_length=64)),
+                ('payment_url', models.CharField(blank=True, max_length=500)),
+                ('reference', models.CharField(blank=True, max_length=255)),
+                ('client_secret', models.CharField(blank=True, max_length=255)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payment_jobs', to='store.shoppingorder')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'run_after'], name='store_payjob_status_run_idx')],
+            },
+        ),
+    ]
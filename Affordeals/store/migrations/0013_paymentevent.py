@@ -0,0 +1,31 @@
+# Generated by Django 5.2.3 on 2026-10-18 16:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0012_paymentjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('provider', models.CharField(max_length=50)),
+                ('event_id', models.CharField(max_length=255)),
+                ('order_ref', models.PositiveIntegerField(null=True)),
+                ('payment_status', models.CharField(blank=True, choices=[('P', 'Pending'), ('C', 'Complete'), ('F', 'Failed')], max_length=1)),
+                ('payload', models.JSONField(default=dict)),
+                ('received_at', models.DateTimeField(auto_now_add=True)),
+                ('processed_at', models.DateTimeField(blank=True, null=True)),
+                ('outcome', models.CharField(blank=True, max_length=20)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('processed_at__isnull', True)), fields=['id'], name='store_payevent_pending_idx')],
+                'constraints': [models.UniqueConstraint(fields=('provider', 'event_id'), name='store_payevent_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.3 on 2026-10-18 16:56
+
+from django.db import migrations, models
+from django.db.models import Max
+
+
+def fail_duplicate_jobs(apps, schema_editor):
+    # Keep the newest live job of each order, as enqueue_payment returned it.
+    PaymentJob = apps.get_model('store', 'PaymentJob')
+    live = PaymentJob.objects.exclude(status='F')
+    newest = live.values('order').annotate(newest=Max('id')).values('newest')
+    live.exclude(id__in=newest).update(status='F', last_error='Superseded by a newer job of the order.')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0014_daily_sales'),
+    ]
+
+    operations = [
+        migrations.RunPython(fail_duplicate_jobs, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='paymentjob',
+            constraint=models.UniqueConstraint(condition=models.Q(('status', 'F'), _negated=True), fields=('order',), name='store_payjob_one_live_per_order'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.3 on 2026-10-18 17:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_item_categories(apps, schema_editor):
+    # The history of moves is gone: past items take the product's current category.
+    Products = apps.get_model('store', 'Products')
+    ShoppingOrderItem = apps.get_model('store', 'ShoppingOrderItem')
+    ShoppingOrderItem.objects.update(
+        category=Subquery(Products.objects.filter(pk=OuterRef('products')).values('category')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0015_paymentjob_one_live_per_order'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='shoppingorderitem',
+            name='category',
+            field=models.ForeignKey(editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='orderitems', to='store.category'),
+        ),
+        migrations.RunPython(backfill_item_categories, migrations.RunPython.noop),
+    ]
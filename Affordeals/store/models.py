@@ -1,7 +1,9 @@
 from django.contrib import admin
 from django.conf import settings
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import connections, models, transaction
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from uuid import uuid4
 from main.models import User, Profile
 
@@ -80,6 +82,11 @@ class Category(models.Model):
       that is highlighted in this category. 
       This field can be null or blank, and uses 'Products' model. Deletion of
       the product sets this field to null.
+    - product_count (PositiveIntegerField): Denormalized number of products
+      in this category, maintained by store.signals and repaired by the
+      reconcile_category_counts management command.
+    - updated_at (DateTimeField): The last time the category was saved,
+      used for conditional GET validators.
     """
     name = models.CharField(max_length=100)
     highlighted_product = models.ForeignKey(
@@ -88,6 +95,8 @@ class Category(models.Model):
         related_name='+',
         blank=True
     )
+    product_count = models.PositiveIntegerField(default=0, editable=False)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     def __str__(self) -> str:
         return self.name
@@ -108,6 +117,11 @@ class Products(models.Model):
     - unit_price (DecimalField): The price per unit of the product, with up
       to 6 digits and 2 decimal places.
     - quantity_in_stock (IntegerField): The number of units available in stock.
+    - updated_at (DateTimeField): The last time the product was saved.
+
+    The category_id and image loaded from the database are remembered so
+    that signal handlers can tell when a product moved to another
+    category or got a new image.
     """
     name = models.CharField(max_length=100)
     category = models.ForeignKey(Category, on_delete=models.PROTECT)
@@ -120,15 +134,68 @@ class Products(models.Model):
     description = models.TextField()
     unit_price = models.DecimalField(max_digits=6, decimal_places=2)
     quantity_in_stock = models.IntegerField()
-    
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            # Seek index for keyset pagination, see store.pagination
+            models.Index(fields=['category', 'id'], name='store_products_cat_id_idx'),
+            # Faceted filtering and price sorting, see store.filters
+            models.Index(fields=['category', 'unit_price'], name='store_products_cat_price_idx'),
+            models.Index(fields=['unit_price', 'id'], name='store_products_price_id_idx'),
+            models.Index(fields=['category', 'unit_price'], name='store_products_instock_idx',
+                         condition=models.Q(quantity_in_stock__gt=0)),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        loaded = dict(zip(field_names, values))
+        instance._loaded_category_id = loaded.get('category_id')
+        instance._loaded_image = loaded.get('image')
+        # The search index columns, so saves leaving them alone skip re-indexing.
+        indexed = ('name', 'description', 'category_id')
+        instance._loaded_search = tuple(loaded[name] for name in indexed) if set(indexed) <= set(loaded) else None
+        return instance
 
     def __str__(self) -> str:
         return self.name
 
+class ShoppingOrderQuerySet(models.QuerySet):
+    def refresh_totals(self):
+        """
+        Recompute total_amount and item_count from the stored line totals
+        of the orders' items with one UPDATE.
+
+        Returns:
+        - int: The number of orders updated.
+        """
+        items = ShoppingOrderItem.objects.filter(order=models.OuterRef('pk')).order_by().values('order')
+        money = models.DecimalField(max_digits=12, decimal_places=2)
+        return self.update(
+            total_amount=Coalesce(
+                models.Subquery(items.annotate(total=models.Sum('line_total')).values('total'),
+                                output_field=money),
+                models.Value(0, output_field=money)),
+            item_count=Coalesce(
+                models.Subquery(items.annotate(units=models.Sum('quantity')).values('units'),
+                                output_field=models.PositiveIntegerField()),
+                models.Value(0)),
+        )
+
+
 class ShoppingOrder(models.Model):
     """
     This class represents an Order model.
     It stores information about an order made by a SiteUser.
+
+    total_amount and item_count are written when the order is placed and
+    whenever one of its items is saved or deleted, so reading an order
+    never recomputes money from the current product prices.
+
+    Fields:
+    - total_amount (DecimalField): The sum of the items' line totals.
+    - item_count (PositiveIntegerField): The number of units ordered.
     """
     PAYMENT_STATUS_PENDING = 'P'
     PAYMENT_STATUS_COMPLETE = 'C'
@@ -139,21 +206,86 @@ class ShoppingOrder(models.Model):
         (PAYMENT_STATUS_COMPLETE, 'Complete'),
         (PAYMENT_STATUS_FAILED, 'Failed')
     ]
+    # Legal payment_status moves: a pending order is paid or fails, and a
+    # paid order can still fail on a refund or chargeback. Failed is final.
+    PAYMENT_STATUS_TRANSITIONS = {
+        PAYMENT_STATUS_PENDING: {PAYMENT_STATUS_COMPLETE, PAYMENT_STATUS_FAILED},
+        PAYMENT_STATUS_COMPLETE: {PAYMENT_STATUS_FAILED},
+        PAYMENT_STATUS_FAILED: set(),
+    }
     created_at = models.DateTimeField(auto_now_add=True)
     payment_status = models.CharField(max_length=1,
                         choices=PAYMENT_STATUS_CHOICES,
                         default=PAYMENT_STATUS_PENDING)
     siteuser = models.ForeignKey(User, on_delete=models.PROTECT)
+    total_amount = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False)
+    item_count = models.PositiveIntegerField(default=0, editable=False)
+
+    objects = ShoppingOrderQuerySet.as_manager()
 
     class Meta:
         permissions = [
             ('cancel_order', 'Can cancel order')
         ]
+        indexes = [
+            # Order history per customer and the staff dashboard by status,
+            # both paginated newest first, see store.pagination.
+            models.Index(fields=['siteuser', 'created_at'], name='store_order_user_created_idx'),
+            models.Index(fields=['payment_status', 'created_at'], name='store_order_status_created_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        # Remembered so the stock signal handlers can spot status changes.
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_payment_status = dict(zip(field_names, values)).get('payment_status')
+        return instance
+
+    @classmethod
+    def sources_of(cls, payment_status):
+        """
+        Returns:
+        - list: The statuses an order may move to payment_status from.
+        """
+        return [source for source, targets in cls.PAYMENT_STATUS_TRANSITIONS.items() if payment_status in targets]
+
+    def can_transition(self, payment_status):
+        return payment_status in self.PAYMENT_STATUS_TRANSITIONS.get(self.payment_status, ())
 
     def __str__(self) -> str:
         return f"Order {self.id}"
 
 
+class ShoppingOrderItemQuerySet(models.QuerySet):
+    def create_from_cart(self, order_id, cart_id):
+        """
+        Copy every line of a cart into an order with a single
+        INSERT ... SELECT, taking each product's current unit price and
+        category, so the cost does not depend on the number of lines.
+
+        Args:
+        - order_id (int): The order receiving the items.
+        - cart_id (UUID): The cart to copy.
+
+        Returns:
+        - int: The number of order items created.
+        """
+        connection = connections[self.db]
+        cart_field = ShoppingCartItem._meta.get_field('cart')
+        quote = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {quote(self.model._meta.db_table)} '
+                f'(quantity, unit_price, line_total, products_id, category_id, order_id) '
+                f'SELECT item.quantity, product.unit_price, item.quantity * product.unit_price, '
+                f'item.product_id, product.category_id, %s '
+                f'FROM {quote(ShoppingCartItem._meta.db_table)} item '
+                f'JOIN {quote(Products._meta.db_table)} product ON product.id = item.product_id '
+                f'WHERE item.cart_id = %s',
+                [order_id, cart_field.get_db_prep_value(cart_id, connection)])
+            return cursor.rowcount
+
+
 class ShoppingOrderItem(models.Model):
     """
     Represents an item in an order.
@@ -161,18 +293,180 @@ class ShoppingOrderItem(models.Model):
     Fields:
     - quantity (PositiveIntegerField): The quantity of the product in the order.
     - unit_price (DecimalField): The unit price of the product.
+    - line_total (DecimalField): unit_price * quantity, the amount paid
+      for the line, kept in step by save().
     - products (ForeignKey): The product associated with this order item.
+    - category (ForeignKey): The product's category when the item was
+      created, so sales stay with the category they were made in after
+      the product moves; see store.analytics.
     - order (ForeignKey): The order this item belongs to.
     """
     quantity = models.PositiveIntegerField()
     unit_price = models.DecimalField(max_digits=8, decimal_places=2)
+    line_total = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False)
     products = models.ForeignKey(Products, on_delete=models.PROTECT, related_name='orderitems')
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, editable=False,
+                                 related_name='orderitems')
     order = models.ForeignKey(ShoppingOrder, on_delete=models.PROTECT, related_name='items')
 
+    objects = ShoppingOrderItemQuerySet.as_manager()
+
+    def save(self, *args, **kwargs):
+        if self._state.adding and self.category_id is None:
+            self.category_id = self.products.category_id
+        self.line_total = self.unit_price * self.quantity
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'unit_price', 'quantity'} & set(update_fields):
+            kwargs['update_fields'] = {*update_fields, 'line_total'}
+        super().save(*args, **kwargs)
+
     def __str__(self) -> str:
         return f"Order Item {self.id}" 
 
 
+class StockReservation(models.Model):
+    """
+    Units of a product taken out of stock for an order awaiting payment,
+    see store.stock.
+
+    The units are already subtracted from Products.quantity_in_stock.
+    Completing the payment drops the reservation and keeps the stock
+    sold; a failed payment or an expired reservation puts the units back.
+
+    Fields:
+    - order (ForeignKey): The pending order holding the units.
+    - product (ForeignKey): The reserved product.
+    - quantity (PositiveIntegerField): The number of units held.
+    - expires_at (DateTimeField): When the units are released if the
+      order is still unpaid.
+    """
+    order = models.ForeignKey(ShoppingOrder, on_delete=models.CASCADE, related_name='reservations')
+    product = models.ForeignKey(Products, on_delete=models.CASCADE, related_name='reservations')
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self) -> str:
+        return f"Reservation of {self.quantity} x {self.product_id} for order {self.order_id}"
+
+
+class ShoppingCartItemQuerySet(models.QuerySet):
+    def add(self, cart_id, product_id, quantity):
+        """
+        Add quantity units of a product to a cart in one atomic statement:
+        INSERT ... ON CONFLICT (cart_id, product_id) DO UPDATE SET
+        quantity = quantity + excluded.quantity. Concurrent adds to the
+        same cart line are summed by the database instead of racing.
+
+        The row is inserted from a SELECT over the cart and product, so a
+        missing cart or product simply inserts nothing.
+
+        Args:
+        - cart_id (UUID): The cart to add to.
+        - product_id (int): The product to add.
+        - quantity (int): The number of units to add.
+
+        Returns:
+        - ShoppingCartItem: The resulting cart line, or None if the cart
+          or product does not exist.
+        """
+        connection = connections[self.db]
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            return self._add_fallback(cart_id, product_id, quantity)
+
+        model = self.model
+        cart_field = model._meta.get_field('cart')
+        cart_value = cart_field.get_db_prep_value(cart_id, connection)
+        quote = connection.ops.quote_name
+        table = quote(model._meta.db_table)
+        sql = (
+            f'INSERT INTO {table} (cart_id, product_id, quantity) '
+            f'SELECT c.id, p.id, %s FROM {quote(ShoppingCart._meta.db_table)} c, {quote(Products._meta.db_table)} p '
+            f'WHERE c.id = %s AND p.id = %s '
+            f'ON CONFLICT (cart_id, product_id) DO UPDATE '
+            f'SET quantity = {table}.quantity + excluded.quantity '
+            f'RETURNING id, quantity'
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [quantity, cart_value, product_id])
+            row = cursor.fetchone()
+        if row is None:
+            return None
+        return model(id=row[0], cart_id=cart_id, product_id=product_id, quantity=row[1])
+
+    def add_many(self, cart_id, quantities, chunk_size=300):
+        """
+        Add several products to one cart with multi-row upserts, the
+        batched form of add(). Product and cart ids must already be
+        validated, since rows are inserted from VALUES.
+
+        Args:
+        - cart_id (UUID): The cart to add to.
+        - quantities (dict): product id -> units to add.
+        - chunk_size (int): Rows per statement, bounded by the
+          database's parameter limit.
+        """
+        connection = connections[self.db]
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            for product_id, quantity in quantities.items():
+                self._add_fallback(cart_id, product_id, quantity)
+            return
+
+        cart_value = self.model._meta.get_field('cart').get_db_prep_value(cart_id, connection)
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        items = list(quantities.items())
+        with connection.cursor() as cursor:
+            for start in range(0, len(items), chunk_size):
+                chunk = items[start:start + chunk_size]
+                values = ', '.join(['(%s, %s, %s)'] * len(chunk))
+                params = []
+                for product_id, quantity in chunk:
+                    params.extend([cart_value, product_id, quantity])
+                cursor.execute(
+                    f'INSERT INTO {table} (cart_id, product_id, quantity) VALUES {values} '
+                    f'ON CONFLICT (cart_id, product_id) DO UPDATE '
+                    f'SET quantity = {table}.quantity + excluded.quantity',
+                    params)
+
+    def _add_fallback(self, cart_id, product_id, quantity):
+        with transaction.atomic(using=self.db):
+            if not (ShoppingCart.objects.using(self.db).filter(pk=cart_id).exists()
+                    and Products.objects.using(self.db).filter(pk=product_id).exists()):
+                return None
+            item, created = self.select_for_update().get_or_create(
+                cart_id=cart_id, product_id=product_id, defaults={'quantity': quantity})
+            if not created:
+                self.filter(pk=item.pk).update(quantity=models.F('quantity') + quantity)
+                item.refresh_from_db(fields=['quantity'])
+            return item
+
+    def with_line_totals(self):
+        """
+        Select each item's product and compute quantity * unit_price in SQL
+        as line_total.
+        """
+        return self.select_related('product').annotate(
+            line_total=models.ExpressionWrapper(
+                models.F('quantity') * models.F('product__unit_price'),
+                output_field=models.DecimalField(max_digits=12, decimal_places=2)))
+
+
+class ShoppingCartQuerySet(models.QuerySet):
+    def with_totals(self):
+        """
+        Annotate total_price with a single SUM over the cart's items and
+        prefetch the items with their line totals, so reading a cart costs
+        a fixed two queries.
+        """
+        return self.annotate(
+            total_price=Coalesce(
+                models.Sum(models.F('cartitems__quantity') * models.F('cartitems__product__unit_price'),
+                           output_field=models.DecimalField(max_digits=12, decimal_places=2)),
+                models.Value(0, output_field=models.DecimalField(max_digits=12, decimal_places=2)))
+        ).prefetch_related(
+            models.Prefetch('cartitems', queryset=ShoppingCartItem.objects.with_line_totals())
+        )
+
+
 class ShoppingCart(models.Model):
     """
     Represents a shopping cart used by customers to store items
@@ -185,6 +479,14 @@ class ShoppingCart(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid4)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = ShoppingCartQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Lets reap_abandoned_carts find expired carts oldest first.
+            models.Index(fields=['created_at'], name='store_cart_created_idx'),
+        ]
+
     def __str__(self) -> str:
         return f"Cart {self.id}"
 
@@ -210,6 +512,8 @@ class ShoppingCartItem(models.Model):
         validators=[MinValueValidator(1)]
     )
 
+    objects = ShoppingCartItemQuerySet.as_manager()
+
     class Meta:
         unique_together = [['cart', 'product']]
 
@@ -225,6 +529,7 @@ class Review(models.Model):
     - description (TextField): The text of the review.
     - date (DateTimeField): The timestamp when the review was created.
     - product (ForeignKey): The product associated with this review.
+    - updated_at (DateTimeField): The last time the review was saved.
     
     The product field uses the on_delete=models.CASCADE option to ensure
     that when a product is deleted, its associated reviews are also deleted
@@ -233,3 +538,201 @@ class Review(models.Model):
     description = models.TextField()
     date = models.DateTimeField(auto_now_add=True)
     product = models.ForeignKey(Products, on_delete=models.CASCADE, related_name='reviews')
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['product', 'updated_at'], name='store_review_prod_upd_idx'),
+        ]
+
+
+class IdempotencyKey(models.Model):
+    """
+    A client supplied Idempotency-Key and the response it produced, so a
+    retried request is answered without running again, see
+    store.idempotency.
+
+    A row without status_code is a request still in progress.
+
+    Fields:
+    - user (ForeignKey): The user who sent the key; keys are per user.
+    - scope (CharField): The endpoint the key was used on.
+    - key (CharField): The client supplied key.
+    - fingerprint (CharField): Hash of the request, to reject a key
+      reused for a different request.
+    - status_code (PositiveSmallIntegerField): The stored response status.
+    - response_body (TextField): The stored response content.
+    - response_headers (JSONField): Stored response headers, e.g. Location.
+    - created_at (DateTimeField): When the request was first received.
+    - expires_at (DateTimeField): When the key may be purged.
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='idempotency_keys')
+    scope = models.CharField(max_length=50)
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)
+    status_code = models.PositiveSmallIntegerField(null=True)
+    response_body = models.TextField(blank=True)
+    response_headers = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'scope', 'key'], name='store_idempotency_key_unique'),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.scope} {self.key}"
+
+
+class PaymentJob(models.Model):
+    """
+    A queued request to a payment provider for an order, run by the
+    run_payment_worker command instead of inside the web request, see
+    store.payments.
+
+    Fields:
+    - order (ForeignKey): The order being paid.
+    - provider (CharField): The payment provider name, e.g. 'intasend'.
+    - status (CharField): Queued, running, succeeded or failed.
+    - attempts (PositiveSmallIntegerField): Provider calls made so far.
+    - run_after (DateTimeField): When the job may next run; pushed back
+      after each failed attempt.
+    - locked_until (DateTimeField): Lease of the worker running the job;
+      a running job past its lease is picked up again.
+    - worker (CharField): The token of the worker that claimed the job.
+    - payment_url (CharField): Where to send the customer to pay.
+    - reference (CharField): The provider's id for the payment.
+    - client_secret (CharField): Secret for client-side payment forms.
+    - last_error (TextField): The error of the latest failed attempt.
+    - created_at (DateTimeField): When the job was queued.
+    - updated_at (DateTimeField): When the job last changed.
+
+    An order has at most one job that has not failed, enforced by a
+    conditional unique constraint.
+    """
+    STATUS_QUEUED = 'Q'
+    STATUS_RUNNING = 'R'
+    STATUS_SUCCEEDED = 'S'
+    STATUS_FAILED = 'F'
+
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_SUCCEEDED, 'Succeeded'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+    order = models.ForeignKey(ShoppingOrder, on_delete=models.CASCADE, related_name='payment_jobs')
+    provider = models.CharField(max_length=50)
+    status = models.CharField(max_length=1, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    worker = models.CharField(max_length=64, blank=True)
+    payment_url = models.CharField(max_length=500, blank=True)
+    reference = models.CharField(max_length=255, blank=True)
+    client_secret = models.CharField(max_length=255, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # The worker's poll: due queued jobs, oldest first.
+            models.Index(fields=['status', 'run_after'], name='store_payjob_status_run_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['order'], condition=~models.Q(status='F'),
+                                    name='store_payjob_one_live_per_order'),
+        ]
+
+    def __str__(self) -> str:
+        return f"Payment of order {self.order_id} via {self.provider}"
+
+
+class PaymentEvent(models.Model):
+    """
+    A payment provider webhook event, appended to this inbox by the
+    webhook endpoint and applied to orders in batches by the
+    consume_payment_events command, see store.webhooks.
+
+    Fields:
+    - provider (CharField): The provider that sent the event.
+    - event_id (CharField): The provider's id for the event; replays of
+      an event are dropped on insert.
+    - order_ref (PositiveIntegerField): The id of the order it is about.
+    - payment_status (CharField): The order status the event implies, or
+      empty for events that do not change the order.
+    - payload (JSONField): The event as received.
+    - received_at (DateTimeField): When the event was received.
+    - processed_at (DateTimeField): When the event was applied, null
+      while it waits in the inbox.
+    - outcome (CharField): What applying the event did.
+    """
+    OUTCOME_APPLIED = 'applied'
+    OUTCOME_IGNORED = 'ignored'
+
+    provider = models.CharField(max_length=50)
+    event_id = models.CharField(max_length=255)
+    order_ref = models.PositiveIntegerField(null=True)
+    payment_status = models.CharField(max_length=1, blank=True, choices=ShoppingOrder.PAYMENT_STATUS_CHOICES)
+    payload = models.JSONField(default=dict)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    outcome = models.CharField(max_length=20, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['provider', 'event_id'], name='store_payevent_unique'),
+        ]
+        indexes = [
+            # The consumer's scan of the inbox, in arrival order.
+            models.Index(fields=['id'], condition=models.Q(processed_at__isnull=True),
+                         name='store_payevent_pending_idx'),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.provider} {self.event_id}"
+
+
+class DailySales(models.Model):
+    """
+    Units and revenue of completed orders for one day, maintained by
+    store.analytics as orders complete. Sales count on the day the order
+    was placed, so a rebuild from history gives the same rows.
+
+    Fields:
+    - day (DateField): The day the orders were placed.
+    - units (IntegerField): Units sold.
+    - revenue (DecimalField): The sum of the line totals.
+    """
+    day = models.DateField()
+    units = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        abstract = True
+
+
+class ProductDailySales(DailySales):
+    """
+    Daily sales of one product, see DailySales.
+    """
+    product = models.ForeignKey(Products, on_delete=models.CASCADE, related_name='daily_sales')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'product'], name='store_product_sales_day_unique'),
+        ]
+
+
+class CategoryDailySales(DailySales):
+    """
+    Daily sales of the products of one category, see DailySales.
+    """
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='daily_sales')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'category'], name='store_category_sales_day_unique'),
+        ]
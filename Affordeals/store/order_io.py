@@ -0,0 +1,80 @@
+import csv
+import json
+
+from .models import ShoppingOrderItem
+
+
+FIELDS = ['order_id', 'created_at', 'payment_status', 'customer_id', 'customer_email',
+          'order_total', 'order_item_count', 'product_id', 'product_name',
+          'quantity', 'unit_price', 'line_total']
+
+COLUMNS = ['order_id', 'order__created_at', 'order__payment_status', 'order__siteuser_id',
+           'order__siteuser__email', 'order__total_amount', 'order__item_count', 'products_id',
+           'products__name', 'quantity', 'unit_price', 'line_total']
+
+FORMATS = ('csv', 'ndjson')
+
+CONTENT_TYPES = {'csv': 'text/csv; charset=utf-8', 'ndjson': 'application/x-ndjson'}
+
+
+def export_rows(order_filter=None, chunk_size=2000):
+    """
+    Stream order lines joined with their order and customer as flat
+    tuples in FIELDS order, oldest order first. Rows are read in
+    server-side chunks without building model instances, so memory use
+    does not depend on the number of rows.
+
+    Args:
+    - order_filter (OrderFilter): Status and date range filters, or None.
+    - chunk_size (int): Rows fetched per database round trip.
+    """
+    queryset = ShoppingOrderItem.objects.all()
+    if order_filter is not None:
+        queryset = order_filter.filter_queryset(queryset, prefix='order__')
+    return (queryset.order_by('order_id', 'id')
+            .values_list(*COLUMNS)
+            .iterator(chunk_size=chunk_size))
+
+
+class Echo:
+    """
+    A file-like object returning what is written, so csv.writer can
+    format one row at a time for a streaming response.
+    """
+    def write(self, value):
+        return value
+
+
+def encode_rows(rows, fmt):
+    """
+    Lazily format order rows as CSV or NDJSON text, one line per row,
+    starting with the header for CSV.
+
+    Args:
+    - rows (iterable): Tuples in FIELDS order.
+    - fmt (str): 'csv' or 'ndjson'.
+    """
+    if fmt == 'csv':
+        writer = csv.writer(Echo())
+        yield writer.writerow(FIELDS)
+        for row in rows:
+            yield writer.writerow(row)
+        return
+    for row in rows:
+        yield json.dumps(dict(zip(FIELDS, row)), default=str) + '\n'
+
+
+def buffered(lines, size=64 * 1024):
+    """
+    Join small lines into chunks of about size characters, so a
+    streaming response does not write one socket frame per row.
+    """
+    chunk, length = [], 0
+    for line in lines:
+        chunk.append(line)
+        length += len(line)
+        if length >= size:
+            yield ''.join(chunk)
+            chunk, length = [], 0
+    if chunk:
+        yield ''.join(chunk)
@@ -0,0 +1,164 @@
+import logging
+import time
+
+from django.db import transaction
+
+from .analytics import record_sales
+from .carts import delete_carts, get_cart_store
+from .models import ShoppingCart, ShoppingCartItem, ShoppingOrder, ShoppingOrderItem
+from .stock import reserve_cart_stock, settle_reservations
+
+
+logger = logging.getLogger(__name__)
+
+
+class OrderError(Exception):
+    """
+    Raised when a cart cannot be turned into an order.
+    """
+
+
+class OrderPlacement:
+    """
+    Turns a shopping cart into an order as an explicit pipeline of
+    stages, each timed and logged on the store.orders logger.
+
+    The number of queries does not depend on the size of the cart: the
+    lines are never loaded into Python. Stock, reservations and order
+    items are written with set-based statements reading the cart rows,
+    and the cart is removed with raw deletes.
+
+    Stages:
+    - flush: Persist a cart held by the cache cart store.
+    - validate: Lock the cart row and count its lines.
+    - create_order: Insert the pending order.
+    - reserve_stock: Take the units out of stock, see store.stock.
+    - insert_items: Copy the lines into order items with INSERT ... SELECT.
+    - record_totals: Store the order's total_amount and item_count.
+    - delete_cart: Delete the cart and its items.
+
+    Attributes:
+    - user_id (int): The customer placing the order.
+    - cart_id (UUID): The cart being converted.
+    - order (ShoppingOrder): The created order, once run() returns.
+    - lines (int): The number of cart lines.
+    - timings (dict): Stage name -> milliseconds spent.
+    """
+    stages = ('validate', 'create_order', 'reserve_stock', 'insert_items', 'record_totals', 'delete_cart')
+
+    def __init__(self, user_id, cart_id):
+        self.user_id = user_id
+        self.cart_id = cart_id
+        self.order = None
+        self.lines = 0
+        self.timings = {}
+
+    def run(self):
+        """
+        Run every stage, all but the flush in one transaction.
+
+        Raises:
+        - OrderError: If the cart does not exist or is empty.
+        - OutOfStock: If a product does not have enough stock.
+
+        Returns:
+        - ShoppingOrder: The created order.
+        """
+        started = time.perf_counter()
+        self.timed('flush')
+        with transaction.atomic():
+            for stage in self.stages:
+                self.timed(stage)
+        get_cart_store().evict(self.cart_id)
+        total = (time.perf_counter() - started) * 1000
+        logger.info('Placed order %s from cart %s: %d lines in %.1fms (%s)',
+                    self.order.id, self.cart_id, self.lines, total,
+                    ', '.join(f'{stage}={ms:.1f}ms' for stage, ms in self.timings.items()))
+        return self.order
+
+    def timed(self, stage):
+        started = time.perf_counter()
+        try:
+            getattr(self, stage)()
+        finally:
+            self.timings[stage] = (time.perf_counter() - started) * 1000
+
+    def flush(self):
+        get_cart_store().flush(self.cart_id)
+
+    def validate(self):
+        if not ShoppingCart.objects.select_for_update().filter(pk=self.cart_id).exists():
+            raise OrderError(f"This {self.cart_id} is an invalid id.")
+        self.lines = ShoppingCartItem.objects.filter(cart_id=self.cart_id).count()
+        if not self.lines:
+            raise OrderError(f"{self.cart_id}: is empty")
+
+    def create_order(self):
+        self.order = ShoppingOrder.objects.create(siteuser_id=self.user_id)
+
+    def reserve_stock(self):
+        reserve_cart_stock(self.order.id, self.cart_id, self.lines)
+
+    def insert_items(self):
+        ShoppingOrderItem.objects.create_from_cart(self.order.id, self.cart_id)
+
+    def record_totals(self):
+        ShoppingOrder.objects.filter(pk=self.order.pk).refresh_totals()
+        self.order.refresh_from_db(fields=['total_amount', 'item_count'])
+
+    def delete_cart(self):
+        delete_carts([self.cart_id])
+
+
+def place_order(user_id, cart_id):
+    """
+    Turn a cart into a pending order, see OrderPlacement.
+
+    Returns:
+    - ShoppingOrder: The created order.
+    """
+    return OrderPlacement(user_id, cart_id).run()
+
+
+def transition_orders(order_ids, payment_status, chunk_size=5000):
+    """
+    Move many orders to payment_status along the legal transitions of
+    ShoppingOrder.PAYMENT_STATUS_TRANSITIONS, with one conditional
+    UPDATE ... WHERE id IN (...) AND payment_status IN (...) per chunk,
+    all in one transaction. Stock reservations and sales rollups follow,
+    as the model signals do for a single save.
+
+    Args:
+    - order_ids (list): The orders to move.
+    - payment_status (str): One of ShoppingOrder.PAYMENT_STATUS_*.
+    - chunk_size (int): Orders per UPDATE.
+
+    Raises:
+    - OrderError: If payment_status is not a known status.
+
+    Returns:
+    - tuple: (ids moved, {rejected id: its current status, None if unknown})
+    """
+    if payment_status not in ShoppingOrder.PAYMENT_STATUS_TRANSITIONS:
+        raise OrderError(f"{payment_status} is not a payment status.")
+    order_ids = list(dict.fromkeys(order_ids))
+    sources = ShoppingOrder.sources_of(payment_status)
+    moved, was_complete = [], []
+    with transaction.atomic():
+        for start in range(0, len(order_ids), chunk_size):
+            legal = ShoppingOrder.objects.filter(pk__in=order_ids[start:start + chunk_size],
+                                                 payment_status__in=sources)
+            previous = dict(legal.select_for_update().values_list('pk', 'payment_status'))
+            legal.update(payment_status=payment_status)
+            moved.extend(previous)
+            was_complete.extend(pk for pk, status in previous.items()
+                                if status == ShoppingOrder.PAYMENT_STATUS_COMPLETE)
+        settle_reservations(moved, payment_status)
+        if payment_status == ShoppingOrder.PAYMENT_STATUS_COMPLETE:
+            record_sales(moved)
+        else:
+            record_sales(was_complete, -1)
+    moved_set = set(moved)
+    rejected = [pk for pk in order_ids if pk not in moved_set]
+    current = dict(ShoppingOrder.objects.filter(pk__in=rejected).values_list('pk', 'payment_status'))
+    return moved, {pk: current.get(pk) for pk in rejected}
@@ -0,0 +1,327 @@
+import base64
+import binascii
+import hashlib
+import json
+from collections import OrderedDict
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+APPROXIMATE_COUNT_TIMEOUT = 60
+
+
+class InvalidCursor(Exception):
+    """
+    Raised when a cursor token cannot be decoded or does not match
+    the ordering of the paginated queryset.
+    """
+
+
+def encode_cursor(values, reverse=False):
+    """
+    Encode a keyset position into an opaque, URL safe token.
+
+    Args:
+    - values (tuple): The values of the ordering fields at the position.
+      Values JSON cannot represent (e.g. Decimal) are stored as strings.
+    - reverse (bool): True if the token walks backwards from the position.
+
+    Returns:
+    - str: The encoded token.
+    """
+    payload = json.dumps({'v': list(values), 'r': int(reverse)}, separators=(',', ':'), default=str)
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, size):
+    """
+    Decode a token produced by encode_cursor.
+
+    Args:
+    - token (str): The opaque token.
+    - size (int): The number of ordering fields the token must carry.
+
+    Raises:
+    - InvalidCursor: If the token is malformed.
+
+    Returns:
+    - tuple: The ordering values and the reverse flag.
+    """
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        values, reverse = tuple(payload['v']), bool(payload['r'])
+    except (binascii.Error, ValueError, TypeError, KeyError, UnicodeDecodeError):
+        raise InvalidCursor(token)
+    if len(values) != size:
+        raise InvalidCursor(token)
+    return values, reverse
+
+
+def keyset_filter(fields, values, reverse=False):
+    """
+    Build the lexicographic seek condition for a keyset position.
+
+    (a, b) > (x, y) is expanded to a > x OR (a = x AND b > y), which every
+    backend can answer from a composite index on the ordering fields.
+    Fields prefixed with '-' are descending and seek the other way.
+
+    Args:
+    - fields (tuple): The ordering field names.
+    - values (tuple): The position values for those fields.
+    - reverse (bool): Seek before the position instead of after it.
+
+    Returns:
+    - Q: The filter condition.
+    """
+    names = [field.lstrip('-') for field in fields]
+    condition = Q()
+    for index, field in enumerate(fields):
+        descending = field.startswith('-')
+        lookup = 'lt' if descending != reverse else 'gt'
+        step = Q(**{f'{names[index]}__{lookup}': values[index]})
+        for prefix, value in zip(names[:index], values[:index]):
+            step &= Q(**{prefix: value})
+        condition |= step
+    return condition
+
+
+def invert_ordering(fields):
+    return tuple(field[1:] if field.startswith('-') else '-' + field for field in fields)
+
+
+def approximate_count(queryset):
+    """
+    Return a cheap estimate of the number of rows in a queryset.
+
+    Unfiltered querysets are answered from the planner statistics
+    (pg_class on PostgreSQL, sqlite_stat1 after ANALYZE on SQLite).
+    Anything else falls back to an exact COUNT(*) that is cached for
+    APPROXIMATE_COUNT_TIMEOUT seconds.
+
+    Args:
+    - queryset (QuerySet): The queryset to count.
+
+    Returns:
+    - int: The estimated row count.
+    """
+    table = queryset.model._meta.db_table
+    connection = connections[queryset.db]
+    if not queryset.query.where:
+        estimate = None
+        try:
+            with connection.cursor() as cursor:
+                if connection.vendor == 'postgresql':
+                    cursor.execute('SELECT reltuples FROM pg_class WHERE relname = %s', [table])
+                    row = cursor.fetchone()
+                    estimate = int(row[0]) if row and row[0] >= 0 else None
+                elif connection.vendor == 'sqlite':
+                    # One row per index, whose stat starts with the number
+                    # of rows it covers; partial indexes cover fewer, so
+                    # the largest is the table size. Tables without
+                    # indexes get a single row with idx NULL.
+                    cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s', [table])
+                    counts = [int(row[0].split()[0]) for row in cursor.fetchall() if row[0]]
+                    estimate = max(counts) if counts else None
+        except DatabaseError:
+            estimate = None
+        if estimate is not None:
+            return estimate
+
+    sql, params = queryset.order_by().query.sql_with_params()
+    digest = hashlib.md5(repr((queryset.db, sql, params)).encode()).hexdigest()
+    key = 'approximate_count:{}'.format(digest)
+    return cache.get_or_set(key, queryset.order_by().count, APPROXIMATE_COUNT_TIMEOUT)
+
+
+class KeysetPage:
+    """
+    A single page of a keyset paginated queryset.
+
+    Attributes:
+    - object_list (list): The objects on this page, in paginator order.
+    - next_cursor (str): Token for the following page, or None.
+    - previous_cursor (str): Token for the preceding page, or None.
+    - count (int): Approximate number of rows, when it was requested.
+    """
+    def __init__(self, object_list, next_cursor, previous_cursor, count=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.count = count
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginator:
+    """
+    Cursor paginator that seeks on a composite ordering instead of
+    using OFFSET, so every page costs the same regardless of depth.
+
+    Attributes:
+    - queryset (QuerySet): The queryset to paginate.
+    - per_page (int): Number of objects per page.
+    - ordering (tuple): Ordering fields, '-' prefixed when descending.
+      The last field must be unique so that every row has a distinct
+      position.
+
+    Methods:
+    - get_page (function): Returns the KeysetPage for a cursor token.
+    """
+    def __init__(self, queryset, per_page, ordering=('id',)):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = tuple(ordering)
+
+    def position(self, obj):
+        return tuple(getattr(obj, field.lstrip('-')) for field in self.ordering)
+
+    def get_page(self, cursor=None, with_count=False):
+        """
+        Fetch the page addressed by a cursor token.
+
+        Args:
+        - cursor (str): Token from a previous page, or None for the first page.
+        - with_count (bool): Also attach an approximate total count.
+
+        Raises:
+        - InvalidCursor: If the token is malformed.
+
+        Returns:
+        - KeysetPage: The requested page.
+        """
+        queryset = self.queryset
+        reverse = False
+        if cursor:
+            values, reverse = decode_cursor(cursor, len(self.ordering))
+            try:
+                queryset = queryset.filter(keyset_filter(self.ordering, values, reverse))
+            except (ValueError, TypeError, ValidationError):
+                raise InvalidCursor(cursor)
+
+        if reverse:
+            queryset = queryset.order_by(*invert_ordering(self.ordering))
+        else:
+            queryset = queryset.order_by(*self.ordering)
+
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if reverse:
+            rows.reverse()
+
+        next_cursor = previous_cursor = None
+        if rows:
+            if has_more or reverse:
+                next_cursor = encode_cursor(self.position(rows[-1]))
+            if (cursor and not reverse) or (reverse and has_more):
+                previous_cursor = encode_cursor(self.position(rows[0]), reverse=True)
+
+        count = approximate_count(self.queryset) if with_count else None
+        return KeysetPage(rows, next_cursor, previous_cursor, count)
+
+
+class KeysetPagination(BasePagination):
+    """
+    DRF pagination class backed by KeysetPaginator.
+
+    Views can choose the ordering per request by defining
+    get_keyset_ordering(); otherwise the ordering attribute is used.
+
+    Attributes:
+    - ordering (tuple): The default keyset ordering fields.
+    - page_size (int): Default number of results per page.
+    - page_size_query_param (str): Query parameter overriding page_size.
+    - max_page_size (int): Upper bound for page_size_query_param.
+    - cursor_query_param (str): Query parameter carrying the cursor token.
+    - count_query_param (str): Query parameter requesting an approximate count.
+    """
+    ordering = ('id',)
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    count_query_param = 'with_count'
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def get_ordering(self, request, view=None):
+        if view is not None and hasattr(view, 'get_keyset_ordering'):
+            return view.get_keyset_ordering()
+        return self.ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        with_count = request.query_params.get(self.count_query_param, '').lower() in ('1', 'true')
+        paginator = KeysetPaginator(
+            queryset, self.get_page_size(request), self.get_ordering(request, view))
+        try:
+            self.page = paginator.get_page(
+                request.query_params.get(self.cursor_query_param), with_count)
+        except InvalidCursor:
+            raise NotFound('Invalid cursor')
+        return list(self.page)
+
+    def get_link(self, cursor):
+        if cursor is None:
+            return None
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        body = OrderedDict()
+        if self.page.count is not None:
+            body['count'] = self.page.count
+        body['next'] = self.get_link(self.page.next_cursor)
+        body['previous'] = self.get_link(self.page.previous_cursor)
+        body['results'] = data
+        return Response(body)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'count': {'type': 'integer'},
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class ProductKeysetPagination(KeysetPagination):
+    """
+    Keyset pagination for the product catalog, matching the
+    category grouped ordering of the HTML listing.
+    """
+    ordering = ('category_id', 'id')
+
+
+class OrderKeysetPagination(KeysetPagination):
+    """
+    Keyset pagination for order history, newest orders first.
+    """
+    ordering = ('-created_at', '-id')
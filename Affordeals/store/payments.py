@@ -0,0 +1,279 @@
+import logging
+import random
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import PaymentJob
+
+
+logger = logging.getLogger(__name__)
+
+# Provider name -> dotted path; STORE_PAYMENT_PROVIDER may also be a dotted path.
+PROVIDERS = {
+    'intasend': 'store.payments.IntaSendProvider',
+    'stripe': 'store.payments.StripeProvider',
+    'stub': 'store.payments.StubProvider',
+}
+
+DEFAULT_PROVIDER = 'intasend'
+DEFAULT_MAX_ATTEMPTS = 5
+# Seconds before the first retry, doubled on each attempt up to the cap.
+DEFAULT_RETRY_DELAY = 2
+DEFAULT_RETRY_CAP = 300
+# Seconds a worker may hold a job before another worker takes it over.
+DEFAULT_LEASE = 60
+
+
+class PaymentError(Exception):
+    """
+    Raised by a provider that could not start a payment.
+
+    Attributes:
+    - retryable (bool): False when retrying cannot help, e.g. a rejected
+      request; the job then fails at once.
+    """
+    def __init__(self, message, retryable=True):
+        self.retryable = retryable
+        super().__init__(message)
+
+
+class PaymentProvider:
+    """
+    Starts payments with an external service. Subclasses implement
+    initiate() and are selected by name with STORE_PAYMENT_PROVIDER.
+
+    Attributes:
+    - name (str): The name STORE_PAYMENT_PROVIDER selects it by.
+    - default_currency (str): ISO 4217 code the order totals are charged
+      in unless STORE_CURRENCY says otherwise.
+    """
+    name = None
+    default_currency = 'USD'
+
+    def currency(self):
+        return getattr(settings, 'STORE_CURRENCY', self.default_currency)
+
+    def initiate(self, order):
+        """
+        Start the payment of an order.
+
+        Raises:
+        - PaymentError: If the provider could not start the payment. Any
+          other exception is treated as a retryable error.
+
+        Returns:
+        - dict: Any of payment_url, reference and client_secret.
+        """
+        raise NotImplementedError
+
+
+def credential(name):
+    """
+    Read a provider credential from the settings, which take it from the
+    environment.
+
+    Raises:
+    - PaymentError: If it is not configured; retrying cannot help.
+    """
+    value = getattr(settings, name, None)
+    if not value:
+        raise PaymentError(f'{name} is not configured.', retryable=False)
+    return value
+
+
+def payable_amount(order):
+    """
+    Returns:
+    - Decimal: The order's total.
+
+    Raises:
+    - PaymentError: If the order has nothing to pay.
+    """
+    if order.total_amount <= 0:
+        raise PaymentError(f'Order {order.id} has nothing to pay.', retryable=False)
+    return order.total_amount
+
+
+class IntaSendProvider(PaymentProvider):
+    """
+    IntaSend hosted checkout; the customer pays on the returned page.
+    Charges in Kenyan shillings by default, and needs the customer's
+    phone number.
+    """
+    name = 'intasend'
+    default_currency = 'KES'
+
+    def initiate(self, order):
+        customer = getattr(order.siteuser, 'siteuser', None)
+        if customer is None or not customer.phone_number:
+            raise PaymentError(f'Order {order.id} has no customer phone number.', retryable=False)
+        from intasend import APIService
+        token, publishable_key = credential('INTASEND_API_TOKEN'), credential('INTASEND_PUBLISHABLE_KEY')
+        amount = payable_amount(order)
+        service = APIService(token=token, publishable_key=publishable_key,
+                             test=True)
+        response = service.collect.checkout(phone_number=customer.phone_number,
+                                            email=order.siteuser.email, amount=str(amount), currency=self.currency(),
+                                            comment=f'Order {order.id}', redirect_url="http://example.com/thank-you",
+                                            api_ref=str(order.id))
+        if not response.get('url'):
+            raise PaymentError(f'IntaSend returned no checkout url: {response}')
+        return {'payment_url': response['url'], 'reference': response.get('id', '')}
+
+
+class StripeProvider(PaymentProvider):
+    """
+    Stripe payment intent, confirmed client side with its client secret.
+    """
+    name = 'stripe'
+
+    def initiate(self, order):
+        import stripe
+        stripe.api_key = credential('STRIPE_SECRET_KEY')
+        try:
+            payment_intent = stripe.PaymentIntent.create(
+                amount=int(payable_amount(order) * 100),  # In cents
+                currency=self.currency().lower(),
+                description=f'Order {order.id}',
+                receipt_email=order.siteuser.email or None,
+                metadata={'order_id': order.id},
+            )
+        except stripe.error.InvalidRequestError as error:
+            raise PaymentError(str(error), retryable=False)
+        return {'reference': payment_intent.id, 'client_secret': payment_intent.client_secret}
+
+
+class StubProvider(PaymentProvider):
+    """
+    Local stand-in for tests and development: succeeds at once with a
+    link to the success page, unless errors are queued in `errors`, which
+    are raised one per call first.
+    """
+    name = 'stub'
+    errors = []
+
+    def initiate(self, order):
+        if self.errors:
+            raise self.errors.pop(0)
+        return {'payment_url': f'/success/?order={order.id}', 'reference': f'stub-{order.id}'}
+
+
+def get_provider(name=None):
+    name = name or getattr(settings, 'STORE_PAYMENT_PROVIDER', DEFAULT_PROVIDER)
+    return import_string(PROVIDERS.get(name, name))()
+
+
+def max_attempts():
+    return getattr(settings, 'STORE_PAYMENT_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS)
+
+
+def retry_delay(attempts):
+    """
+    Seconds to wait after a failed attempt: exponential backoff with
+    jitter, so retries of many jobs do not hit the provider together.
+    """
+    delay = getattr(settings, 'STORE_PAYMENT_RETRY_DELAY', DEFAULT_RETRY_DELAY) * 2 ** (attempts - 1)
+    return min(delay, getattr(settings, 'STORE_PAYMENT_RETRY_CAP', DEFAULT_RETRY_CAP)) * random.uniform(0.5, 1)
+
+
+def enqueue_payment(order, provider=None):
+    """
+    Queue the payment of an order. An order has at most one live job:
+    while a job is queued, running or succeeded it is returned instead
+    of queueing another. The store_payjob_one_live_per_order constraint
+    settles concurrent calls: the losing insert returns the winner's job.
+
+    Args:
+    - order (ShoppingOrder): The order to pay.
+    - provider (str): The provider name, STORE_PAYMENT_PROVIDER by default.
+
+    Returns:
+    - PaymentJob: The order's job.
+    """
+    live = order.payment_jobs.exclude(status=PaymentJob.STATUS_FAILED)
+    job = live.first()
+    if job is not None:
+        return job
+    try:
+        with transaction.atomic():
+            return PaymentJob.objects.create(
+                order=order, provider=provider or getattr(settings, 'STORE_PAYMENT_PROVIDER', DEFAULT_PROVIDER))
+    except IntegrityError:
+        return live.get()
+
+
+def claim_jobs(limit=10, lease=None):
+    """
+    Claim up to `limit` due jobs for this worker: queued jobs whose
+    run_after passed, and running jobs whose worker's lease expired. One
+    conditional UPDATE stamps them with a fresh worker token, so two
+    workers never run the same job.
+
+    A job whose worker died mid-attempt still counts that attempt, so an
+    expired job that already used STORE_PAYMENT_MAX_ATTEMPTS is failed
+    here instead of being claimed again.
+
+    Returns:
+    - list: The claimed PaymentJob rows.
+    """
+    now = timezone.now()
+    expired = Q(status=PaymentJob.STATUS_RUNNING, locked_until__lt=now)
+    PaymentJob.objects.filter(expired, attempts__gte=max_attempts()).update(
+        status=PaymentJob.STATUS_FAILED, locked_until=None, updated_at=now,
+        last_error='The worker lease expired on the last attempt.')
+    due = Q(status=PaymentJob.STATUS_QUEUED, run_after__lte=now) | (expired & Q(attempts__lt=max_attempts()))
+    ids = list(PaymentJob.objects.filter(due).order_by('run_after').values_list('id', flat=True)[:limit])
+    if not ids:
+        return []
+    token = uuid.uuid4().hex
+    lease = getattr(settings, 'STORE_PAYMENT_LEASE', DEFAULT_LEASE) if lease is None else lease
+    PaymentJob.objects.filter(due, id__in=ids).update(
+        status=PaymentJob.STATUS_RUNNING, worker=token, attempts=F('attempts') + 1,
+        locked_until=now + timedelta(seconds=lease), updated_at=now)
+    return list(PaymentJob.objects.filter(worker=token).select_related('order__siteuser__siteuser').order_by('run_after'))
+
+
+def run_job(job):
+    """
+    Call the provider for a claimed job and record the outcome. Failed
+    attempts are retried with backoff until STORE_PAYMENT_MAX_ATTEMPTS.
+
+    Returns:
+    - str: The new job status.
+    """
+    now = timezone.now()
+    try:
+        result = get_provider(job.provider).initiate(job.order)
+    except Exception as error:
+        retryable = getattr(error, 'retryable', True)
+        if retryable and job.attempts < max_attempts():
+            status, run_after = PaymentJob.STATUS_QUEUED, now + timedelta(seconds=retry_delay(job.attempts))
+        else:
+            status, run_after = PaymentJob.STATUS_FAILED, job.run_after
+        logger.warning('Payment job %s attempt %d failed: %s', job.id, job.attempts, error)
+        changes = {'status': status, 'run_after': run_after, 'last_error': str(error)}
+    else:
+        changes = {'status': PaymentJob.STATUS_SUCCEEDED, 'last_error': '', **result}
+    # Only the worker holding the job may record it, in case its lease
+    # ran out and another worker took over.
+    PaymentJob.objects.filter(pk=job.pk, worker=job.worker).update(locked_until=None, updated_at=now, **changes)
+    return changes['status']
+
+
+def run_pending(limit=10):
+    """
+    Claim and run one batch of due jobs.
+
+    Returns:
+    - int: The number of jobs run.
+    """
+    jobs = claim_jobs(limit)
+    for job in jobs:
+        run_job(job)
+    return len(jobs)
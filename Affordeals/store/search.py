@@ -0,0 +1,170 @@
+import re
+
+from django.db import connection
+from django.db.models import Q
+
+from .models import Products
+
+
+SEARCH_TABLE = 'store_products_fts'
+
+# bm25() column weights for (name, description, category)
+SEARCH_WEIGHTS = (10.0, 1.0, 4.0)
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def search_enabled():
+    """
+    Return True if the default database can host the FTS5 index.
+    Other backends fall back to LIKE based matching in search_products.
+    """
+    return connection.vendor == 'sqlite'
+
+
+def create_search_table(cursor):
+    cursor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} "
+        "USING fts5(name, description, category, tokenize = 'unicode61 remove_diacritics 2')"
+    )
+
+
+def drop_search_table(cursor):
+    cursor.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+
+
+def build_match_query(text):
+    """
+    Turn free text into a safe FTS5 MATCH expression.
+
+    Every word becomes a quoted prefix term, so user input can never be
+    parsed as FTS5 syntax, and all terms must match.
+
+    Args:
+    - text (str): The raw search text.
+
+    Returns:
+    - str: The MATCH expression, empty if the text has no words.
+    """
+    return ' '.join('"{}"*'.format(token) for token in TOKEN_RE.findall(text))
+
+
+def index_products(rows):
+    """
+    Write rows into the search index, replacing any existing entries.
+
+    Args:
+    - rows (iterable): (id, name, description, category_name) tuples.
+    """
+    if not search_enabled():
+        return
+    rows = list(rows)
+    if not rows:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [(row[0],) for row in rows])
+        cursor.executemany(
+            f'INSERT INTO {SEARCH_TABLE} (rowid, name, description, category) '
+            'VALUES (%s, %s, %s, %s)', rows)
+
+
+def index_product(product):
+    """
+    Index or re-index a single product.
+
+    Args:
+    - product (Products): The saved product.
+    """
+    index_products([(product.id, product.name, product.description, product.category.name)])
+
+
+def index_category(category):
+    """
+    Re-index every product of a category, e.g. after it was renamed.
+
+    Args:
+    - category (Category): The saved category.
+    """
+    index_products(
+        Products.objects.filter(category=category)
+        .values_list('id', 'name', 'description', 'category__name')
+    )
+
+
+def remove_product(product_id):
+    """
+    Drop a product from the search index.
+
+    Args:
+    - product_id (int): The id of the deleted product.
+    """
+    if not search_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s', [product_id])
+
+
+def rebuild_index():
+    """
+    Rebuild the whole search index from the product table with a single
+    INSERT ... SELECT, then merge the FTS5 b-trees.
+
+    Returns:
+    - int: The number of indexed products.
+    """
+    if not search_enabled():
+        return 0
+    with connection.cursor() as cursor:
+        create_search_table(cursor)
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+        cursor.execute(
+            f'INSERT INTO {SEARCH_TABLE} (rowid, name, description, category) '
+            'SELECT p.id, p.name, p.description, c.name '
+            f'FROM {Products._meta.db_table} p '
+            f'JOIN {Products._meta.get_field("category").related_model._meta.db_table} c '
+            'ON c.id = p.category_id'
+        )
+        cursor.execute(f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('optimize')")
+        cursor.execute(f'SELECT count(*) FROM {SEARCH_TABLE}')
+        return cursor.fetchone()[0]
+
+
+def search_products(text, limit, offset=0):
+    """
+    Search products by name, description and category name.
+
+    On SQLite results are ranked by BM25 over the FTS5 index. Other
+    backends fall back to an unranked case-insensitive match.
+
+    Args:
+    - text (str): The raw search text.
+    - limit (int): Maximum number of products to return.
+    - offset (int): Number of ranked results to skip.
+
+    Returns:
+    - tuple: (total number of matches, list of Products in rank order)
+    """
+    if not search_enabled():
+        condition = Q()
+        for token in TOKEN_RE.findall(text):
+            condition &= (Q(name__icontains=token)
+                          | Q(description__icontains=token)
+                          | Q(category__name__icontains=token))
+        queryset = Products.objects.filter(condition).order_by('id') if condition else Products.objects.none()
+        return queryset.count(), list(queryset[offset:offset + limit])
+
+    match = build_match_query(text)
+    if not match:
+        return 0, []
+    weights = ', '.join(str(weight) for weight in SEARCH_WEIGHTS)
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT count(*) FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s', [match])
+        total = cursor.fetchone()[0]
+        cursor.execute(
+            f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s '
+            f'ORDER BY bm25({SEARCH_TABLE}, {weights}), rowid LIMIT %s OFFSET %s',
+            [match, limit, offset])
+        ids = [row[0] for row in cursor.fetchall()]
+    products = Products.objects.in_bulk(ids)
+    return total, [products[pk] for pk in ids if pk in products]
@@ -1,6 +1,37 @@
-from .models import Category, SiteUser, Products, ShoppingOrder, ShoppingCart, ShoppingCartItem, ShoppingOrderItem, Review
+from .models import Category, SiteUser, Products, ShoppingOrder, ShoppingCart, ShoppingCartItem, ShoppingOrderItem, Review, \
+  PaymentJob
+from datetime import timedelta
+
+from django.utils import timezone
 from rest_framework import serializers
+from .carts import get_cart_store
+from .orders import OrderError, place_order
+from .stock import OutOfStock
 from main.serializers import UserSerializer
+from .images import derivative_sizes, derivative_urls
+
+
+class ProductImageField(serializers.Field):
+  """
+  Read-only field exposing a product image and its generated derivatives.
+
+  Output:
+  - original (str): URL of the uploaded image.
+  - <size> (dict): format -> URL for every generated derivative size.
+  """
+  def __init__(self, **kwargs):
+    kwargs['read_only'] = True
+    super().__init__(**kwargs)
+
+  def to_representation(self, image):
+    if not image:
+      return None
+    request = self.context.get('request')
+    absolute = request.build_absolute_uri if request else (lambda url: url)
+    data = {'original': absolute(image.url)}
+    for size in derivative_sizes():
+      data[size] = {fmt: absolute(url) for fmt, url in derivative_urls(image.name, size).items()}
+    return data
 
 
 class SiteUserSerializer(serializers.ModelSerializer):
@@ -26,10 +57,12 @@ class ProductsSerializer(serializers.ModelSerializer):
     - id (int): The unique identifier of the product.
     - name (str): The name of the product.
     - unit_price (Decimal): The unit price of the product.
+    - images (dict): The original image and its derivatives.
   """
+  images = ProductImageField(source='image')
   class Meta:
     model = Products
-    fields = ['id', 'name', 'quantity_in_stock', 'unit_price']
+    fields = ['id', 'name', 'quantity_in_stock', 'unit_price', 'images']
 
 class CategorySerializer(serializers.ModelSerializer):
   """
@@ -38,6 +71,7 @@ class CategorySerializer(serializers.ModelSerializer):
     Fields:
     - id (int): The unique identifier of the category.
     - name (str): The name of the category.
+    - product_count (int): The denormalized number of products in the category.
   """
   product_count = serializers.IntegerField(read_only=True)
   class Meta:
@@ -65,15 +99,14 @@ class ShoppingOrderItemSerializer(serializers.ModelSerializer):
     - id (int): The unique identifier of the order item.
     - products (CustomProductSerializer): The product associated with the order item.
     - quantity (int): The quantity of the product in the order item.
+    - unit_price (Decimal): The unit price paid.
+    - total_price (Decimal): The stored line total.
   """
   products = CustomProductSerializer()
-  total_price = serializers.SerializerMethodField()
+  total_price = serializers.DecimalField(source='line_total', max_digits=12, decimal_places=2, read_only=True)
   class Meta:
     model = ShoppingOrderItem
-    fields = ['id', 'products', 'quantity', 'total_price']
-
-  def get_total_price(self, order_items: ShoppingOrderItem):
-    return order_items.products.unit_price * order_items.quantity
+    fields = ['id', 'products', 'quantity', 'unit_price', 'total_price']
   
 
 class ShoppingOrderSerializer(serializers.ModelSerializer):
@@ -90,25 +123,14 @@ class ShoppingOrderSerializer(serializers.ModelSerializer):
   - siteuser (SiteUser): The user who placed the order.
   - items (ShoppingOrderItem): The items included in the order.
   - payment_status (str): The current payment status of the order.
-  - total_price (float): The total price of all items in the order.
+  - total_price (Decimal): The stored total of the order.
+  - item_count (int): The number of units ordered.
   """
   items = ShoppingOrderItemSerializer(many=True)
-  total_price = serializers.SerializerMethodField()
+  total_price = serializers.DecimalField(source='total_amount', max_digits=12, decimal_places=2, read_only=True)
   class Meta:
     model = ShoppingOrder
-    fields = ['id', 'created_at', 'siteuser', 'items', 'payment_status', 'total_price']
-
-  def get_total_price(self, order_items: ShoppingOrder):
-    """
-    Calculate the total price of all items in the order.
-
-    Args:
-    - order_items (ShoppingOrder): The shopping order instance.
-
-    Returns:
-    - float: The total price of all items in the order.
-    """
-    return sum([item.products.unit_price * item.quantity for item in order_items.items.all()])
+    fields = ['id', 'created_at', 'siteuser', 'items', 'payment_status', 'total_price', 'item_count']
 
 class ReviewSerializer(serializers.ModelSerializer):
   """
@@ -137,8 +159,8 @@ class ReviewSerializer(serializers.ModelSerializer):
     Returns:
     - Review: The created review instance.
     """
-    products_id = self.context['products_id']
-    return Review.objects.create(products_id=products_id, **validated_data)
+    product_id = self.context['product_id']
+    return Review.objects.create(product_id=product_id, **validated_data)
 
 
 class AddShoppingCartItemSerializer(serializers.ModelSerializer):
@@ -154,31 +176,19 @@ class AddShoppingCartItemSerializer(serializers.ModelSerializer):
   """
   product_id = serializers.IntegerField()
 
-  def validate_products_id(self, new_id):
-    """
-    Validate the product ID.
-
-    Args:
-    - new_id (int): The new product ID to be validated.
-
-    Raises:
-    - serializers.ValidationError: If the product ID is invalid.
-
-    Returns:
-    - int: The validated product ID.
-    """
-    if Products.objects.filter(pk=new_id) is None:
-      raise serializers.ValidationError(
-        f"This {product_id} is invalid id insertion.")
-      return new_id
-  
   def save(self, **kwargs):
     """
-    Save the new item to the shopping cart.
+    Add the item to the shopping cart through the configured cart store,
+    a single atomic upsert with the database store, see
+    ShoppingCartItem.objects.add(). Adding a product that is already in
+    the cart increases its quantity.
 
     Args:
     - **kwargs: Additional keyword arguments.
 
+    Raises:
+    - serializers.ValidationError: If the cart or product does not exist.
+
     Returns:
     - ShoppingCartItem: The saved shopping cart item instance.
     """
@@ -186,15 +196,10 @@ class AddShoppingCartItemSerializer(serializers.ModelSerializer):
     cart_id = self.context['cart_id']
     product_id = self.validated_data['product_id']
 
-    try:
-      new_item = ShoppingCartItem.objects.get(cart_id=cart_id, product_id=product_id)
-      new_item.quantity += quantity # If you add the same product, it adds to the previous one
-      new_item.save()
-      self.instance = new_item
-    except ShoppingCartItem.DoesNotExist:
-      self.instance = ShoppingCartItem.objects.create(cart_id=cart_id,
-                                                      product_id=product_id,
-                                                      quantity=quantity)
+    self.instance = get_cart_store().add(cart_id, product_id, quantity)
+    if self.instance is None:
+      raise serializers.ValidationError(
+        {'product_id': f"Product {product_id} or cart {cart_id} does not exist."})
     return self.instance
   class Meta:
     model = ShoppingCartItem
@@ -224,14 +229,18 @@ class ShoppingCartItemSerializer(serializers.ModelSerializer):
   
   def get_total_price(self, items: ShoppingCartItem):
     """
-    Calculate the total price of the shopping cart item.
+    Return the total price of the shopping cart item, using the
+    line_total computed in SQL by with_line_totals() when present.
 
     Args:
     - items (ShoppingCartItem): The shopping cart item instance.
 
     Returns:
-    - float: The total price of the item based on quantity.
+    - Decimal: The total price of the item based on quantity.
     """
+    line_total = getattr(items, 'line_total', None)
+    if line_total is not None:
+      return line_total
     return items.product.unit_price * items.quantity
 
 class ShoppingCartSerializer(serializers.ModelSerializer):
@@ -257,15 +266,19 @@ class ShoppingCartSerializer(serializers.ModelSerializer):
   
   def get_total_price(self, cart: ShoppingCart):
     """
-    Calculate the total price of all items in the shopping cart.
+    Return the total price of all items in the shopping cart, using the
+    total_price aggregated in SQL by with_totals() when present.
 
     Args:
     - cart (ShoppingCart): The shopping cart instance.
 
     Returns:
-    - float: The total price of all items in the cart.
+    - Decimal: The total price of all items in the cart.
     """
-    return sum([item.product.unit_price * item.quantity for item in cart.cartitems.all()])
+    total = getattr(cart, 'total_price', None)
+    if total is not None:
+      return total
+    return sum([self.fields['cartitems'].child.get_total_price(item) for item in cart.cartitems.all()])
 
 class UpdateShoppingCartItemSerializer(serializers.ModelSerializer):
   """
@@ -282,75 +295,122 @@ class UpdateShoppingCartItemSerializer(serializers.ModelSerializer):
     fields = ['quantity']
 
 
-class NewOrderSerializer(serializers.Serializer):
+class CartOperationSerializer(serializers.Serializer):
   """
-  Serializer for creating a new shopping order.
+  A single operation of a batch cart update.
 
-  This serializer handles the validation and saving of a new
-  shopping order based on the provided cart ID.
+  Fields:
+  - op (str): 'add' to increase the quantity, 'set' to replace it,
+    'remove' to drop the product from the cart.
+  - product_id (int): The product the operation applies to.
+  - quantity (int): Units to add or the new quantity; not used by 'remove'.
+    Setting a quantity of 0 removes the product.
+  """
+  OPERATIONS = ['add', 'set', 'remove']
+
+  op = serializers.ChoiceField(choices=OPERATIONS)
+  product_id = serializers.IntegerField(min_value=1)
+  quantity = serializers.IntegerField(min_value=0, max_value=32767, required=False)
+
+  def validate(self, data):
+    if data['op'] == 'add' and not data.get('quantity'):
+      raise serializers.ValidationError({'quantity': 'add needs a quantity of at least 1.'})
+    if data['op'] == 'set' and 'quantity' not in data:
+      raise serializers.ValidationError({'quantity': 'set needs a quantity.'})
+    return data
+
+
+class BatchCartSerializer(serializers.Serializer):
+  """
+  Serializer applying a list of add, set and remove operations to a cart
+  in one transaction.
+
+  All product ids are validated with a single IN query. Operations are
+  folded per product in order, then applied by the cart store; the
+  database store needs at most one DELETE, one upsert for absolute
+  quantities and one multi-row upsert for increments.
 
   Fields:
-  - cart_id (UUID): The unique identifier of the shopping cart to be ordered.
+  - operations (list): CartOperationSerializer items, at most MAX_OPERATIONS.
   """
-  cart_id = serializers.UUIDField()
+  MAX_OPERATIONS = 500
+
+  operations = CartOperationSerializer(many=True, allow_empty=False, max_length=MAX_OPERATIONS)
+
+  def validate_operations(self, operations):
+    product_ids = {operation['product_id'] for operation in operations}
+    found = set(Products.objects.filter(pk__in=product_ids).values_list('pk', flat=True))
+    missing = sorted(product_ids - found)
+    if missing:
+      raise serializers.ValidationError(f"Unknown product ids: {', '.join(map(str, missing))}.")
+    return operations
 
-  def validate_cart_id(self, id):
+  @staticmethod
+  def fold(operations):
     """
-    Validate the cart ID.
+    Reduce the operations to one change per product.
 
-    Args:
-    - id (UUID): The cart ID to be validated.
+    Returns:
+    - tuple: (absolute quantities, increments, removed product ids)
+    """
+    absolute, increments = {}, {}
+    for operation in operations:
+      product_id = operation['product_id']
+      if operation['op'] == 'add':
+        if product_id in absolute:
+          absolute[product_id] += operation['quantity']
+        else:
+          increments[product_id] = increments.get(product_id, 0) + operation['quantity']
+      else:
+        increments.pop(product_id, None)
+        absolute[product_id] = operation.get('quantity', 0) if operation['op'] == 'set' else 0
+    removed = [product_id for product_id, quantity in absolute.items() if quantity == 0]
+    absolute = {product_id: quantity for product_id, quantity in absolute.items() if quantity}
+    return absolute, increments, removed
 
-    Raises:
-    - serializers.ValidationError: If the cart ID is invalid or the cart is empty.
+  def save(self, **kwargs):
+    """
+    Apply the operations and return the updated cart.
 
     Returns:
-    - UUID: The validated cart ID.
+    - ShoppingCart: The cart with its totals, as returned by the cart store.
     """
-    if ShoppingCart.objects.filter(pk=id) is None:
-      raise serializers.ValidationError(
-        f"This {id} is an invalid id."
-      )
-    if ShoppingCartItem.objects.filter(cart_id=id).count() == 0:
-      raise serializers.ValidationError(
-        f"{id}: is empty"
-      )
-    return id
+    absolute, increments, removed = self.fold(self.validated_data['operations'])
+    return get_cart_store().apply(self.context['cart_id'], absolute, increments, removed)
+
+
+class NewOrderSerializer(serializers.Serializer):
+  """
+  Serializer for creating a new shopping order.
+
+  This serializer handles the validation and saving of a new
+  shopping order based on the provided cart ID.
+
+  Fields:
+  - cart_id (UUID): The unique identifier of the shopping cart to be ordered.
+  """
+  cart_id = serializers.UUIDField()
 
   def save(self, **kwargs):
     """
-    Save the new shopping order.
+    Place the order through the store.orders.OrderPlacement pipeline,
+    which validates the cart, reserves its stock until the payment
+    settles and deletes the cart in a fixed number of queries.
 
     Args:
     - **kwargs: Additional keyword arguments.
 
+    Raises:
+    - serializers.ValidationError: If the cart ID is invalid, the cart is
+      empty or a product does not have enough stock; nothing is saved then.
+
     Returns:
     - ShoppingOrder: The created shopping order instance.
     """
-    with transaction.atomic():
-      user_id = self.context['user_id']
-      customer = SiteUser.objects.get(user_id=user_id)
-      my_order = ShoppingOrder.objects.create(siteuser=customer)
-      cart_id = self.validated_data['cart_id']
-      cartitems = ShoppingCartItem.objects.\
-                            select_related('product'). \
-                            filter(cart_id=cart_id)
-      order_list_items = []
-      index = 0
-      while index < len(cartitems):
-        item = cartitems[index]
-        order_list_items.append(
-          ShoppingOrderItem(
-            order=my_order,
-            products=item.product,
-            unit_price=item.product.unit_price,
-            quantity=item.quantity
-          )
-        )
-        index += 1 
-      ShoppingOrderItem.objects.bulk_create(order_list_items)
-      ShoppingCart.objects.filter(pk=cart_id).delete()
-      return my_order
+    try:
+      return place_order(self.context['user_id'], self.validated_data['cart_id'])
+    except (OrderError, OutOfStock) as error:
+      raise serializers.ValidationError({'cart_id': [str(error)]})
 
 
 
@@ -367,3 +427,74 @@ class UpdateShoppingOrderSerializer(serializers.ModelSerializer):
   class Meta:
     model = ShoppingOrder
     fields = ['payment_status']
+
+  def validate_payment_status(self, value):
+    if self.instance is not None and value != self.instance.payment_status \
+        and not self.instance.can_transition(value):
+      raise serializers.ValidationError(
+        f"An order cannot move from {self.instance.get_payment_status_display()} to "
+        f"{dict(ShoppingOrder.PAYMENT_STATUS_CHOICES)[value]}.")
+    return value
+
+
+class OrderTransitionSerializer(serializers.Serializer):
+  """
+  Serializer for moving many orders to one payment status, see
+  store.orders.transition_orders.
+
+  Fields:
+  - ids (list): The order ids, at most MAX_IDS.
+  - payment_status (str): The target payment status.
+  """
+  MAX_IDS = 10000
+
+  ids = serializers.ListField(child=serializers.IntegerField(min_value=1), min_length=1, max_length=MAX_IDS)
+  payment_status = serializers.ChoiceField(choices=ShoppingOrder.PAYMENT_STATUS_CHOICES)
+
+
+class PaymentJobSerializer(serializers.ModelSerializer):
+  """
+  Serializer for polling a queued payment, see store.payments.
+
+  Fields:
+  - status (str): Queued, Running, Succeeded or Failed.
+  - payment_url (str): Where to pay, once the job succeeded.
+  - client_secret (str): For client-side payment forms, once succeeded.
+  - last_error (str): Why the latest attempt failed.
+  """
+  status = serializers.CharField(source='get_status_display')
+
+  class Meta:
+    model = PaymentJob
+    fields = ['id', 'order', 'provider', 'status', 'attempts', 'payment_url', 'reference',
+              'client_secret', 'last_error', 'created_at', 'updated_at']
+
+
+class SalesReportQuerySerializer(serializers.Serializer):
+  """
+  Validates the query parameters of the sales report, see
+  store.views.SalesReportViewSet.
+
+  Fields:
+  - start (date): First day included, 30 days before end by default.
+  - end (date): Last day included, today by default.
+  - group_by (str): 'day', 'product' or 'category'.
+  - category (int): Only count this category, as recorded when each
+    sale was made. Product rollups do not record it, so it cannot be
+    combined with group_by=product.
+  """
+  GROUPS = ('day', 'product', 'category')
+
+  start = serializers.DateField(required=False)
+  end = serializers.DateField(required=False)
+  group_by = serializers.ChoiceField(choices=GROUPS, default='category')
+  category = serializers.IntegerField(required=False)
+
+  def validate(self, attrs):
+    attrs.setdefault('end', timezone.localdate())
+    attrs.setdefault('start', attrs['end'] - timedelta(days=30))
+    if attrs['start'] > attrs['end']:
+      raise serializers.ValidationError({'start': 'start must not be after end.'})
+    if 'category' in attrs and attrs['group_by'] == 'product':
+      raise serializers.ValidationError({'category': 'category cannot be combined with group_by=product.'})
+    return attrs
@@ -1,9 +1,147 @@
 from django.conf import settings
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, pre_delete, pre_save
+from django.db import transaction
 from django.dispatch import receiver
-from .models import SiteUser
+from .models import SiteUser, Products, Category, ShoppingOrder, ShoppingOrderItem
+from .counters import adjust_product_count
+from .cache import bump_catalog_version
+from .images import schedule_derivatives
+from .stock import settle_reservations
+from .analytics import record_sales
+from . import search
 
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def create_customer(sender, **kwargs):  
   if kwargs['created']:
-    SiteUser.objects.create(user=kwargs['instance'])
\ No newline at end of file
+    SiteUser.objects.create(user=kwargs['instance'])
+
+@receiver(post_save, sender=Products)
+def index_product(sender, instance, created, **kwargs):
+  """
+  Keep the product search index in sync after a product is saved.
+  Saves that leave the name, description and category alone skip it.
+  """
+  indexed = (instance.name, instance.description, instance.category_id)
+  if not created and indexed == getattr(instance, '_loaded_search', None):
+    return
+  search.index_product(instance)
+  instance._loaded_search = indexed
+
+@receiver(pre_save, sender=Products)
+def load_category(sender, instance, raw=False, **kwargs):
+  """
+  Read the stored category_id of a product that was not loaded with it,
+  e.g. built by hand with a primary key or loaded with only(), so that
+  count_product knows which category it leaves.
+  """
+  if raw or instance.pk is None or getattr(instance, '_loaded_category_id', None) is not None:
+    return
+  instance._loaded_category_id = (Products.objects.filter(pk=instance.pk)
+                                  .values_list('category_id', flat=True).first())
+
+@receiver(post_save, sender=Products)
+def count_product(sender, instance, created, raw=False, **kwargs):
+  """
+  Keep Category.product_count in step when a product is created or
+  moved to another category. An update whose previous category is
+  unknown is left to the reconcile_category_counts command.
+  """
+  if raw:
+    return
+  previous = None if created else getattr(instance, '_loaded_category_id', None)
+  if not created and previous is None:
+    return
+  if previous != instance.category_id:
+    adjust_product_count(previous, -1)
+    adjust_product_count(instance.category_id, 1)
+  instance._loaded_category_id = instance.category_id
+
+@receiver(post_delete, sender=Products)
+def uncount_product(sender, instance, **kwargs):
+  """
+  Decrement Category.product_count when a product is deleted.
+  """
+  adjust_product_count(getattr(instance, '_loaded_category_id', None) or instance.category_id, -1)
+
+@receiver(post_delete, sender=Products)
+def unindex_product(sender, instance, **kwargs):
+  """
+  Drop a deleted product from the search index.
+  """
+  search.remove_product(instance.id)
+
+@receiver(post_save, sender=Category)
+def index_category(sender, instance, created, **kwargs):
+  """
+  Re-index the products of a category when it is renamed.
+  """
+  if not created:
+    search.index_category(instance)
+
+@receiver(post_save, sender=Products)
+@receiver(post_delete, sender=Products)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_catalog(sender, **kwargs):
+  """
+  Bump the catalog version so cached pages and facets are dropped.
+  """
+  bump_catalog_version()
+
+@receiver(post_save, sender=Products)
+def process_product_image(sender, instance, created, raw=False, **kwargs):
+  """
+  Generate image derivatives off the request thread once a new image
+  has been committed.
+  """
+  name = instance.image.name if instance.image else None
+  if raw or not name or name == getattr(instance, '_loaded_image', None):
+    return
+  instance._loaded_image = name
+  transaction.on_commit(lambda: schedule_derivatives(name))
+
+@receiver(post_save, sender=ShoppingOrder)
+def settle_order_stock(sender, instance, created, raw=False, **kwargs):
+  """
+  Keep reserved stock sold when an order's payment completes and put it
+  back when the payment fails. Orders entering or leaving the complete
+  status are added to or taken out of the sales rollups.
+  """
+  previous = None if created else getattr(instance, '_loaded_payment_status', None)
+  if raw or previous == instance.payment_status:
+    return
+  instance._loaded_payment_status = instance.payment_status
+  if previous is not None:
+    settle_reservations([instance.id], instance.payment_status)
+    if ShoppingOrder.PAYMENT_STATUS_COMPLETE in (previous, instance.payment_status):
+      record_sales([instance.id], 1 if instance.payment_status == ShoppingOrder.PAYMENT_STATUS_COMPLETE else -1)
+
+@receiver(pre_save, sender=ShoppingOrderItem)
+@receiver(pre_delete, sender=ShoppingOrderItem)
+def unrecord_order_sales(sender, instance, raw=False, **kwargs):
+  """
+  Take a completed order out of the sales rollups before one of its
+  items is added, edited (e.g. in the admin) or removed;
+  refresh_order_totals adds it back once the change is written.
+  """
+  if raw:
+    return
+  instance._unrecorded_sales = ShoppingOrder.objects.filter(
+    pk=instance.order_id, payment_status=ShoppingOrder.PAYMENT_STATUS_COMPLETE).exists()
+  if instance._unrecorded_sales:
+    record_sales([instance.order_id], -1)
+
+@receiver(post_save, sender=ShoppingOrderItem)
+@receiver(post_delete, sender=ShoppingOrderItem)
+def refresh_order_totals(sender, instance, raw=False, **kwargs):
+  """
+  Recompute the stored order totals after an item is added, edited
+  (e.g. in the admin) or removed, and put a completed order back into
+  the sales rollups.
+  """
+  if raw:
+    return
+  ShoppingOrder.objects.filter(pk=instance.order_id).refresh_totals()
+  if getattr(instance, '_unrecorded_sales', False):
+    instance._unrecorded_sales = False
+    record_sales([instance.order_id], 1)
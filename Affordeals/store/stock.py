@@ -0,0 +1,233 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Case, F, IntegerField, OuterRef, Subquery, Value, When
+from django.utils import timezone
+
+from .cache import bump_catalog_version
+from .models import Products, ShoppingCartItem, ShoppingOrder, StockReservation
+
+
+# Seconds a pending order holds its units before they go back on sale.
+DEFAULT_RESERVATION_TTL = 15 * 60
+
+
+class OutOfStock(Exception):
+    """
+    Raised when an order asks for more units than are in stock.
+
+    Attributes:
+    - product_ids (list): The products that are short.
+    """
+    def __init__(self, product_ids):
+        self.product_ids = product_ids
+        super().__init__(f"Not enough stock for products {', '.join(map(str, product_ids))}")
+
+
+def reservation_ttl():
+    return getattr(settings, 'STORE_RESERVATION_TTL', DEFAULT_RESERVATION_TTL)
+
+
+def per_product(quantities):
+    """
+    CASE expression mapping each product id to its quantity, so a whole
+    order can be checked and applied by one UPDATE.
+    """
+    return Case(*[When(pk=product_id, then=Value(quantity)) for product_id, quantity in quantities.items()],
+                output_field=IntegerField())
+
+
+def reserve_stock(order_id, quantities, ttl=None):
+    """
+    Take the units of an order out of stock and hold them for the order.
+
+    All products are decremented by a single conditional
+    UPDATE ... SET quantity_in_stock = quantity_in_stock - n
+    WHERE id IN (...) AND quantity_in_stock >= n, so concurrent buyers
+    can never drive stock below zero. If any product is short, nothing
+    is reserved. The catalog version is bumped once the transaction
+    commits, since product pages, facets and ETags show the stock.
+
+    Args:
+    - order_id (int): The pending order.
+    - quantities (dict): product id -> units.
+    - ttl (int): Seconds to hold the units, STORE_RESERVATION_TTL by default.
+
+    Raises:
+    - OutOfStock: If any product has fewer units than requested.
+
+    Returns:
+    - list: The created StockReservation rows.
+    """
+    quantities = {product_id: quantity for product_id, quantity in quantities.items() if quantity > 0}
+    if not quantities:
+        return []
+    needed = per_product(quantities)
+    expires_at = timezone.now() + timedelta(seconds=reservation_ttl() if ttl is None else ttl)
+    try:
+        with transaction.atomic():
+            updated = (Products.objects
+                       .filter(pk__in=list(quantities), quantity_in_stock__gte=needed)
+                       .update(quantity_in_stock=F('quantity_in_stock') - needed, updated_at=timezone.now()))
+            if updated != len(quantities):
+                raise OutOfStock([])
+            reservations = StockReservation.objects.bulk_create([
+                StockReservation(order_id=order_id, product_id=product_id,
+                                 quantity=quantity, expires_at=expires_at)
+                for product_id, quantity in quantities.items()
+            ])
+    except OutOfStock:
+        available = Products.objects.filter(pk__in=list(quantities), quantity_in_stock__gte=needed)
+        raise OutOfStock(sorted(set(quantities) - set(available.values_list('pk', flat=True))))
+    transaction.on_commit(bump_catalog_version)
+    return reservations
+
+
+def reserve_cart_stock(order_id, cart_id, lines, ttl=None):
+    """
+    reserve_stock() for the whole content of a cart, in a fixed number
+    of statements whatever its size: one conditional UPDATE reading the
+    quantities from the cart through a correlated subquery, and one
+    INSERT ... SELECT for the reservations.
+
+    Args:
+    - order_id (int): The pending order.
+    - cart_id (UUID): The cart being converted.
+    - lines (int): The number of lines in the cart.
+    - ttl (int): Seconds to hold the units, STORE_RESERVATION_TTL by default.
+
+    Raises:
+    - OutOfStock: If any product has fewer units than the cart asks for.
+    """
+    cart_lines = ShoppingCartItem.objects.filter(cart_id=cart_id)
+    needed = Subquery(cart_lines.filter(product_id=OuterRef('pk')).values('quantity')[:1])
+    in_cart = Products.objects.filter(pk__in=cart_lines.values('product_id'))
+    expires_at = timezone.now() + timedelta(seconds=reservation_ttl() if ttl is None else ttl)
+    try:
+        with transaction.atomic():
+            updated = (in_cart.filter(quantity_in_stock__gte=needed)
+                       .update(quantity_in_stock=F('quantity_in_stock') - needed, updated_at=timezone.now()))
+            if updated != lines:
+                raise OutOfStock([])
+            connection = connections[StockReservation.objects.db]
+            quote = connection.ops.quote_name
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'INSERT INTO {quote(StockReservation._meta.db_table)} '
+                    f'(order_id, product_id, quantity, expires_at) '
+                    f'SELECT %s, product_id, quantity, %s FROM {quote(ShoppingCartItem._meta.db_table)} '
+                    f'WHERE cart_id = %s',
+                    [order_id,
+                     StockReservation._meta.get_field('expires_at').get_db_prep_value(expires_at, connection),
+                     ShoppingCartItem._meta.get_field('cart').get_db_prep_value(cart_id, connection)])
+    except OutOfStock:
+        short = in_cart.filter(quantity_in_stock__lt=needed).values_list('pk', flat=True)
+        raise OutOfStock(sorted(short))
+    transaction.on_commit(bump_catalog_version)
+
+
+def take_reservations(order_ids):
+    """
+    Delete the reservations of some orders and return exactly the rows
+    this call deleted, so two concurrent releases never restock twice.
+    """
+    connection = connections[StockReservation.objects.db]
+    if connection.vendor not in ('sqlite', 'postgresql'):
+        rows = list(StockReservation.objects.select_for_update()
+                    .filter(order_id__in=order_ids).values_list('id', 'product_id', 'quantity'))
+        StockReservation.objects.filter(id__in=[row[0] for row in rows]).delete()
+        return [row[1:] for row in rows]
+    table = connection.ops.quote_name(StockReservation._meta.db_table)
+    placeholders = ', '.join(['%s'] * len(order_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {table} WHERE order_id IN ({placeholders}) RETURNING product_id, quantity',
+            list(order_ids))
+        return cursor.fetchall()
+
+
+def release_reservations(order_ids):
+    """
+    Put the units held by some orders back in stock, with one UPDATE for
+    all products, e.g. after their payment failed.
+
+    Args:
+    - order_ids (list): The orders to release.
+
+    Returns:
+    - int: The number of units put back.
+    """
+    if not order_ids:
+        return 0
+    with transaction.atomic():
+        totals = {}
+        for product_id, quantity in take_reservations(order_ids):
+            totals[product_id] = totals.get(product_id, 0) + quantity
+        if totals:
+            Products.objects.filter(pk__in=list(totals)).update(
+                quantity_in_stock=F('quantity_in_stock') + per_product(totals), updated_at=timezone.now())
+            transaction.on_commit(bump_catalog_version)
+    return sum(totals.values())
+
+
+def commit_reservations(order_ids):
+    """
+    Drop the reservations of paid orders; their units stay sold.
+
+    Args:
+    - order_ids (list): The orders whose payment completed.
+
+    Returns:
+    - int: The number of reservations dropped.
+    """
+    if not order_ids:
+        return 0
+    deleted, _ = StockReservation.objects.filter(order_id__in=order_ids).delete()
+    return deleted
+
+
+def settle_reservations(order_ids, payment_status):
+    """
+    Apply a payment outcome to the reservations of some orders.
+
+    Args:
+    - order_ids (list): Orders that moved to payment_status.
+    - payment_status (str): One of ShoppingOrder.PAYMENT_STATUS_*.
+    """
+    if payment_status == ShoppingOrder.PAYMENT_STATUS_COMPLETE:
+        commit_reservations(order_ids)
+    elif payment_status == ShoppingOrder.PAYMENT_STATUS_FAILED:
+        release_reservations(order_ids)
+
+
+def release_expired_reservations(now=None, chunk_size=500):
+    """
+    Fail pending orders whose reservations expired and put their units
+    back in stock. Expired reservations left behind by orders that were
+    settled without signals are committed or released to match.
+
+    Args:
+    - now (datetime): The reference time, timezone.now() by default.
+    - chunk_size (int): Orders handled per transaction.
+
+    Returns:
+    - tuple: (orders failed, units released)
+    """
+    now = now or timezone.now()
+    failed = released = 0
+    while True:
+        order_ids = list(StockReservation.objects.filter(expires_at__lt=now)
+                         .order_by('order_id').values_list('order_id', flat=True).distinct()[:chunk_size])
+        if not order_ids:
+            break
+        with transaction.atomic():
+            failed += ShoppingOrder.objects.filter(
+                pk__in=order_ids, payment_status=ShoppingOrder.PAYMENT_STATUS_PENDING
+            ).update(payment_status=ShoppingOrder.PAYMENT_STATUS_FAILED)
+            statuses = dict(ShoppingOrder.objects.filter(pk__in=order_ids).values_list('id', 'payment_status'))
+            released += release_reservations(
+                [pk for pk in order_ids if statuses.get(pk) == ShoppingOrder.PAYMENT_STATUS_FAILED])
+            commit_reservations(
+                [pk for pk in order_ids if statuses.get(pk) == ShoppingOrder.PAYMENT_STATUS_COMPLETE])
+    return failed, released
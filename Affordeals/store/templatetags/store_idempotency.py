@@ -0,0 +1,21 @@
+import uuid
+
+from django import template
+
+
+register = template.Library()
+
+
+@register.simple_tag
+def idempotency_key():
+    """
+    Return a fresh key for one link to a view wrapped in
+    store.idempotency.idempotent_view, so a double click or a retried
+    request replays the first response instead of repeating it. Each call
+    returns a new key, since a key may only ever cover one request.
+
+    Usage:
+    - {% load store_idempotency %}
+    - <a href="{% url 'checkout' product.id %}?idempotency_key={% idempotency_key %}">
+    """
+    return uuid.uuid4().hex
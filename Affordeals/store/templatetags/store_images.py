@@ -0,0 +1,30 @@
+from django import template
+from django.utils.html import format_html, format_html_join
+
+from store.images import MIME_TYPES, derivative_urls
+
+
+register = template.Library()
+
+
+@register.simple_tag
+def product_picture(image, size='card', css_class='', style=''):
+    """
+    Render a <picture> element for a product image, offering the
+    generated AVIF/WebP derivatives of the requested size and falling
+    back to the resized JPEG, then to the original upload.
+
+    Usage:
+    - {% load store_images %}
+    - {% product_picture product.image 'card' 'card-img-top' %}
+    """
+    if not image:
+        return ''
+    urls = derivative_urls(image.name, size)
+    fallback = urls.pop('jpeg', None) or image.url
+    sources = format_html_join(
+        '', '<source srcset="{}" type="{}">',
+        ((url, MIME_TYPES[fmt]) for fmt, url in urls.items()))
+    return format_html(
+        '<picture>{}<img src="{}" class="{}" style="{}" loading="lazy" /></picture>',
+        sources, fallback, css_class, style)
@@ -1,3 +1,1127 @@
-from django.test import TestCase
+import hashlib
+import hmac
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import IntegrityError, OperationalError, connection, connections, transaction
+from django.template import Context, Template
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from main.models import User
+from .cache import get_catalog_version
+from .carts import get_cart_store, reset_cart_store
+from .catalog_io import ProductImporter
+from .checks import check_shared_cache
+from .images import build_derivatives, derivative_formats, derivative_sizes, forget_manifest
+from .models import Category, CategoryDailySales, IdempotencyKey, Products, ShoppingCart, ShoppingCartItem, ShoppingOrder, \
+    PaymentEvent, PaymentJob, ProductDailySales, ShoppingOrderItem, StockReservation
+from .orders import place_order
+from .pagination import approximate_count, encode_cursor
+from .payments import PaymentError, StubProvider, claim_jobs, enqueue_payment, get_provider, run_pending
+from .search import SEARCH_TABLE, search_enabled
+from .stock import OutOfStock, release_reservations, reserve_stock
+from .webhooks import apply_events
+
+
+class KeysetPaginationTests(TestCase):
+    """
+    Catalog pages seek on (category_id, id): every product is listed once
+    in a stable order across ties, both ways, and bad cursors are refused.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        categories = [Category.objects.create(name=f'Keyset {index}') for index in range(3)]
+        Products.objects.bulk_create([
+            Products(name=f'Keyset {index}', category=categories[index % 3], description='',
+                     unit_price=Decimal('1.00'), quantity_in_stock=1)
+            for index in range(25)
+        ])
+        cls.expected = list(Products.objects.order_by('category_id', 'id').values_list('id', flat=True))
+
+    def page(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_next_and_previous_walk_the_ordering(self):
+        pages, url = [], '/store/product/?page_size=10'
+        while url:
+            body = self.page(url)
+            pages.append(body)
+            url = body['next']
+        seen = [product['id'] for body in pages for product in body['results']]
+        self.assertEqual(seen, self.expected)
+        self.assertEqual([len(body['results']) for body in pages], [10, 10, 5])
+        self.assertIsNone(pages[0]['previous'])
+
+        back = self.page(pages[2]['previous'])
+        self.assertEqual(back['results'], pages[1]['results'])
+        self.assertEqual(self.page(back['previous'])['results'], pages[0]['results'])
+
+    def test_invalid_cursors_are_refused(self):
+        for cursor in ('not-a-cursor', encode_cursor([1]), encode_cursor(['x', 'y'])):
+            response = self.client.get('/store/product/', {'cursor': cursor})
+            self.assertEqual(response.status_code, 404, cursor)
+        self.assertEqual(self.client.get('/products/', {'cursor': 'not-a-cursor'}).status_code, 200)
+
+    def test_catalog_page_links_keep_the_query_string(self):
+        response = self.client.get('/products/', {'with_count': '1'})
+        self.assertContains(response, 'About 25 products.')
+        next_url = response.context['next_url']
+        self.assertIn('with_count=1', next_url)
+        response = self.client.get('/products/' + next_url)
+        self.assertContains(response, 'About 25 products.')
+        self.assertIn('with_count=1', response.context['previous_url'])
+        self.assertEqual(response.context['first_url'], '?with_count=1')
+
+    def test_approximate_count_reads_sqlite_statistics(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('SQLite statistics')
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        Products.objects.filter(pk=self.expected[0]).delete()
+        # The statistics, not a fresh COUNT(*), answer the estimate.
+        self.assertEqual(approximate_count(Products.objects.all()), 25)
+
+
+class SearchIndexTests(TestCase):
+    """
+    The FTS5 index follows product saves and deletes and category
+    renames, and skips saves that leave the indexed columns alone.
+    """
+    def setUp(self):
+        if not search_enabled():
+            self.skipTest('FTS5 search index')
+        self.category = Category.objects.create(name='Kitchen')
+        self.product = Products.objects.create(name='Blue kettle', category=self.category, description='Boils fast',
+                                               unit_price=Decimal('20.00'), quantity_in_stock=1,
+                                               image='products/kettle.jpg')
+
+    def found(self, text):
+        response = self.client.get('/store/product/search/', {'q': text})
+        self.assertEqual(response.status_code, 200)
+        return [product['id'] for product in response.json()['results']]
+
+    def test_index_follows_writes(self):
+        response = self.client.get('/store/product/search/', {'q': 'kettle'})
+        self.assertTrue(response.json()['results'][0]['images']['original'].startswith('http://testserver/'))
+
+        self.product.name = 'Red teapot'
+        self.product.save()
+        self.assertEqual(self.found('kettle'), [])
+        self.assertEqual(self.found('teapot'), [self.product.id])
+
+        self.category.name = 'Cookware'
+        self.category.save()
+        self.assertEqual(self.found('cookware'), [self.product.id])
+
+        self.product.delete()
+        self.assertEqual(self.found('teapot'), [])
+
+    def test_unchanged_save_skips_the_index(self):
+        product = Products.objects.get(pk=self.product.pk)
+        product.unit_price = Decimal('25.00')
+        with CaptureQueriesContext(connection) as queries:
+            product.save()
+        self.assertFalse([query for query in queries if SEARCH_TABLE in query['sql']])
+
+    def test_rebuild_search_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+        self.assertEqual(self.found('kettle'), [])
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        self.assertIn('Indexed 1 products', out.getvalue())
+        self.assertEqual(self.found('kettle'), [self.product.id])
+
+
+class ProductFacetTests(TestCase):
+    """
+    Filtered listings and facet counts, each facet counted without its
+    own filter.
+    """
+    def setUp(self):
+        self.kitchen = Category.objects.create(name='Kitchen')
+        self.garden = Category.objects.create(name='Garden')
+        for category, price, stock in ((self.kitchen, '10.00', 1), (self.kitchen, '30.00', 0),
+                                       (self.kitchen, '60.00', 1), (self.garden, '20.00', 1),
+                                       (self.garden, '120.00', 1)):
+            Products.objects.create(name=f'{category.name} {price}', category=category,
+                                    unit_price=Decimal(price), quantity_in_stock=stock)
+
+    def facets(self, **params):
+        response = self.client.get('/store/product/facets/', params)
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        return ({row['id']: row['count'] for row in body['categories']},
+                {row['bucket']: row['count'] for row in body['price'] if row['count']})
+
+    def test_list_filters(self):
+        response = self.client.get('/store/product/', {'category': self.kitchen.id, 'min_price': '20',
+                                                       'in_stock': 'true'})
+        self.assertEqual([row['unit_price'] for row in response.json()['results']], ['60.00'])
+        self.assertEqual(self.client.get('/store/product/', {'min_price': 'x'}).status_code, 400)
+        self.assertEqual(self.client.get('/store/product/', {'min_price': '5', 'max_price': '1'}).status_code, 400)
+
+    def test_facets_ignore_their_own_filter(self):
+        categories, prices = self.facets()
+        self.assertEqual(categories, {self.kitchen.id: 3, self.garden.id: 2})
+        self.assertEqual(prices, {'0-25': 2, '25-50': 1, '50-100': 1, '100-250': 1})
+
+        categories, prices = self.facets(category=self.kitchen.id)
+        self.assertEqual(categories, {self.kitchen.id: 3, self.garden.id: 2})
+        self.assertEqual(prices, {'0-25': 1, '25-50': 1, '50-100': 1})
+
+        categories, prices = self.facets(category=self.kitchen.id, max_price='50', in_stock='true')
+        self.assertEqual(categories, {self.kitchen.id: 1, self.garden.id: 1})
+        self.assertEqual(prices, {'0-25': 1, '50-100': 1})
+
+
+class CategoryCountTests(TestCase):
+    """
+    Category.product_count follows product creates, moves and deletes,
+    however the product was loaded.
+    """
+    def setUp(self):
+        self.kitchen = Category.objects.create(name='Kitchen')
+        self.garden = Category.objects.create(name='Garden')
+        self.product = Products.objects.create(name='Kettle', category=self.kitchen, description='',
+                                               unit_price=Decimal('20.00'), quantity_in_stock=1)
+
+    def counts(self):
+        return dict(Category.objects.values_list('name', 'product_count'))
+
+    def test_create_move_and_delete(self):
+        self.assertEqual(self.counts(), {'Kitchen': 1, 'Garden': 0})
+        product = Products.objects.get(pk=self.product.pk)
+        product.category = self.garden
+        product.save()
+        self.assertEqual(self.counts(), {'Kitchen': 0, 'Garden': 1})
+        product.delete()
+        self.assertEqual(self.counts(), {'Kitchen': 0, 'Garden': 0})
+
+    def test_move_without_the_loaded_category(self):
+        deferred = Products.objects.only('name').get(pk=self.product.pk)
+        deferred.category_id = self.garden.id
+        deferred.save()
+        self.assertEqual(self.counts(), {'Kitchen': 0, 'Garden': 1})
+
+        built = Products(pk=self.product.pk, name='Kettle', category=self.kitchen, description='',
+                         unit_price=Decimal('20.00'), quantity_in_stock=1)
+        built.save()
+        self.assertEqual(self.counts(), {'Kitchen': 1, 'Garden': 0})
+        built.save()
+        self.assertEqual(self.counts(), {'Kitchen': 1, 'Garden': 0})
+
+    def test_reconcile_category_counts(self):
+        Category.objects.update(product_count=5)
+        out = StringIO()
+        call_command('reconcile_category_counts', '--dry-run', stdout=out)
+        self.assertIn('Found 2 drifted categories.', out.getvalue())
+        self.assertEqual(self.counts(), {'Kitchen': 5, 'Garden': 5})
+        call_command('reconcile_category_counts', stdout=StringIO())
+        self.assertEqual(self.counts(), {'Kitchen': 1, 'Garden': 0})
+
+
+class ImageDerivativeTests(TestCase):
+    """
+    Derivatives are generated once per image, and pages find them
+    through the cached manifest instead of probing the storage.
+    """
+    def setUp(self):
+        from PIL import Image
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        overrides = override_settings(MEDIA_ROOT=media.name, STORE_IMAGE_FORMATS=('webp', 'jpeg'))
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        cache.clear()
+        os.makedirs(os.path.join(media.name, 'media'))
+        self.path = os.path.join(media.name, 'media', 'canon.png')
+        Image.new('RGB', (800, 600), 'red').save(self.path)
+        self.product = Products(name='Canon', image='media/canon.png')
+
+    def render(self):
+        return Template("{% load store_images %}{% product_picture product.image 'card' %}").render(
+            Context({'product': self.product}))
+
+    def test_build_derivatives(self):
+        from PIL import Image
+        self.assertEqual(build_derivatives(self.path, derivative_sizes(), derivative_formats()), 4)
+        with Image.open(os.path.join(os.path.dirname(self.path), 'canon.thumb.webp')) as thumb:
+            self.assertEqual(thumb.size, (300, 300))
+        self.assertEqual(build_derivatives(self.path, derivative_sizes(), derivative_formats()), 0)
+        self.assertEqual(build_derivatives(self.path, derivative_sizes(), derivative_formats(), force=True), 4)
+
+    def test_template_tag_uses_the_manifest(self):
+        self.assertIn('<img src="/media/media/canon.png"', self.render())
+
+        build_derivatives(self.path, derivative_sizes(), derivative_formats())
+        self.assertNotIn('canon.card', self.render())
+        forget_manifest('media/canon.png')
+        html = self.render()
+        self.assertIn('<source srcset="/media/media/canon.card.webp" type="image/webp">', html)
+        self.assertIn('<img src="/media/media/canon.card.jpg"', html)
+
+        os.remove(os.path.join(os.path.dirname(self.path), 'canon.card.webp'))
+        self.assertEqual(self.render(), html)
+
+    def test_backfill_command_refreshes_the_manifest(self):
+        self.product.category = Category.objects.create(name='Cameras')
+        self.product.unit_price, self.product.quantity_in_stock = Decimal('10.00'), 1
+        self.product.save()
+        self.assertNotIn('canon.card', self.render())
+        call_command('generate_image_derivatives', stdout=StringIO())
+        self.assertIn('<source srcset="/media/media/canon.card.webp" type="image/webp">', self.render())
+
+
+class CatalogImportExportTests(TestCase):
+    """
+    Exported catalogs import back unchanged, and bad rows are rejected
+    one by one without aborting their batch.
+    """
+    def setUp(self):
+        self.category = Category.objects.create(name='Kitchen')
+        self.products = [Products.objects.create(name=f'Kettle {index}', category=self.category, description='Hot',
+                                                 unit_price=Decimal('19.99') + index, quantity_in_stock=index)
+                         for index in range(3)]
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.path = os.path.join(folder.name, 'products.csv')
+
+    def snapshot(self):
+        return list(Products.objects.order_by('id').values_list(
+            'id', 'name', 'category__name', 'description', 'unit_price', 'quantity_in_stock'))
+
+    def test_round_trip_with_bad_rows(self):
+        before = self.snapshot()
+        call_command('export_products', output=self.path, stderr=StringIO())
+        with open(self.path, 'a', newline='', encoding='utf-8') as stream:
+            stream.write('900,NaN price,Kitchen,,NaN,1\n'
+                         '901,Infinite price,Kitchen,,Infinity,1\n'
+                         '902,Huge price,Kitchen,,123456.00,1\n'
+                         '903,First copy,Kitchen,,5.00,1\n'
+                         '903,Second copy,Kitchen,,6.00,2\n')
+        err = StringIO()
+        call_command('import_products', self.path, batch_size=100, stdout=StringIO(), stderr=err)
+
+        errors = err.getvalue().splitlines()
+        self.assertEqual(len(errors), 3)
+        self.assertTrue(all('invalid unit_price' in error for error in errors))
+        self.assertEqual(self.snapshot(), before + [
+            (903, 'Second copy', 'Kitchen', '', Decimal('6.00'), 2)])
+        self.assertEqual(Category.objects.get(pk=self.category.pk).product_count, 4)
+
+    def test_rejected_rows_are_counted_but_only_a_sample_is_kept(self):
+        importer = ProductImporter(max_errors=2)
+        importer.run(({'name': f'Bad {index}', 'category': 'Kitchen', 'unit_price': 'NaN'}, None)
+                     for index in range(5))
+        self.assertEqual(importer.rejected, 5)
+        self.assertEqual(len(importer.errors), 2)
+
+
+class CartReadQueryBudgetTests(TestCase):
+    """
+    Reading a cart must cost the same small number of queries whatever
+    the number of items in it.
+    """
+    QUERY_BUDGET = 2
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('shopper', 'shopper@example.com', 'secret')
+        category = Category.objects.create(name='Gadgets')
+        cls.products = Products.objects.bulk_create([
+            Products(name=f'Gadget {index}', category=category, description='',
+                     unit_price=Decimal('1.50') + index, quantity_in_stock=10)
+            for index in range(500)
+        ])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def make_cart(self, size):
+        cart = ShoppingCart.objects.create()
+        ShoppingCartItem.objects.bulk_create([
+            ShoppingCartItem(cart=cart, product=product, quantity=2)
+            for product in self.products[:size]
+        ])
+        return cart
+
+    def assert_cart_read(self, size):
+        cart = self.make_cart(size)
+        with self.assertNumQueries(self.QUERY_BUDGET):
+            response = self.client.get(f'/store/carts/{cart.id}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['cartitems']), size)
+        expected = sum((product.unit_price * 2 for product in self.products[:size]), Decimal(0))
+        self.assertEqual(Decimal(response.data['total_price']), expected)
+        for item in response.data['cartitems']:
+            self.assertEqual(Decimal(item['total_price']),
+                             Decimal(item['product']['unit_price']) * item['quantity'])
+
+    def test_cart_with_one_item(self):
+        self.assert_cart_read(1)
+
+    def test_cart_with_500_items(self):
+        self.assert_cart_read(500)
+
+    def test_empty_cart_total_is_zero(self):
+        cart = ShoppingCart.objects.create()
+        response = self.client.get(f'/store/carts/{cart.id}/')
+        self.assertEqual(Decimal(response.data['total_price']), 0)
+
+
+class AddCartItemTests(TestCase):
+    """
+    Adding to a cart is a single upsert that sums quantities.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('adder', 'adder@example.com', 'secret')
+        category = Category.objects.create(name='Gadgets')
+        cls.product = Products.objects.create(name='Gadget', category=category, description='',
+                                              unit_price=Decimal('3.00'), quantity_in_stock=5)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.cart = ShoppingCart.objects.create()
+        self.url = f'/store/carts/{self.cart.id}/cartitems/'
+
+    def test_repeated_adds_sum_quantities_in_one_query(self):
+        self.client.post(self.url, {'product_id': self.product.id, 'quantity': 2}, format='json')
+        with self.assertNumQueries(1):
+            response = self.client.post(self.url, {'product_id': self.product.id, 'quantity': 3},
+                                        format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['quantity'], 5)
+        self.assertEqual(ShoppingCartItem.objects.get(cart=self.cart).quantity, 5)
+
+    def test_unknown_product_is_rejected(self):
+        response = self.client.post(self.url, {'product_id': 999999, 'quantity': 1}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ShoppingCartItem.objects.exists())
+
+
+class BatchCartTests(TestCase):
+    """
+    A batch of cart operations costs the same number of queries however
+    many operations it holds.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('batcher', 'batcher@example.com', 'secret')
+        category = Category.objects.create(name='Batches')
+        cls.products = Products.objects.bulk_create([
+            Products(name=f'Batch {index}', category=category, description='',
+                     unit_price=Decimal('1.50'), quantity_in_stock=10)
+            for index in range(300)
+        ])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def apply(self, cart, operations):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(f'/store/carts/{cart.id}/cartitems/batch/',
+                                        {'operations': operations}, format='json')
+        return response, len(queries)
+
+    def test_malformed_cart_ids_are_not_found(self):
+        responses = [
+            self.client.get('/store/carts/not-a-uuid/'),
+            self.client.delete('/store/carts/not-a-uuid/'),
+            self.client.get('/store/carts/not-a-uuid/cartitems/'),
+            self.client.post('/store/carts/not-a-uuid/cartitems/batch/', {'operations': []}, format='json'),
+        ]
+        self.assertEqual([response.status_code for response in responses], [404] * 4)
+        self.assertEqual(responses[0].json(), {'detail': 'Cart not found.'})
+
+        cart = ShoppingCart.objects.create()
+        self.assertEqual(self.client.get(f'/store/carts/{cart.id.hex.upper()}/').status_code, 200)
+
+    def test_operations_are_folded_per_product(self):
+        cart = ShoppingCart.objects.create()
+        first, second, third = self.products[:3]
+        ShoppingCartItem.objects.create(cart=cart, product=first, quantity=2)
+        ShoppingCartItem.objects.create(cart=cart, product=second, quantity=2)
+        response, _ = self.apply(cart, [
+            {'op': 'add', 'product_id': first.id, 'quantity': 3},
+            {'op': 'remove', 'product_id': second.id},
+            {'op': 'set', 'product_id': third.id, 'quantity': 4},
+            {'op': 'add', 'product_id': third.id, 'quantity': 1},
+        ])
+        self.assertEqual(response.status_code, 200)
+        quantities = dict(ShoppingCartItem.objects.filter(cart=cart).values_list('product_id', 'quantity'))
+        self.assertEqual(quantities, {first.id: 5, third.id: 5})
+        self.assertEqual(Decimal(response.data['total_price']), Decimal('15.00'))
+
+    def test_query_count_does_not_grow_with_operations(self):
+        small, small_queries = self.apply(ShoppingCart.objects.create(), [
+            {'op': 'add', 'product_id': self.products[0].id, 'quantity': 1},
+            {'op': 'set', 'product_id': self.products[1].id, 'quantity': 2},
+            {'op': 'remove', 'product_id': self.products[2].id},
+        ])
+        large, large_queries = self.apply(ShoppingCart.objects.create(), [
+            {'op': ('add', 'set', 'remove')[index % 3], 'product_id': product.id, 'quantity': 1}
+            for index, product in enumerate(self.products)
+        ])
+        self.assertEqual((small.status_code, large.status_code), (200, 200))
+        self.assertEqual(small_queries, large_queries)
+        self.assertEqual(len(large.data['cartitems']), 200)
+
+    def test_unknown_product_rejects_the_whole_batch(self):
+        cart = ShoppingCart.objects.create()
+        response, _ = self.apply(cart, [
+            {'op': 'add', 'product_id': self.products[0].id, 'quantity': 1},
+            {'op': 'add', 'product_id': 999999, 'quantity': 1},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ShoppingCartItem.objects.filter(cart=cart).exists())
+
+
+@override_settings(STORE_CART_BACKEND='cache', STORE_CART_FLUSH_INTERVAL=0)
+class CacheCartStoreTests(TestCase):
+    """
+    The cache cart store keeps carts out of the cart tables until they are
+    flushed, and always flushes before an order is placed.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('cached', 'cached@example.com', 'secret')
+        category = Category.objects.create(name='Cached')
+        cls.product = Products.objects.create(name='Cached', category=category, description='',
+                                              unit_price=Decimal('4.00'), quantity_in_stock=5)
+
+    def setUp(self):
+        reset_cart_store()
+        self.addCleanup(reset_cart_store)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.cart_id = self.client.post('/store/carts/').data['id']
+
+    def add(self, quantity):
+        return self.client.post(f'/store/carts/{self.cart_id}/cartitems/',
+                                {'product_id': self.product.id, 'quantity': quantity}, format='json')
+
+    def test_writes_stay_in_the_cache_until_flushed(self):
+        self.add(2)
+        self.add(1)
+        response = self.client.get(f'/store/carts/{self.cart_id}/')
+        self.assertEqual(response.data['cartitems'][0]['quantity'], 3)
+        self.assertEqual(Decimal(response.data['total_price']), Decimal('12.00'))
+        self.assertFalse(ShoppingCart.objects.exists())
+
+        get_cart_store().flush_dirty()
+        self.assertEqual(ShoppingCartItem.objects.get(cart_id=self.cart_id).quantity, 3)
+
+    def test_order_flushes_the_cart(self):
+        self.add(2)
+        response = self.client.post('/store/orders/', {'cart_id': self.cart_id}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(ShoppingOrderItem.objects.get(order_id=response.data['id']).quantity, 2)
+        self.assertFalse(ShoppingCart.objects.exists())
+        self.assertEqual(self.client.get(f'/store/carts/{self.cart_id}/').status_code, 404)
+
+
+class ReapAbandonedCartsTests(TestCase):
+    def test_only_expired_carts_and_their_items_are_deleted(self):
+        category = Category.objects.create(name='Reaped')
+        product = Products.objects.create(name='Reaped', category=category, description='',
+                                          unit_price=Decimal('1.00'), quantity_in_stock=1)
+        carts = ShoppingCart.objects.bulk_create([ShoppingCart() for _ in range(5)])
+        ShoppingCartItem.objects.bulk_create([ShoppingCartItem(cart=cart, product=product, quantity=1)
+                                              for cart in carts])
+        expired = [cart.id for cart in carts[:3]]
+        ShoppingCart.objects.filter(id__in=expired).update(created_at=timezone.now() - timedelta(days=31))
+
+        out = StringIO()
+        call_command('reap_abandoned_carts', '--ttl-days', '30', '--chunk-size', '2', stdout=out)
+
+        self.assertIn('Deleted 3 carts and 3 cart items.', out.getvalue())
+        self.assertEqual(set(ShoppingCart.objects.values_list('id', flat=True)),
+                         {cart.id for cart in carts[3:]})
+        self.assertEqual(ShoppingCartItem.objects.count(), 2)
+
+
+class StockReservationTests(TestCase):
+    """
+    Orders take stock with a conditional UPDATE and hold it until the
+    payment settles or the reservation expires.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('buyer', 'buyer@example.com', 'secret')
+        cls.category = Category.objects.create(name='Deals')
+
+    def setUp(self):
+        self.first = Products.objects.create(name='First', category=self.category, description='',
+                                             unit_price=Decimal('5.00'), quantity_in_stock=3)
+        self.second = Products.objects.create(name='Second', category=self.category, description='',
+                                              unit_price=Decimal('5.00'), quantity_in_stock=1)
+        self.order = ShoppingOrder.objects.create(siteuser=self.user)
+
+    def stock(self):
+        return dict(Products.objects.filter(pk__in=[self.first.pk, self.second.pk])
+                    .values_list('pk', 'quantity_in_stock'))
+
+    def test_short_product_reserves_nothing(self):
+        with self.assertRaises(OutOfStock) as raised:
+            reserve_stock(self.order.id, {self.first.id: 2, self.second.id: 2})
+        self.assertEqual(raised.exception.product_ids, [self.second.id])
+        self.assertEqual(self.stock(), {self.first.pk: 3, self.second.pk: 1})
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_failed_payment_releases_and_completed_payment_keeps_stock(self):
+        reserve_stock(self.order.id, {self.first.id: 2, self.second.id: 1})
+        self.assertEqual(self.stock(), {self.first.pk: 1, self.second.pk: 0})
+
+        self.order.payment_status = ShoppingOrder.PAYMENT_STATUS_FAILED
+        self.order.save()
+        self.assertEqual(self.stock(), {self.first.pk: 3, self.second.pk: 1})
+
+        paid = ShoppingOrder.objects.create(siteuser=self.user)
+        reserve_stock(paid.id, {self.first.id: 1})
+        paid.payment_status = ShoppingOrder.PAYMENT_STATUS_COMPLETE
+        paid.save()
+        self.assertEqual(self.stock()[self.first.pk], 2)
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_expired_reservations_fail_the_order(self):
+        reserve_stock(self.order.id, {self.first.id: 2}, ttl=-1)
+        call_command('release_expired_reservations', stdout=StringIO())
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.payment_status, ShoppingOrder.PAYMENT_STATUS_FAILED)
+        self.assertEqual(self.stock()[self.first.pk], 3)
+
+    def test_every_stock_change_bumps_the_catalog_version(self):
+        version = get_catalog_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            reserve_stock(self.order.id, {self.first.id: 1})
+        self.assertGreater(get_catalog_version(), version)
+
+        version = get_catalog_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            release_reservations([self.order.id])
+        self.assertGreater(get_catalog_version(), version)
+
+    def test_stock_change_invalidates_the_product_etag(self):
+        url = f'/store/product/{self.first.id}/'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            reserve_stock(self.order.id, {self.first.id: 1})
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['quantity_in_stock'], 2)
+
+    def test_releasing_expired_reservations_invalidates_the_product_etag(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            reserve_stock(self.order.id, {self.first.id: 2}, ttl=-1)
+        url = f'/store/product/{self.first.id}/'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('release_expired_reservations', stdout=StringIO())
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['quantity_in_stock'], 3)
+
+    def test_order_for_more_than_the_stock_is_rejected(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        cart = ShoppingCart.objects.create()
+        ShoppingCartItem.objects.create(cart=cart, product=self.second, quantity=2)
+        response = client.post('/store/orders/', {'cart_id': str(cart.id)}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(ShoppingOrder.objects.count(), 1)
+        self.assertEqual(self.stock()[self.second.pk], 1)
+
+
+class LastUnitStressTests(TransactionTestCase):
+    """
+    Many threads racing for the last unit: exactly one wins and stock
+    never goes negative.
+    """
+    threads = 16
+
+    def test_last_unit_is_sold_once(self):
+        user = User.objects.create_user('racer', 'racer@example.com', 'secret')
+        product = Products.objects.create(name='Last', description='', unit_price=Decimal('1.00'),
+                                          quantity_in_stock=1,
+                                          category=Category.objects.create(name='Flash'))
+        orders = [ShoppingOrder.objects.create(siteuser=user) for _ in range(self.threads)]
+        barrier = threading.Barrier(self.threads)
+        outcomes = []
+
+        def buy(order):
+            try:
+                barrier.wait()
+                for attempt in range(50):
+                    try:
+                        reserve_stock(order.id, {product.id: 1})
+                        outcomes.append('sold')
+                        return
+                    except OutOfStock:
+                        outcomes.append('short')
+                        return
+                    except OperationalError:
+                        # SQLite reports lock contention instead of waiting.
+                        time.sleep(0.01)
+                outcomes.append('gave up')
+            finally:
+                connections.close_all()
+
+        workers = [threading.Thread(target=buy, args=(order,)) for order in orders]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.assertEqual(outcomes.count('sold'), 1)
+        self.assertEqual(outcomes.count('short'), self.threads - 1)
+        product.refresh_from_db()
+        self.assertEqual(product.quantity_in_stock, 0)
+        self.assertEqual(StockReservation.objects.count(), 1)
+
+
+class OrderPlacementTests(TestCase):
+    """
+    Placing an order costs the same number of queries for any cart size.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('orderer', 'orderer@example.com', 'secret')
+        category = Category.objects.create(name='Bulk')
+        cls.products = Products.objects.bulk_create([
+            Products(name=f'Bulk {index}', category=category, description='',
+                     unit_price=Decimal('2.50'), quantity_in_stock=10)
+            for index in range(100)
+        ])
+
+    def place(self, size):
+        cart = ShoppingCart.objects.create()
+        ShoppingCartItem.objects.bulk_create([ShoppingCartItem(cart=cart, product=product, quantity=2)
+                                              for product in self.products[:size]])
+        with CaptureQueriesContext(connection) as queries:
+            order = place_order(self.user.id, cart.id)
+        return order, len(queries)
+
+    def test_query_count_does_not_grow_with_cart_size(self):
+        small, small_queries = self.place(1)
+        large, large_queries = self.place(100)
+        self.assertEqual(small_queries, large_queries)
+        self.assertEqual(large.items.count(), 100)
+        self.assertEqual(set(large.items.values_list('unit_price', 'quantity')), {(Decimal('2.50'), 2)})
+        self.assertEqual(StockReservation.objects.filter(order=large).count(), 100)
+        self.assertFalse(ShoppingCart.objects.exists())
+        self.assertEqual(Products.objects.get(pk=self.products[0].pk).quantity_in_stock, 6)
+
+    def test_totals_are_stored_and_follow_item_edits(self):
+        order, _ = self.place(3)
+        self.assertEqual((order.total_amount, order.item_count), (Decimal('15.00'), 6))
+
+        item = order.items.first()
+        item.quantity = 5
+        item.save()
+        self.assertEqual(item.line_total, Decimal('12.50'))
+        order.refresh_from_db()
+        self.assertEqual((order.total_amount, order.item_count), (Decimal('22.50'), 9))
+
+
+class IdempotencyKeyTests(TestCase):
+    """
+    Retrying an order with the same Idempotency-Key replays the first
+    response instead of placing a second order.
+    """
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('retrier', 'retrier@example.com', 'secret')
+        category = Category.objects.create(name='Retry')
+        product = Products.objects.create(name='Retry', category=category, description='',
+                                          unit_price=Decimal('4.00'), quantity_in_stock=10)
+        self.cart = ShoppingCart.objects.create()
+        ShoppingCartItem.objects.create(cart=self.cart, product=product, quantity=1)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def order(self, key, cart_id=None):
+        return self.client.post('/store/orders/', {'cart_id': str(cart_id or self.cart.id)}, format='json',
+                                HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_the_order(self):
+        first = self.order('order-1')
+        self.assertEqual(first.status_code, 200, first.content)
+        cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            retry = self.order('order-1')
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(retry.json(), first.json())
+        self.assertFalse([query for query in queries if 'store_shoppingcart' in query['sql']])
+        self.assertEqual(ShoppingOrder.objects.count(), 1)
+
+        self.assertEqual(self.order('order-1', cart_id=uuid.uuid4()).status_code, 422)
+
+    def test_add_to_cart_links_carry_their_own_key(self):
+        Products.objects.create(name='Other', category=Category.objects.get(name='Retry'), description='',
+                                unit_price=Decimal('3.00'), quantity_in_stock=10)
+        Products.objects.update(image='media/retry.png')
+        self.client.force_login(self.user)
+        html = self.client.get('/products/').content.decode()
+        links = re.findall(r'href="(/checkout/\d+/\?idempotency_key=\w+)"', html)
+        self.assertEqual(len(links), 2)
+        self.assertEqual(len({link.split('=')[1] for link in links}), 2)
+
+        self.assertEqual(self.client.get(links[0]).status_code, 200)
+        self.assertEqual(self.client.get(links[0]).status_code, 200)
+        self.assertEqual(ShoppingOrderItem.objects.get().quantity, 1)
+
+    def test_purge_deletes_expired_keys(self):
+        self.order('order-1')
+        cart = ShoppingCart.objects.create()
+        ShoppingCartItem.objects.create(cart=cart, product=Products.objects.get(), quantity=1)
+        self.order('order-2', cart_id=cart.id)
+        IdempotencyKey.objects.filter(key='order-1').update(expires_at=timezone.now() - timedelta(seconds=1))
+        out = StringIO()
+        call_command('purge_idempotency_keys', stdout=out)
+        self.assertIn('Deleted 1', out.getvalue())
+        self.assertEqual(list(IdempotencyKey.objects.values_list('key', flat=True)), ['order-2'])
+
+
+@override_settings(STORE_PAYMENT_PROVIDER='stub', STORE_PAYMENT_MAX_ATTEMPTS=2)
+class PaymentJobTests(TestCase):
+    """
+    Purchases queue a payment job instead of calling the provider; the
+    worker runs it, retrying failed attempts with backoff.
+    """
+    def setUp(self):
+        self.user = User.objects.create_user('payer', 'payer@example.com', 'secret')
+        self.order = ShoppingOrder.objects.create(siteuser=self.user)
+        self.addCleanup(StubProvider.errors.clear)
+
+    def test_purchase_queues_and_worker_completes(self):
+        self.client.force_login(self.user)
+        response = self.client.get('/purchase/')
+        self.assertEqual(response.status_code, 200)
+        job = PaymentJob.objects.get(order=self.order)
+        self.assertEqual((job.status, job.attempts), (PaymentJob.STATUS_QUEUED, 0))
+
+        call_command('run_payment_worker', once=True, stdout=StringIO())
+        status = self.client.get(f'/purchase/{job.id}/status/').json()
+        self.assertEqual(status['status'], 'Succeeded')
+        self.assertEqual(status['payment_url'], f'/success/?order={self.order.id}')
+
+    def test_failed_attempts_back_off_then_fail(self):
+        job = enqueue_payment(self.order)
+        StubProvider.errors.extend([PaymentError('provider down'), PaymentError('still down')])
+        self.assertEqual(run_pending(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (PaymentJob.STATUS_QUEUED, 1))
+        self.assertGreater(job.run_after, timezone.now())
+        self.assertEqual(run_pending(), 0)
+
+        PaymentJob.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        run_pending()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.last_error), (PaymentJob.STATUS_FAILED, 'still down'))
+        self.assertNotEqual(enqueue_payment(self.order).pk, job.pk)
+
+    def test_crashed_worker_attempts_are_bounded(self):
+        job = enqueue_payment(self.order)
+        for _ in range(2):
+            self.assertEqual([claimed.pk for claimed in claim_jobs()], [job.pk])
+            # The worker dies: the job stays running until its lease expires.
+            PaymentJob.objects.filter(pk=job.pk).update(locked_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(claim_jobs(), [])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (PaymentJob.STATUS_FAILED, 2))
+
+    def test_one_live_job_per_order(self):
+        job = enqueue_payment(self.order)
+        self.assertEqual(enqueue_payment(self.order).pk, job.pk)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            PaymentJob.objects.create(order=self.order, provider='stub')
+        PaymentJob.objects.filter(pk=job.pk).update(status=PaymentJob.STATUS_FAILED)
+        self.assertNotEqual(enqueue_payment(self.order).pk, job.pk)
+
+    @override_settings(STRIPE_SECRET_KEY=None)
+    def test_missing_credentials_fail_at_once(self):
+        job = PaymentJob.objects.create(order=self.order, provider='stripe')
+        run_pending()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (PaymentJob.STATUS_FAILED, 1))
+        self.assertEqual(job.last_error, 'STRIPE_SECRET_KEY is not configured.')
+
+    def test_intasend_needs_a_phone_number_and_charges_shillings(self):
+        self.assertEqual((get_provider('intasend').currency(), get_provider('stripe').currency()), ('KES', 'USD'))
+        job = PaymentJob.objects.create(order=self.order, provider='intasend')
+        run_pending()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (PaymentJob.STATUS_FAILED, 1))
+        self.assertEqual(job.last_error, f'Order {self.order.id} has no customer phone number.')
+
+    @override_settings(STRIPE_SECRET_KEY='sk_test_key', STORE_CURRENCY='KES')
+    def test_stripe_charges_the_order_total(self):
+        ShoppingOrder.objects.filter(pk=self.order.pk).update(total_amount=Decimal('25.50'))
+        job = PaymentJob.objects.create(order=self.order, provider='stripe')
+        intent = SimpleNamespace(id='pi_1', client_secret='pi_1_secret')
+        with mock.patch('stripe.PaymentIntent.create', return_value=intent) as create:
+            run_pending()
+        self.assertEqual(create.call_args.kwargs['amount'], 2550)
+        self.assertEqual(create.call_args.kwargs['currency'], 'kes')
+        self.assertEqual(create.call_args.kwargs['receipt_email'], 'payer@example.com')
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.reference, job.client_secret),
+                         (PaymentJob.STATUS_SUCCEEDED, 'pi_1', 'pi_1_secret'))
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET='whsec_test')
+class PaymentWebhookTests(TestCase):
+    """
+    Webhook events are verified into the inbox and applied to orders in
+    batches, with replays dropped.
+    """
+    def setUp(self):
+        user = User.objects.create_user('hooked', 'hooked@example.com', 'secret')
+        category = Category.objects.create(name='Hooks')
+        self.product = Products.objects.create(name='Hook', category=category, description='',
+                                               unit_price=Decimal('1.00'), quantity_in_stock=20)
+        self.orders = ShoppingOrder.objects.bulk_create([ShoppingOrder(siteuser=user) for _ in range(20)])
+        for order in self.orders:
+            reserve_stock(order.id, {self.product.id: 1})
+
+    def send(self, event_id, event_type, order, secret='whsec_test'):
+        body = json.dumps({'id': event_id, 'type': event_type,
+                           'data': {'object': {'metadata': {'order_id': str(order.id)}}}}).encode()
+        timestamp = str(int(time.time()))
+        signature = hmac.new(secret.encode(), timestamp.encode() + b'.' + body, hashlib.sha256).hexdigest()
+        return self.client.post('/store/webhooks/stripe/', body, content_type='application/json',
+                                HTTP_STRIPE_SIGNATURE=f't={timestamp},v1={signature}')
+
+    def test_events_are_applied_in_bulk(self):
+        for index, order in enumerate(self.orders):
+            event_type = 'payment_intent.succeeded' if index % 2 else 'payment_intent.payment_failed'
+            self.assertEqual(self.send(f'evt_{index}', event_type, order).status_code, 200)
+        self.assertTrue(self.send('evt_1', 'payment_intent.succeeded', self.orders[1]).json()['duplicate'])
+        self.assertEqual(self.send('evt_x', 'payment_intent.succeeded', self.orders[0], secret='wrong').status_code,
+                         400)
+        self.assertEqual(PaymentEvent.objects.count(), 20)
+
+        # A batch costs the same queries for 2 orders as for 18.
+        with CaptureQueriesContext(connection) as small:
+            self.assertEqual(apply_events(batch_size=2), 2)
+        with CaptureQueriesContext(connection) as large:
+            self.assertEqual(apply_events(), 18)
+        self.assertEqual(len(large), len(small))
+        statuses = dict(ShoppingOrder.objects.values_list('id', 'payment_status'))
+        self.assertEqual(statuses[self.orders[1].id], ShoppingOrder.PAYMENT_STATUS_COMPLETE)
+        self.assertEqual(statuses[self.orders[0].id], ShoppingOrder.PAYMENT_STATUS_FAILED)
+        self.assertFalse(StockReservation.objects.exists())
+        self.assertEqual(Products.objects.get(pk=self.product.pk).quantity_in_stock, 10)
+
+        # A refund fails a completed order; a late success cannot reopen a failed one.
+        self.send('evt_refund', 'charge.refunded', self.orders[1])
+        self.send('evt_late', 'payment_intent.succeeded', self.orders[0])
+        call_command('consume_payment_events', once=True, stdout=StringIO())
+        outcomes = dict(PaymentEvent.objects.filter(event_id__in=['evt_refund', 'evt_late'])
+                        .values_list('event_id', 'outcome'))
+        self.assertEqual(outcomes, {'evt_refund': PaymentEvent.OUTCOME_APPLIED,
+                                    'evt_late': PaymentEvent.OUTCOME_IGNORED})
+        statuses = dict(ShoppingOrder.objects.filter(pk__in=[self.orders[0].pk, self.orders[1].pk])
+                        .values_list('id', 'payment_status'))
+        self.assertEqual(statuses, {self.orders[0].id: ShoppingOrder.PAYMENT_STATUS_FAILED,
+                                    self.orders[1].id: ShoppingOrder.PAYMENT_STATUS_FAILED})
+
+
+class SalesRollupTests(TestCase):
+    """
+    Completed orders are added to the daily rollups as they complete,
+    matching a rebuild from history.
+    """
+    def setUp(self):
+        self.staff = User.objects.create_user('analyst', 'analyst@example.com', 'secret', is_staff=True)
+        self.category = Category.objects.create(name='Rolled')
+        self.products = Products.objects.bulk_create([
+            Products(name=f'Rolled {index}', category=self.category, description='',
+                     unit_price=Decimal('3.00'), quantity_in_stock=10)
+            for index in range(2)
+        ])
+
+    def order(self, quantity):
+        order = ShoppingOrder.objects.create(siteuser=self.staff)
+        for product in self.products:
+            ShoppingOrderItem.objects.create(order=order, products=product, quantity=quantity,
+                                             unit_price=product.unit_price)
+        return ShoppingOrder.objects.get(pk=order.pk)
+
+    def rollups(self):
+        # Subtracting sales can leave empty rows a rebuild does not write.
+        return (sorted(ProductDailySales.objects.exclude(units=0).values_list('product_id', 'units', 'revenue')),
+                list(CategoryDailySales.objects.exclude(units=0).values_list('category_id', 'units', 'revenue')))
+
+    def test_rollups_follow_completion_and_rebuild(self):
+        first, second = self.order(1), self.order(2)
+        self.order(5)
+        for order in (first, second):
+            order.payment_status = ShoppingOrder.PAYMENT_STATUS_COMPLETE
+            order.save()
+        incremental = self.rollups()
+        self.assertEqual(incremental[1], [(self.category.id, 6, Decimal('18.00'))])
+
+        call_command('rebuild_sales_rollups', stdout=StringIO())
+        self.assertEqual(self.rollups(), incremental)
+
+        second.payment_status = ShoppingOrder.PAYMENT_STATUS_FAILED
+        second.save()
+        self.assertEqual(self.rollups()[1], [(self.category.id, 2, Decimal('6.00'))])
+
+        client = APIClient()
+        client.force_authenticate(self.staff)
+        with CaptureQueriesContext(connection) as queries:
+            report = client.get('/store/analytics/sales/', {'group_by': 'product'}).json()
+        self.assertEqual(len(queries), 1)
+        self.assertEqual([row['units'] for row in report['results']], [1, 1])
+        self.assertEqual(report['units'], 2)
+
+        # Sales stay with the category they were made in.
+        moved = Category.objects.create(name='Moved')
+        Products.objects.filter(pk__in=[product.pk for product in self.products]).update(category=moved)
+        report = client.get('/store/analytics/sales/', {'group_by': 'day', 'category': self.category.id}).json()
+        self.assertEqual(report['units'], 2)
+        response = client.get('/store/analytics/sales/', {'group_by': 'product', 'category': self.category.id})
+        self.assertEqual(response.status_code, 400)
+
+    def test_rebuild_after_a_move_and_item_edits_keep_rollups_in_step(self):
+        order = self.order(1)
+        order.payment_status = ShoppingOrder.PAYMENT_STATUS_COMPLETE
+        order.save()
+        moved = Category.objects.create(name='Moved')
+        Products.objects.filter(pk__in=[product.pk for product in self.products]).update(category=moved)
+        incremental = self.rollups()
+        call_command('rebuild_sales_rollups', stdout=StringIO())
+        self.assertEqual(self.rollups(), incremental)
+
+        item = order.items.first()
+        item.quantity = 4
+        item.save()
+        self.assertEqual(self.rollups()[1], [(self.category.id, 5, Decimal('15.00'))])
+        order.items.exclude(pk=item.pk).delete()
+        self.assertEqual(self.rollups()[1], [(self.category.id, 4, Decimal('12.00'))])
+        edited = self.rollups()
+        call_command('rebuild_sales_rollups', stdout=StringIO())
+        self.assertEqual(self.rollups(), edited)
+
+
+class OrderTransitionTests(TestCase):
+    """
+    Staff move many orders along the legal payment status transitions
+    with one UPDATE, and illegal moves are reported instead of applied.
+    """
+    def setUp(self):
+        self.staff = User.objects.create_user('ops', 'ops@example.com', 'secret', is_staff=True)
+        self.orders = ShoppingOrder.objects.bulk_create([ShoppingOrder(siteuser=self.staff) for _ in range(30)])
+        self.failed = ShoppingOrder.objects.create(siteuser=self.staff,
+                                                   payment_status=ShoppingOrder.PAYMENT_STATUS_FAILED)
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def test_bulk_transition_reports_rejected_ids(self):
+        ids = [order.id for order in self.orders] + [self.failed.id, 99999]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/store/orders/transition/', {'ids': ids, 'payment_status': 'C'},
+                                        format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('UPDATE "store_shoppingorder"')]),
+                         1)
+        self.assertEqual(sorted(response.data['updated']), [order.id for order in self.orders])
+        self.assertEqual(response.data['rejected'], [{'id': self.failed.id, 'payment_status': 'F'},
+                                                     {'id': 99999, 'payment_status': None}])
+        self.assertEqual(ShoppingOrder.objects.filter(payment_status='C').count(), 30)
+
+        response = self.client.patch(f'/store/orders/{self.failed.id}/', {'payment_status': 'P'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+
+class OrderHistoryTests(TestCase):
+    """
+    Order history pages cost two queries and only show the caller's
+    orders unless they are staff.
+    """
+    @classmethod
+    def setUpTestData(cls):
+        cls.customer = User.objects.create_user('history', 'history@example.com', 'secret')
+        cls.other = User.objects.create_user('other', 'other@example.com', 'secret')
+        category = Category.objects.create(name='History')
+        products = Products.objects.bulk_create([
+            Products(name=f'History {index}', category=category, description='',
+                     unit_price=Decimal('1.00'), quantity_in_stock=1)
+            for index in range(3)
+        ])
+        for index in range(12):
+            order = ShoppingOrder.objects.create(
+                siteuser=cls.customer if index % 3 else cls.other,
+                payment_status=ShoppingOrder.PAYMENT_STATUS_COMPLETE if index % 2
+                else ShoppingOrder.PAYMENT_STATUS_PENDING)
+            ShoppingOrderItem.objects.bulk_create([
+                ShoppingOrderItem(order=order, products=product, quantity=1, unit_price=Decimal('1.00'))
+                for product in products
+            ])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.customer)
+
+    def test_pages_cost_two_queries_and_follow_the_cursor(self):
+        with self.assertNumQueries(2):
+            first = self.client.get('/store/orders/?page_size=5')
+        second = self.client.get(first.data['next'])
+        ids = [order['id'] for order in first.data['results'] + second.data['results']]
+        expected = list(ShoppingOrder.objects.filter(siteuser=self.customer)
+                        .order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+        self.assertIsNone(second.data['next'])
+
+    def test_payment_status_filter(self):
+        response = self.client.get('/store/orders/?payment_status=C')
+        self.assertEqual({order['payment_status'] for order in response.data['results']}, {'C'})
+        self.assertEqual(self.client.get('/store/orders/?payment_status=Z').status_code, 400)
+
+    def test_export_is_staff_only_and_streams_csv(self):
+        self.assertEqual(self.client.get('/store/orders/export/').status_code, 403)
+        staff = User.objects.create_user('finance', 'finance@example.com', 'secret', is_staff=True)
+        self.client.force_authenticate(staff)
+        response = self.client.get('/store/orders/export/?payment_status=C')
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(',')[:3], ['order_id', 'created_at', 'payment_status'])
+        self.assertEqual(len(lines) - 1, ShoppingOrderItem.objects.filter(order__payment_status='C').count())
+
+
+class SharedCacheCheckTests(TestCase):
+    """
+    The catalog version must live in a cache every process can see.
+    """
+    def test_per_process_default_cache_is_refused(self):
+        self.assertEqual(check_shared_cache(None), [])
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            errors = check_shared_cache(None)
+        self.assertEqual([error.id for error in errors], ['store.E001'])
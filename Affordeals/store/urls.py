@@ -1,7 +1,8 @@
 from django.urls import path, include
 from rest_framework_nested import routers
+from .views import catalog_cache_metrics, payment_webhook
 from .views import SiteUserViewSet, ProductsViewSet, CategoryViewSet, ShoppingOrderViewSet,\
-                   ShoppingOrderItemViewSet, ShoppingCartItemViewSet, ShoppingCartViewSet, ReviewViewSet
+                   ShoppingOrderItemViewSet, ShoppingCartItemViewSet, ShoppingCartViewSet, ReviewViewSet, SalesReportViewSet
 
 
 router = routers.DefaultRouter()
@@ -11,6 +12,7 @@ router.register('orders', ShoppingOrderViewSet, basename='orders')
 
 router.register('carts', ShoppingCartViewSet, basename='carts')
 router.register('siteuser', SiteUserViewSet)
+router.register('analytics/sales', SalesReportViewSet, basename='sales')
 
 
 product_router = routers.NestedDefaultRouter(router, 'product', lookup='products')
@@ -21,6 +23,8 @@ cartRouter.register('cartitems', ShoppingCartItemViewSet, basename='cart-cartite
 
 
 urlpatterns = [
+  path('metrics/catalog-cache/', catalog_cache_metrics, name='catalog-cache-metrics'),
+  path('webhooks/<str:provider>/', payment_webhook, name='payment-webhook'),
   path('', include(router.urls)),
   path('', include(product_router.urls)),
   path('', include(cartRouter.urls)),
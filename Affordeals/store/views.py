@@ -1,27 +1,45 @@
-from django.shortcuts import get_object_or_404, render
+from django.shortcuts import get_object_or_404, redirect, render
+from django.contrib import messages
+from django.db import transaction
+from django.db.models import Prefetch, Sum
 from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser, DjangoModelPermissions
 from rest_framework.response import Response
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.mixins import CreateModelMixin, RetrieveModelMixin, DestroyModelMixin
 from .serializers import SiteUserSerializer
 from rest_framework.viewsets import ModelViewSet, GenericViewSet
-from .models import SiteUser, Products, Category, ShoppingOrder, ShoppingOrderItem, Review, ShoppingCart, ShoppingCartItem, ShoppingCart
+from .models import SiteUser, Products, Category, ShoppingOrder, ShoppingOrderItem, Review, ShoppingCart, ShoppingCartItem, ShoppingCart, PaymentJob, \
+                    ProductDailySales, CategoryDailySales
 from .serializers import SiteUserSerializer, ProductsSerializer, CategorySerializer,\
                          ShoppingOrderSerializer, ShoppingOrderItemSerializer, ReviewSerializer,\
                          ShoppingCartSerializer, ShoppingCartItemSerializer, AddShoppingCartItemSerializer,\
-                         UpdateShoppingCartItemSerializer, NewOrderSerializer, UpdateShoppingOrderSerializer
+                         UpdateShoppingCartItemSerializer, NewOrderSerializer, UpdateShoppingOrderSerializer,\
+                         BatchCartSerializer, PaymentJobSerializer, SalesReportQuerySerializer, OrderTransitionSerializer
 from store.permissions import IsAdminOrReadOnly, FullPermissions
+from store.pagination import OrderKeysetPagination, ProductKeysetPagination
+from store.search import search_products
+from store.filters import OrderFilter, ProductFilter, cached_facets
+from rest_framework.utils.urls import replace_query_param
 from django.contrib.auth.decorators import login_required
-from intasend import APIService
-import stripe
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponse, HttpResponseForbidden, StreamingHttpResponse
+from django.utils import timezone
+from django.conf import settings
+from store.cache import page_cache_stats
+from store.carts import get_cart_store
+from store.stock import OutOfStock, reserve_stock
+from store.orders import transition_orders
+from store import order_io
+from store.idempotency import idempotent_action, idempotent_view
+from store.payments import enqueue_payment
+from store.webhooks import WebhookError, receive_event
+from store.conditional import ConditionalGetMixin, CatalogConditionalGetMixin
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
 import os
+import uuid
+from decimal import Decimal
 
-TEST_API_TOKEN = "ISSecretKey_live_7f5881a5-038b-477a-9ffb-a5b4871e0264"
-TEST_PUBLISHABLE_KEY = "ISPubKey_live_67faf929-91bc-40a3-9924-fa68bf47dd0c"
-
-STRIPE_SECRET_KEY = 'sk_test_51Pa1aDRw3YBmtwIna3J9hMuLqxyQaTOIbNSyjlRc7eVvO67PQif21IKpqFyN79im9XKmTS0Zlb7h8s26sg87nbgh00nBClsRtJ'
 STRIPE_PUBLISHABLE_KEY = 'pk_test_51Pa1aDRw3YBmtwInaQ7ANc6qwpBREhTDp56IZuhpv3Urq0qWLcPcCtdbadPhPk3xP1mTutizJFA1pP6v1lth8vC700jO9pXTB3'
 
 
@@ -64,7 +82,7 @@ class SiteUserViewSet(ModelViewSet):
       serializer.save()
       return Response(serializer.data)
 
-class ProductsViewSet(ModelViewSet):
+class ProductsViewSet(CatalogConditionalGetMixin, ModelViewSet):
   """
     A viewset for viewing and editing Product instances.
 
@@ -74,43 +92,186 @@ class ProductsViewSet(ModelViewSet):
       for Product instances.
     - permission_classes (list): The permission classes to apply
       to this viewset.
+    - pagination_class (Pagination): Keyset pagination over the
+      selected ordering, see store.pagination.
+
+    List and facets requests accept the store.filters.ProductFilter
+    query parameters (category, min_price, max_price, in_stock, ordering).
+    List and retrieve answer conditional GETs from the catalog version.
   """
-  queryset = Products.objects.all()
+  queryset = Products.objects.order_by('category_id', 'id')
   serializer_class = ProductsSerializer
   permission_classes = [IsAdminOrReadOnly]
+  pagination_class = ProductKeysetPagination
+  search_page_size = 20
+  search_max_page_size = 100
+
+  def get_product_filter(self):
+    if not hasattr(self, '_product_filter'):
+      self._product_filter = ProductFilter(self.request.query_params)
+    return self._product_filter
+
+  def get_queryset(self):
+    queryset = super().get_queryset()
+    if self.action == 'list':
+      queryset = self.get_product_filter().filter_queryset(queryset)
+    return queryset
+
+  def get_keyset_ordering(self):
+    return self.get_product_filter().ordering_fields()
+
+  @action(detail=False, methods=['GET'])
+  def facets(self, request):
+    """
+      Product counts per category and per price bucket for the
+      current filters, computed in one grouped query and cached. Each
+      facet ignores its own filter, see store.filters.compute_facets.
+    """
+    return Response(cached_facets(self.get_queryset(), self.get_product_filter()))
+
+  @action(detail=False, methods=['GET'])
+  def search(self, request):
+    """
+      Full-text search over product name, description and category name.
+
+      Query parameters:
+      - q: The search text.
+      - page: 1-based page number of the ranked results.
+      - page_size: Number of results per page.
+    """
+    text = request.query_params.get('q', '')
+    try:
+      page = max(int(request.query_params.get('page', 1)), 1)
+      page_size = min(max(int(request.query_params.get('page_size', self.search_page_size)), 1),
+                      self.search_max_page_size)
+    except ValueError:
+      return Response({'detail': 'page and page_size must be integers.'}, status=400)
+
+    total, products = search_products(text, page_size, (page - 1) * page_size)
+    url = request.build_absolute_uri()
+    return Response({
+      'count': total,
+      'next': replace_query_param(url, 'page', page + 1) if page * page_size < total else None,
+      'previous': replace_query_param(url, 'page', page - 1) if page > 1 else None,
+      'results': ProductsSerializer(products, many=True, context=self.get_serializer_context()).data,
+    })
+
+
+def cart_id_or_404(value):
+    """
+    Returns:
+    - str: The canonical form of a cart id from the URL, so the cart
+      stores never see a malformed UUID.
+
+    Raises:
+    - NotFound: If the value is not a UUID.
+    """
+    try:
+        return str(uuid.UUID(str(value)))
+    except ValueError:
+        raise NotFound('Cart not found.')
 
 
 class ShoppingCartViewSet(CreateModelMixin,
                   RetrieveModelMixin,
                   DestroyModelMixin,
                   GenericViewSet):
-    queryset = ShoppingCart.objects.prefetch_related('items__product').all()
+    """
+    A viewset for creating, retrieving and deleting shopping carts,
+    backed by the configured cart store (STORE_CART_BACKEND).
+
+    With the database store, retrieving a cart costs two queries whatever
+    its size: the cart with its total aggregated in SQL, and its items
+    with their products and line totals, see
+    ShoppingCart.objects.with_totals(). The cache store only reads the
+    products.
+    """
+    queryset = ShoppingCart.objects.with_totals()
     serializer_class = ShoppingCartSerializer
 
+    def create(self, request, *args, **kwargs):
+        cart = get_cart_store().create()
+        return Response(self.get_serializer(cart).data, status=201)
+
+    def retrieve(self, request, *args, **kwargs):
+        cart = get_cart_store().get(cart_id_or_404(kwargs['pk']))
+        if cart is None:
+            raise NotFound('Cart not found.')
+        return Response(self.get_serializer(cart).data)
+
+    def destroy(self, request, *args, **kwargs):
+        store, cart_id = get_cart_store(), cart_id_or_404(kwargs['pk'])
+        if not store.exists(cart_id):
+            raise NotFound('Cart not found.')
+        store.delete(cart_id)
+        return Response(status=204)
+
 
 class ShoppingCartItemViewSet(ModelViewSet):
+    """
+    A viewset for the items of one cart, nested under
+    store/carts/{id}/cartitems/.
+
+    Adding items and batches go through the cart store. Routes that
+    address items by id flush a cached cart first and evict it after a
+    write, so they always work on the database rows.
+
+    Actions:
+    - batch (function): Applies a list of add, set and remove operations
+      in one request and returns the updated cart.
+    """
     http_method_names = ['get', 'post', 'patch', 'delete']
 
+    def initial(self, request, *args, **kwargs):
+        # Every route of this viewset reads the cart id from the URL.
+        self.kwargs['cart_pk'] = cart_id_or_404(self.kwargs['cart_pk'])
+        super().initial(request, *args, **kwargs)
+
     def get_serializer_class(self):
+        if self.action == 'batch':
+            return BatchCartSerializer
         if self.request.method == 'POST':
             return AddShoppingCartItemSerializer
         elif self.request.method == 'PATCH':
-            return NewCartItemSerializer
+            return UpdateShoppingCartItemSerializer
         return ShoppingCartItemSerializer
 
+    @action(detail=False, methods=['POST'])
+    def batch(self, request, cart_pk=None):
+        """
+        Apply {"operations": [{"op": "add"|"set"|"remove", "product_id": ...,
+        "quantity": ...}, ...]} to the cart in a single transaction.
+        """
+        if not get_cart_store().exists(self.kwargs['cart_pk']):
+            raise NotFound('Cart not found.')
+        serializer = BatchCartSerializer(data=request.data, context=self.get_serializer_context())
+        serializer.is_valid(raise_exception=True)
+        cart = serializer.save()
+        return Response(ShoppingCartSerializer(cart).data)
+
     def get_serializer_context(self):
         return {'cart_id': self.kwargs['cart_pk']}
 
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        get_cart_store().evict(self.kwargs['cart_pk'])
+
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        get_cart_store().evict(self.kwargs['cart_pk'])
+
     def get_queryset(self):
+        get_cart_store().flush(self.kwargs['cart_pk'])
         return ShoppingCartItem.objects \
             .filter(cart_id=self.kwargs['cart_pk']) \
-            .select_related('product')
+            .with_line_totals()
 
 
 
-class CategoryViewSet(ModelViewSet):
+class CategoryViewSet(CatalogConditionalGetMixin, ModelViewSet):
   """
     A viewset for viewing and editing Category instances.
+    List and retrieve answer conditional GETs from the catalog version.
 
     Attributes:
     - queryset (QuerySet): The queryset for retrieving Category instances.
@@ -123,23 +284,93 @@ class CategoryViewSet(ModelViewSet):
   serializer_class = CategorySerializer
   permission_classes = [IsAdminOrReadOnly]
 
-class ReviewViewSet(ModelViewSet):
+class ReviewViewSet(ConditionalGetMixin, ModelViewSet):
+    """
+    A viewset for the reviews of one product, nested under
+    store/product/{id}/reviews/. List and retrieve answer conditional
+    GETs from max(updated_at) and the review count.
+    """
     serializer_class = ReviewSerializer
 
     def get_queryset(self):
-        return Review.objects.filter(product_id=self.kwargs['product_pk'])
+        return Review.objects.filter(product_id=self.kwargs['products_pk'])
 
     def get_serializer_context(self):
-        return {'product_id': self.kwargs['product_pk']}
+        return {'product_id': self.kwargs['products_pk']}
 
 
 class ShoppingOrderViewSet(ModelViewSet):
+  """
+    A viewset for placing orders and browsing order history.
+
+    Staff see every order, customers only their own. Lists are keyset
+    paginated newest first and accept the store.filters.OrderFilter query
+    parameters (payment_status, created_after, created_before). Items and
+    their products are fetched with one extra query per page, trimmed to
+    the serialized fields.
+  """
   http_method_names = ['get', 'post', 'patch', 'delete', 'head', 'options']
+  pagination_class = OrderKeysetPagination
+
   def get_permissions(self):
-    if self.request.method in ['PATCH', 'DELETE']:
+    if self.request.method in ['PATCH', 'DELETE'] or self.action in ('export', 'transition'):
       return [IsAdminUser()]
     return [IsAuthenticated()]
 
+  @action(detail=False, methods=['GET'])
+  def export(self, request):
+    """
+      Staff only: stream every order line matching the OrderFilter query
+      parameters as CSV, or NDJSON with ?export_format=ndjson. Rows are
+      read in chunks and written as they arrive, so memory stays flat
+      whatever the size of the export.
+    """
+    fmt = request.query_params.get('export_format', 'csv')
+    if fmt not in order_io.FORMATS:
+      raise ValidationError({'export_format': f'Choose one of {", ".join(order_io.FORMATS)}.'})
+    rows = order_io.export_rows(OrderFilter(request.query_params))
+    response = StreamingHttpResponse(order_io.buffered(order_io.encode_rows(rows, fmt)),
+                                     content_type=order_io.CONTENT_TYPES[fmt])
+    filename = f'orders-{timezone.now():%Y%m%d-%H%M%S}.{fmt}'
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+  @action(detail=False, methods=['POST'])
+  def transition(self, request):
+    """
+      Staff only: move many orders to one payment status with one
+      conditional UPDATE. Orders whose current status cannot move there,
+      see ShoppingOrder.PAYMENT_STATUS_TRANSITIONS, are left alone and
+      reported in rejected with their current status (null if unknown).
+    """
+    serializer = OrderTransitionSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    payment_status = serializer.validated_data['payment_status']
+    moved, rejected = transition_orders(serializer.validated_data['ids'], payment_status)
+    return Response({
+      'payment_status': payment_status,
+      'updated': moved,
+      'rejected': [{'id': pk, 'payment_status': status} for pk, status in rejected.items()],
+    })
+
+  @action(detail=True, methods=['GET', 'POST'])
+  def payment(self, request, pk=None):
+    """
+      POST queues the payment of the order and answers 202 without
+      waiting for the provider; GET polls the latest payment job until
+      it succeeded (payment_url or client_secret set) or failed.
+    """
+    order = self.get_object()
+    if request.method == 'POST':
+      if order.payment_status != ShoppingOrder.PAYMENT_STATUS_PENDING:
+        raise ValidationError({'payment_status': 'Only pending orders can be paid.'})
+      return Response(PaymentJobSerializer(enqueue_payment(order)).data, status=202)
+    job = order.payment_jobs.order_by('-id').first()
+    if job is None:
+      raise NotFound('No payment was started for this order.')
+    return Response(PaymentJobSerializer(job).data)
+
+  @idempotent_action('orders.create')
   def create(self, request, *args, **kwargs):
     serializer = NewOrderSerializer(
       data=request.data,
@@ -147,7 +378,7 @@ class ShoppingOrderViewSet(ModelViewSet):
       )
     serializer.is_valid(raise_exception=True)
     new_order = serializer.save()
-    serializer = ShoppingOrderSerializer(new_order)
+    serializer = ShoppingOrderSerializer(self.get_queryset().get(pk=new_order.pk))
     return Response(serializer.data)
  
 
@@ -160,10 +391,46 @@ class ShoppingOrderViewSet(ModelViewSet):
 
   def get_queryset(self):
     user = self.request.user
-    if user.is_staff:
-      return ShoppingOrder.objects.all()
-    id = SiteUser.objects.only('id').get(user_id=user.id)
-    return ShoppingOrder.objects.filter(siteuser_id=id)
+    items = ShoppingOrderItem.objects.select_related('products').only(
+      'id', 'order_id', 'quantity', 'unit_price', 'line_total',
+      'products__id', 'products__name', 'products__unit_price')
+    queryset = ShoppingOrder.objects.prefetch_related(Prefetch('items', queryset=items))
+    if not user.is_staff:
+      queryset = queryset.filter(siteuser_id=user.id)
+    if self.action == 'list':
+      queryset = OrderFilter(self.request.query_params).filter_queryset(queryset)
+    return queryset
+
+class SalesReportViewSet(GenericViewSet):
+  """
+    Staff only sales dashboard read from the daily rollups, see
+    store.analytics, so a month of sales costs one indexed aggregate
+    instead of a scan of every order item.
+
+    Query parameters: start, end, group_by (day, product or category)
+    and category, see SalesReportQuerySerializer.
+  """
+  permission_classes = [IsAdminUser]
+
+  def list(self, request):
+    query = SalesReportQuerySerializer(data=request.query_params)
+    query.is_valid(raise_exception=True)
+    params = query.validated_data
+    rollup = ProductDailySales if params['group_by'] == 'product' else CategoryDailySales
+    rows = rollup.objects.filter(day__range=(params['start'], params['end']))
+    if 'category' in params:
+      rows = rows.filter(category_id=params['category'])
+    group = {'day': ['day'], 'product': ['product_id', 'product__name'],
+             'category': ['category_id', 'category__name']}[params['group_by']]
+    results = list(rows.values(*group).order_by(*group).annotate(units=Sum('units'), revenue=Sum('revenue')))
+    return Response({
+      'start': params['start'],
+      'end': params['end'],
+      'group_by': params['group_by'],
+      'results': results,
+      'units': sum(row['units'] for row in results),
+      'revenue': sum((row['revenue'] for row in results), Decimal('0')),
+    })
 
 class ShoppingOrderItemViewSet(ModelViewSet):
   """
@@ -182,50 +449,85 @@ class ShoppingOrderItemViewSet(ModelViewSet):
   permission_classes = [IsAuthenticated]
 
 @login_required
+@idempotent_view('checkout')
 def checkout(request, product_id):
     product = get_object_or_404(Products, id=product_id)
     user = request.user
 
-    # Create or get the shopping order for the user with 'Pending' payment status
-    shopping_order, _ = ShoppingOrder.objects.get_or_create(siteuser=user, payment_status='P')
-    shopping_order.save()
-    # Create or update the shopping order item
-    (order_item, created) = ShoppingOrderItem.objects.get_or_create(
-        order=shopping_order,  # Link to the shopping order
-        products=product,  # Link to the product
-        defaults={'quantity': 1, 'unit_price': product.unit_price}  # Default values for new item
-    )
-    if not created:
-        order_item.quantity += 1  # Increase quantity if the item already exists
-        order_item.save()
-
-    context = {'orders': shopping_order, 'products': product}
+    try:
+        with transaction.atomic():
+            # Create or get the shopping order for the user with 'Pending' payment status
+            shopping_order, _ = ShoppingOrder.objects.get_or_create(siteuser=user, payment_status='P')
+            # Hold one more unit for the order; fails instead of overselling
+            reserve_stock(shopping_order.id, {product.id: 1})
+            # Create or update the shopping order item
+            (order_item, created) = ShoppingOrderItem.objects.get_or_create(
+                order=shopping_order,  # Link to the shopping order
+                products=product,  # Link to the product
+                defaults={'quantity': 1, 'unit_price': product.unit_price}  # Default values for new item
+            )
+            if not created:
+                order_item.quantity += 1  # Increase quantity if the item already exists
+                order_item.save()
+    except OutOfStock:
+        messages.error(request, f'Sorry, {product.name} is out of stock.')
+        return redirect('product')
+
+    # Retrying the Purchase link with the same key replays the payment page
+    # instead of starting a second payment.
+    context = {'orders': shopping_order, 'products': product, 'idempotency_key': uuid.uuid4().hex}
     return render(request, 'store/shoppingcart.html', {'context': context})
   
 @login_required
+@idempotent_view('purchase')
 def purchase(request):
     user = request.user
-    shopping_order = ShoppingOrder.objects.get(siteuser=user, payment_status='P')
-    order_items = ShoppingOrderItem.objects.filter(order=shopping_order)
-    service = APIService(token=TEST_API_TOKEN, publishable_key=TEST_PUBLISHABLE_KEY, test=True)
-    response = service.collect.checkout(phone_number=254727563415,
-                                        email=user.email, amount=10, currency="KES",
-                                        comment="Service Fees", redirect_url="http://example.com/thank-you")
-    print(response)
-    return render(request, 'store/purchase.html', {'payment_url': response.get('url', '')})
-
-    # Initialize Stripe with your API keys
-    stripe.api_key = STRIPE_SECRET_KEY
-    # Create a payment intent
-    payment_intent = stripe.PaymentIntent.create(
-        amount=1000,  # Amount in cents (e.g., $10.00)
-        currency='usd',
-        description='Service Fees',
-        metadata={'order_id': shopping_order.id},
-    )
-    print("Paymnet completed")
-
-    return render(request, 'store/purchase.html', {'client_secret': payment_intent.client_secret})
+    shopping_order = get_object_or_404(ShoppingOrder, siteuser=user, payment_status='P')
+    # The provider is called by the run_payment_worker command; the page
+    # polls payment_status until the payment is ready.
+    job = enqueue_payment(shopping_order)
+    return render(request, 'store/purchase.html',
+                  {'job': job, 'stripe_publishable_key': STRIPE_PUBLISHABLE_KEY})
+
+@login_required
+def payment_status(request, job_id):
+  """
+  Report the state of a payment job to the purchase page.
+  """
+  job = get_object_or_404(PaymentJob, pk=job_id, order__siteuser=request.user)
+  return JsonResponse(PaymentJobSerializer(job).data)
+
+@csrf_exempt
+@require_POST
+def payment_webhook(request, provider):
+  """
+  Receive a payment provider event: verify it and append it to the
+  PaymentEvent inbox, leaving the order updates to the
+  consume_payment_events command so bursts are answered at once.
+  """
+  try:
+    received = receive_event(provider, request)
+  except WebhookError as error:
+    return JsonResponse({'detail': str(error)}, status=400)
+  return JsonResponse({'received': True, 'duplicate': not received})
+
+def catalog_cache_metrics(request):
+  """
+  Expose the catalog page cache counters in the Prometheus text format.
+  Available to staff users and to INTERNAL_IPS scrapers.
+  """
+  if not (request.user.is_staff or request.META.get('REMOTE_ADDR') in settings.INTERNAL_IPS):
+    return HttpResponseForbidden()
+  stats = page_cache_stats()
+  lines = [
+    '# TYPE affordeals_catalog_page_cache_hits_total counter',
+    f"affordeals_catalog_page_cache_hits_total {stats['hits']}",
+    '# TYPE affordeals_catalog_page_cache_misses_total counter',
+    f"affordeals_catalog_page_cache_misses_total {stats['misses']}",
+    '# TYPE affordeals_catalog_version gauge',
+    f"affordeals_catalog_version {stats['version']}",
+  ]
+  return HttpResponse('\n'.join(lines) + '\n', content_type='text/plain; version=0.0.4')
 
 def success(request): #Added
   return render(request, 'store/success.html')
@@ -0,0 +1,172 @@
+import hashlib
+import hmac
+import json
+import time
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import PaymentEvent, ShoppingOrder
+from .orders import transition_orders
+
+
+# Seconds a signed Stripe event stays valid, against replayed requests.
+DEFAULT_TOLERANCE = 300
+
+STRIPE_STATUSES = {
+    'payment_intent.succeeded': ShoppingOrder.PAYMENT_STATUS_COMPLETE,
+    'payment_intent.payment_failed': ShoppingOrder.PAYMENT_STATUS_FAILED,
+    'payment_intent.canceled': ShoppingOrder.PAYMENT_STATUS_FAILED,
+    # Refunds and chargebacks take a completed order back to failed.
+    'charge.refunded': ShoppingOrder.PAYMENT_STATUS_FAILED,
+    'charge.dispute.created': ShoppingOrder.PAYMENT_STATUS_FAILED,
+}
+
+INTASEND_STATUSES = {
+    'COMPLETE': ShoppingOrder.PAYMENT_STATUS_COMPLETE,
+    'FAILED': ShoppingOrder.PAYMENT_STATUS_FAILED,
+}
+
+
+class WebhookError(Exception):
+    """
+    Raised for a webhook request that fails verification or parsing.
+    """
+
+
+def verify_stripe(body, header, secret, tolerance=None, now=None):
+    """
+    Check a Stripe-Signature header: t=<timestamp>,v1=<signature>, the
+    signature being the HMAC-SHA256 of "<timestamp>.<body>".
+
+    Raises:
+    - WebhookError: If no signature matches or the timestamp is too old.
+    """
+    if not secret:
+        raise WebhookError('STRIPE_WEBHOOK_SECRET is not configured.')
+    items = [item.split('=', 1) for item in (header or '').split(',') if '=' in item]
+    timestamps = [value for name, value in items if name == 't']
+    signatures = [value for name, value in items if name == 'v1']
+    if not timestamps or not timestamps[0].isdigit() or not signatures:
+        raise WebhookError('Malformed Stripe-Signature header.')
+    expected = hmac.new(secret.encode(), timestamps[0].encode() + b'.' + body, hashlib.sha256).hexdigest()
+    if not any(hmac.compare_digest(expected, signature) for signature in signatures):
+        raise WebhookError('Stripe signature mismatch.')
+    tolerance = getattr(settings, 'STORE_WEBHOOK_TOLERANCE', DEFAULT_TOLERANCE) if tolerance is None else tolerance
+    if abs((now or time.time()) - int(timestamps[0])) > tolerance:
+        raise WebhookError('Stripe signature timestamp outside the tolerance.')
+
+
+def parse_stripe(request):
+    """
+    Returns:
+    - PaymentEvent: The unsaved event for a verified Stripe request.
+    """
+    verify_stripe(request.body, request.headers.get('Stripe-Signature'),
+                  getattr(settings, 'STRIPE_WEBHOOK_SECRET', None))
+    payload = load(request.body)
+    metadata = payload.get('data', {}).get('object', {}).get('metadata') or {}
+    return PaymentEvent(provider='stripe', event_id=str(payload.get('id', '')),
+                        order_ref=order_ref(metadata.get('order_id')),
+                        payment_status=STRIPE_STATUSES.get(payload.get('type'), ''), payload=payload)
+
+
+def parse_intasend(request):
+    """
+    IntaSend posts the invoice state with the challenge string set in its
+    dashboard, which must match INTASEND_WEBHOOK_CHALLENGE. An invoice
+    reports each state once, so invoice and state identify the event.
+
+    Returns:
+    - PaymentEvent: The unsaved event for a verified IntaSend request.
+    """
+    payload = load(request.body)
+    challenge = getattr(settings, 'INTASEND_WEBHOOK_CHALLENGE', None)
+    if not challenge:
+        raise WebhookError('INTASEND_WEBHOOK_CHALLENGE is not configured.')
+    if not hmac.compare_digest(str(payload.get('challenge', '')), challenge):
+        raise WebhookError('IntaSend challenge mismatch.')
+    state = str(payload.get('state', ''))
+    return PaymentEvent(provider='intasend', event_id=f"{payload.get('invoice_id', '')}:{state}",
+                        order_ref=order_ref(payload.get('api_ref')),
+                        payment_status=INTASEND_STATUSES.get(state, ''), payload=payload)
+
+
+PARSERS = {
+    'stripe': parse_stripe,
+    'intasend': parse_intasend,
+}
+
+
+def load(body):
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        raise WebhookError('The body is not JSON.')
+    if not isinstance(payload, dict):
+        raise WebhookError('The body is not a JSON object.')
+    return payload
+
+
+def order_ref(value):
+    return int(value) if str(value or '').isdigit() else None
+
+
+def receive_event(provider, request):
+    """
+    Verify a webhook request and append its event to the inbox. A replayed
+    event is dropped by the unique (provider, event_id) constraint.
+
+    Raises:
+    - WebhookError: If the provider is unknown or verification fails.
+
+    Returns:
+    - bool: False when the event was already received.
+    """
+    if provider not in PARSERS:
+        raise WebhookError(f'Unknown provider {provider}.')
+    event = PARSERS[provider](request)
+    if not event.event_id.strip(':'):
+        raise WebhookError('The event has no id.')
+    try:
+        with transaction.atomic():
+            event.save()
+    except IntegrityError:
+        return False
+    return True
+
+
+def apply_events(batch_size=1000):
+    """
+    Apply one batch of inbox events in one transaction: the last event of
+    each order wins, and orders are moved with store.orders.transition_orders
+    per target status, so only the moves allowed by
+    ShoppingOrder.PAYMENT_STATUS_TRANSITIONS happen: a refund can fail a
+    completed order, but a late or replayed event cannot reopen a failed
+    one. Stock reservations and sales rollups follow the moves.
+
+    Returns:
+    - int: The number of events processed.
+    """
+    with transaction.atomic():
+        events = list(PaymentEvent.objects.select_for_update()
+                      .filter(processed_at__isnull=True).order_by('id')
+                      .values_list('id', 'order_ref', 'payment_status')[:batch_size])
+        if not events:
+            return 0
+        latest = {order: status for _, order, status in events if order and status}
+        targets = {}
+        for order, status in latest.items():
+            targets.setdefault(status, []).append(order)
+        applied = set()
+        for status, order_ids in targets.items():
+            moved, _ = transition_orders(order_ids, status)
+            applied.update((order, status) for order in moved)
+        now = timezone.now()
+        applied_ids = [pk for pk, order, status in events if (order, status) in applied]
+        PaymentEvent.objects.filter(pk__in=applied_ids).update(
+            processed_at=now, outcome=PaymentEvent.OUTCOME_APPLIED)
+        PaymentEvent.objects.filter(pk__in=[event[0] for event in events], processed_at__isnull=True).update(
+            processed_at=now, outcome=PaymentEvent.OUTCOME_IGNORED)
+    return len(events)